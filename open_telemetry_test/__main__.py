@@ -0,0 +1,108 @@
+"""
+Run a job, service or benchmark of the repo:
+
+    uv run python -m open_telemetry_test <command> [arguments of the command]
+
+Only the module of the selected command is imported, so that listing the commands
+does not pay for pandas, nixtla or plotly, and short cron-style jobs only import
+what they use. The `.env` file is loaded first, so the settings each module reads
+from the environment when it is imported include it.
+"""
+
+import argparse
+import importlib
+import sys
+from collections.abc import Sequence
+
+# command: ("<module>:<function>", description)
+COMMANDS = {
+    "supabase": (
+        "open_telemetry_test.supabase.performance:main",
+        "detect anomalies of the Supabase projects",
+    ),
+    "dashboard": (
+        "open_telemetry_test.supabase.dashboard:main",
+        "serve the Supabase metrics dashboard",
+    ),
+    "replay": (
+        "open_telemetry_test.supabase.replay:main",
+        "replay recorded Supabase scrapes",
+    ),
+    "sentry": (
+        "open_telemetry_test.sentry:main",
+        "detect anomalies of the Sentry events",
+    ),
+    "oad": (
+        "open_telemetry_test.online_anomaly_detection:main",
+        "online anomaly detection of the SMD dataset",
+    ),
+    "vibration": (
+        "open_telemetry_test.otel_common.otel_predictive:main",
+        "sample the machines and export through OTLP",
+    ),
+    "vibration-prometheus": (
+        "open_telemetry_test.prometheus.prometheus_predictive:main",
+        "expose the vibration gauge with prometheus_client",
+    ),
+    "vibration-prometheus-otel": (
+        "open_telemetry_test.prometheus.prometheus_predictive_otel:main",
+        "expose the vibration gauge with the OTEL Prometheus reader",
+    ),
+    "prometheus-read": (
+        "open_telemetry_test.prometheus.prometheus_read_metrics:main",
+        "query the vibration metrics from Prometheus",
+    ),
+    "bench-exporters": (
+        "open_telemetry_test.benchmarks.exporters:main",
+        "benchmark the ways to publish the vibration gauge",
+    ),
+    "bench-dice": (
+        "open_telemetry_test.benchmarks.dice_load:main",
+        "load test the dice roll services",
+    ),
+    "bench-spans": (
+        "open_telemetry_test.benchmarks.span_batching:main",
+        "compare the span modes",
+    ),
+}
+
+
+def main(argv: Sequence[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(
+        prog="open_telemetry_test",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="commands:\n"
+        + "\n".join(
+            f"  {command:<27}{description}"
+            for command, (_, description) in COMMANDS.items()
+        ),
+    )
+    parser.add_argument(
+        "command", choices=COMMANDS, metavar="command", help="see below"
+    )
+    parser.add_argument(
+        "args", nargs=argparse.REMAINDER, help="arguments of the command (--help)"
+    )
+    args = parser.parse_args(argv)
+
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    module, function = COMMANDS[args.command][0].split(":")
+    entry_point = getattr(importlib.import_module(module), function)
+    # The command parses its own arguments
+    sys.argv = [f"{parser.prog} {args.command}", *args.args]
+    entry_point()
+
+
+def run(command: str) -> None:
+    """Run `command` with the arguments of the script, as the dispatcher would.
+
+    For the `__main__` blocks of the scripts that read settings when they are
+    imported: .env is loaded, then the module is imported again and reads them.
+    """
+    main([command, *sys.argv[1:]])
+
+
+if __name__ == "__main__":
+    main()
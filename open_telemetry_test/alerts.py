@@ -0,0 +1,297 @@
+"""
+Anomaly alerts sent off the detection path.
+
+`AlertDispatcher.submit` only puts the alert on an in-memory queue. A background
+thread coalesces the alerts of each series over `window_secs`, and sends the pending
+ones as one digest through a `Transport`, at most every `min_interval_secs`, retrying
+failed sends. A slow or failing notification service never blocks the detection
+loop: when the queue is full, alerts are dropped (and counted) instead.
+"""
+
+import contextlib
+import os
+import threading
+import time
+from collections.abc import Sequence
+from dataclasses import dataclass
+from queue import Empty, Full, Queue
+from typing import Protocol
+
+import pandas as pd
+
+
+@dataclass(frozen=True)
+class Alert:
+    """One anomaly of a series (`ts` in epoch seconds)."""
+
+    series: str
+    ts: float
+    value: float
+    message: str = ""
+
+
+@dataclass
+class CoalescedAlert:
+    """Alerts of one series within a window."""
+
+    series: str
+    count: int
+    first_ts: float
+    last_ts: float
+    last_value: float
+    max_value: float
+    message: str
+
+    @classmethod
+    def of(cls, alert: Alert) -> "CoalescedAlert":
+        return cls(
+            alert.series,
+            1,
+            alert.ts,
+            alert.ts,
+            alert.value,
+            alert.value,
+            alert.message,
+        )
+
+    def add(self, alert: Alert) -> None:
+        self.count += 1
+        self.first_ts = min(self.first_ts, alert.ts)
+        if alert.ts >= self.last_ts:
+            self.last_ts, self.last_value = alert.ts, alert.value
+            self.message = alert.message or self.message
+        self.max_value = max(self.max_value, alert.value)
+
+
+class Transport(Protocol):
+    """Sends a digest of alerts; raises on failure."""
+
+    def send(self, subject: str, alerts: Sequence[CoalescedAlert]) -> None: ...
+
+
+def to_frame(alerts: Sequence[CoalescedAlert]) -> pd.DataFrame:
+    frame = pd.DataFrame([vars(alert) for alert in alerts])
+    for column in ("first_ts", "last_ts"):
+        frame[column] = pd.to_datetime(frame[column], unit="s")
+    return frame
+
+
+class PrintTransport:
+    def send(self, subject: str, alerts: Sequence[CoalescedAlert]) -> None:
+        print(f"🚨 {subject}")
+        print(to_frame(alerts).to_string(index=False))
+
+
+class ResendTransport:
+    """Email the digest with Resend (RESEND_API_KEY, EMAIL_FROM, EMAIL_TO)."""
+
+    def __init__(
+        self,
+        sender: str | None = None,
+        recipients: Sequence[str] | None = None,
+        api_key: str | None = None,
+    ):
+        import resend
+
+        resend.api_key = api_key or os.getenv("RESEND_API_KEY")
+        self.sender: str = sender or os.getenv("EMAIL_FROM") or ""
+        self.recipients = list(recipients or [os.getenv("EMAIL_TO") or ""])
+
+    def send(self, subject: str, alerts: Sequence[CoalescedAlert]) -> None:
+        import resend
+
+        html_summary = to_frame(alerts).to_html(index=False, border=0, justify="center")
+        params: resend.Emails.SendParams = {
+            "from": self.sender,
+            "to": self.recipients,
+            "subject": subject,
+            "html": f"""
+                <html>
+                    <body>
+                        <h2>{subject}</h2>
+                        {html_summary}
+                    </body>
+                </html>
+                """,
+        }
+        resend.Emails.send(params)
+
+
+def default_transport() -> Transport:
+    """Resend when it is configured, else print."""
+    if os.getenv("RESEND_API_KEY") and os.getenv("EMAIL_TO"):
+        return ResendTransport()
+    return PrintTransport()
+
+
+class _Flush:
+    def __init__(self):
+        self.done = threading.Event()
+
+
+_STOP = object()
+
+
+class AlertDispatcher:
+    """Queue alerts and send them, coalesced and rate limited, from a thread.
+
+    Parameters
+    ----------
+    transport : Transport
+        Sends the digests
+    window_secs : float, optional
+        Alerts of a series within this many seconds of its first pending one are
+        sent as one entry, by default 60
+    min_interval_secs : float, optional
+        Minimum time between two sends, by default 10
+    max_queue_size : int, optional
+        Alerts waiting for the sender; later ones are dropped, by default 10000
+    max_attempts : int, optional
+        Tries per digest before giving up on it, by default 3
+    retry_backoff_secs : float, optional
+        Wait before the first retry, doubled for each following one, by default 1
+    subject : str, optional
+        Subject of the digests, followed by the number of series
+    """
+
+    def __init__(
+        self,
+        transport: Transport,
+        window_secs: float = 60,
+        min_interval_secs: float = 10,
+        max_queue_size: int = 10000,
+        max_attempts: int = 3,
+        retry_backoff_secs: float = 1,
+        subject: str = "Anomaly alert",
+    ):
+        self.transport = transport
+        self.window_secs = window_secs
+        self.min_interval_secs = min_interval_secs
+        self.max_attempts = max_attempts
+        self.retry_backoff_secs = retry_backoff_secs
+        self.subject = subject
+        self.submitted = 0
+        self.dropped = 0
+        self.sent = 0
+        self.failed = 0
+        self._queue: Queue = Queue(max_queue_size)
+        self._pending: dict[str, CoalescedAlert] = {}
+        self._window_start = 0.0
+        self._last_send = -float("inf")
+        self._stopped = False
+        # Stop once the queue is drained (when there was no room for _STOP)
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()  # of the counters updated by the submitters
+        self._worker = threading.Thread(
+            target=self._run, name="AlertDispatcher", daemon=True
+        )
+        self._worker.start()
+
+    def submit(self, alert: Alert) -> bool:
+        """Queue `alert` without blocking; False if it was dropped."""
+        try:
+            self._queue.put_nowait(alert)
+        except Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+        with self._lock:
+            self.submitted += 1
+        return True
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """Send the pending alerts now (ignoring the window and the rate limit).
+
+        False if they were not sent within `timeout`, including the time waiting for
+        room in a full queue.
+        """
+        if self._stopped:
+            return True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        request = _Flush()
+        try:
+            self._queue.put(request, timeout=timeout)
+        except Full:
+            return False
+        if deadline is not None:
+            timeout = max(deadline - time.monotonic(), 0)
+        return request.done.wait(timeout)
+
+    def stop(self, timeout: float | None = None) -> None:
+        """Send the pending alerts and stop the sender (waits at most `timeout`)."""
+        if self._stopped:
+            return
+        self._stopped = True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except Full:
+            self._stopping.set()
+            # In case the queue was drained in the meantime
+            with contextlib.suppress(Full):
+                self._queue.put_nowait(_STOP)
+        if deadline is not None:
+            timeout = max(deadline - time.monotonic(), 0)
+        self._worker.join(timeout)
+
+    def _deadline(self) -> float | None:
+        if not self._pending:
+            return None
+        return max(
+            self._window_start + self.window_secs,
+            self._last_send + self.min_interval_secs,
+        )
+
+    def _send(self) -> None:
+        alerts = sorted(self._pending.values(), key=lambda alert: alert.first_ts)
+        self._pending = {}
+        subject = f"{self.subject} | {len(alerts)} series"
+        for attempt in range(self.max_attempts):
+            if attempt:
+                time.sleep(self.retry_backoff_secs * 2 ** (attempt - 1))
+            try:
+                self.transport.send(subject, alerts)
+            except Exception as e:
+                print(f"Alert send failed ({attempt + 1}/{self.max_attempts}): {e}")
+                continue
+            self.sent += 1
+            break
+        else:
+            self.failed += len(alerts)
+        self._last_send = time.monotonic()
+
+    def _add(self, alert: Alert) -> None:
+        if not self._pending:
+            self._window_start = time.monotonic()
+        coalesced = self._pending.get(alert.series)
+        if coalesced is None:
+            self._pending[alert.series] = CoalescedAlert.of(alert)
+        else:
+            coalesced.add(alert)
+
+    def _run(self) -> None:
+        while True:
+            deadline = self._deadline()
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+            try:
+                item = self._queue.get(timeout=timeout)
+            except Empty:
+                item = None
+            # Take the backlog (e.g. queued during a slow send) too, so that it is
+            # coalesced into the next digest
+            while isinstance(item, Alert):
+                self._add(item)
+                try:
+                    item = self._queue.get_nowait()
+                except Empty:
+                    item = None
+
+            stop = item is _STOP or (self._stopping.is_set() and self._queue.empty())
+            forced = stop or isinstance(item, _Flush)
+            deadline = self._deadline()
+            if deadline is not None and (forced or time.monotonic() >= deadline):
+                self._send()
+            if isinstance(item, _Flush):
+                item.done.set()
+            if stop:
+                return
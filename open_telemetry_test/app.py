@@ -9,6 +9,14 @@ from random import randint
 from flask import Flask, request
 from opentelemetry import metrics, trace
 
+from open_telemetry_test.telemetry import TelemetryConfig, setup_telemetry
+
+# No-op for the providers already set up by `opentelemetry-instrument`. Beyond
+# the traces budget, spans are only exported for errors and rare values
+setup_telemetry(
+    TelemetryConfig.from_env(service_name="diceroller", traces_sampler="adaptive_rate")
+)
+
 # Acquire a tracer
 tracer = trace.get_tracer("diceroller.tracer")
 # Acquire a meter.
@@ -35,9 +43,9 @@ def roll_dice():
         # This adds 1 to the counter for the given roll value
         roll_counter.add(1, {"roll.value": result})
         if player:
-            logger.warn("{} is rolling the dice: {}", player, result)
+            logger.warning("%s is rolling the dice: %s", player, result)
         else:
-            logger.warn("Anonymous player is rolling the dice: %s", result)
+            logger.warning("Anonymous player is rolling the dice: %s", result)
         return result
 
 
@@ -0,0 +1,120 @@
+"""
+ASGI variant of `app.py`: the dice roll endpoint on FastAPI.
+
+Log records are only put on a queue by the request handlers; a listener thread hands
+them to the root handlers (e.g. the OTLP handler of `opentelemetry-instrument`), with
+the trace context of the request re-attached. The queue handler and its listener are
+installed together for the lifespan of the app, and the queue holds at most
+LOG_QUEUE_SIZE records: later ones are dropped and counted rather than piling up.
+
+    cd open_telemetry_test
+    opentelemetry-instrument --logs_exporter otlp uvicorn app_asgi:app --port 8080
+"""
+
+import logging
+import os
+import queue
+from contextlib import asynccontextmanager
+from logging.handlers import QueueHandler, QueueListener
+from random import randint
+
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
+from opentelemetry import context, metrics, trace
+
+from open_telemetry_test.telemetry import TelemetryConfig, setup_telemetry
+
+# No-op for the providers already set up by `opentelemetry-instrument`. Beyond
+# the traces budget, spans are only exported for errors and rare values
+setup_telemetry(
+    TelemetryConfig.from_env(service_name="diceroller", traces_sampler="adaptive_rate")
+)
+
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+tracer = trace.get_tracer("diceroller.tracer")
+meter = metrics.get_meter("diceroller.meter")
+
+roll_counter = meter.create_counter(
+    "dice.rolls",
+    description="The number of rolls by roll value",
+)
+
+
+class ContextQueueHandler(QueueHandler):
+    """Enqueue records along with the OTEL context they were logged in.
+
+    Records that do not fit in a bounded queue are dropped (and counted in
+    `dropped`) instead of blocking the event loop.
+    """
+
+    def __init__(self, queue: queue.Queue):
+        super().__init__(queue)
+        self.dropped = 0
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # Under the handler's lock (see Handler.handle)
+            self.dropped += 1
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = super().prepare(record)
+        record.otel_context = context.get_current()
+        return record
+
+
+class ContextQueueListener(QueueListener):
+    """Handle ContextQueueHandler records in the context they were logged in."""
+
+    def handle(self, record: logging.LogRecord) -> None:
+        token = context.attach(record.otel_context)  # type: ignore[attr-defined]
+        try:
+            super().handle(record)
+        finally:
+            context.detach(token)
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+logger.propagate = False
+# Outside the lifespan (e.g. an ASGI transport that does not run it), records are
+# discarded
+logger.addHandler(logging.NullHandler())
+log_queue: queue.Queue = queue.Queue(LOG_QUEUE_SIZE)
+queue_handler = ContextQueueHandler(log_queue)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    handlers = logging.getLogger().handlers or [logging.StreamHandler()]
+    listener = ContextQueueListener(log_queue, *handlers, respect_handler_level=True)
+    # Records are only queued while the listener runs
+    listener.start()
+    logger.addHandler(queue_handler)
+    try:
+        yield
+    finally:
+        logger.removeHandler(queue_handler)
+        listener.stop()
+
+
+app = FastAPI(lifespan=lifespan)
+
+
+@app.get("/rolldice", response_class=PlainTextResponse)
+async def roll_dice(player: str | None = None) -> str:
+    with tracer.start_as_current_span("roll") as roll_span:
+        result = str(roll())
+        roll_span.set_attribute("roll.value", result)
+        roll_counter.add(1, {"roll.value": result})
+        if player:
+            logger.warning("%s is rolling the dice: %s", player, result)
+        else:
+            logger.warning("Anonymous player is rolling the dice: %s", result)
+        return result
+
+
+def roll():
+    return randint(1, 6)
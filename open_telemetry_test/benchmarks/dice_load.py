@@ -0,0 +1,262 @@
+"""
+Load test the dice roll service: Flask (`app.py`) against ASGI (`app_asgi.py`).
+
+Each implementation runs in its own server process, with the OTEL SDK disabled
+(`OTEL_SDK_DISABLED=true`) or exporting spans and metrics over OTLP/HTTP to an
+in-process stand-in collector. Concurrent clients call `/rolldice` for a fixed time
+after a warm-up; reports p50 / p99 latency and requests per second.
+
+    uv run python open_telemetry_test/benchmarks/dice_load.py --concurrency 16
+
+A single client event loop tops out at a few hundred requests per second; spread the
+clients over `--processes` when the server has cores to spare, and compare rows
+rather than reading them in isolation.
+"""
+
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import numpy as np
+
+IMPLEMENTATIONS = {
+    "flask": ["-m", "flask", "--app", "open_telemetry_test.app", "run", "--port"],
+    "asgi": [
+        "-m",
+        "uvicorn",
+        "open_telemetry_test.app_asgi:app",
+        "--log-level",
+        "warning",
+        "--no-access-log",
+        "--port",
+    ],
+}
+INSTRUMENTATION = ("off", "on")
+COLUMNS = ("app", "otel", "requests", "errors", "rps", "p50 ms", "p99 ms")
+
+
+class _CollectorHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        self.server.exports += 1  # type: ignore[attr-defined]
+        # An empty message is a valid (empty) export response
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-protobuf")
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class Collector(ThreadingHTTPServer):
+    """Accept OTLP/HTTP exports and discard them."""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _CollectorHandler)
+        self.exports = 0
+        self.endpoint = f"http://127.0.0.1:{self.server_port}"
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.shutdown()
+        self.server_close()
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(
+    implementation: str, port: int, collector: Collector | None
+) -> subprocess.Popen:
+    """Start `implementation` on `port`, instrumented if `collector` is given."""
+    env = dict(os.environ, OTEL_SERVICE_NAME="diceroller")
+    if collector is None:
+        env["OTEL_SDK_DISABLED"] = "true"
+    else:
+        env.update(
+            OTEL_SDK_DISABLED="false",
+            OTEL_TRACES_EXPORTER="otlp",
+            OTEL_METRICS_EXPORTER="otlp",
+            OTEL_EXPORTER_OTLP_PROTOCOL="http/protobuf",
+            OTEL_EXPORTER_OTLP_ENDPOINT=collector.endpoint,
+        )
+    return subprocess.Popen(
+        [sys.executable, *IMPLEMENTATIONS[implementation], str(port)],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+def wait_ready(url: str, timeout: float = 30) -> None:
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            httpx.get(url, timeout=1).raise_for_status()
+            return
+        except httpx.HTTPError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+async def _measure(
+    url: str,
+    concurrency: int,
+    seconds: float,
+    warmup: float,
+    transport: httpx.AsyncBaseTransport | None,
+) -> tuple[list[float], int]:
+    latencies: list[float] = []
+    errors = 0
+    limits = httpx.Limits(max_connections=concurrency)
+
+    async with httpx.AsyncClient(transport=transport, limits=limits) as client:
+        start = time.perf_counter()
+        measured_from = start + warmup
+        deadline = measured_from + seconds
+
+        async def worker():
+            nonlocal errors
+            while (sent := time.perf_counter()) < deadline:
+                try:
+                    response = await client.get(url, params={"player": "load"})
+                    ok = response.status_code == 200
+                except httpx.HTTPError:
+                    ok = False
+                if sent >= measured_from:
+                    if ok:
+                        latencies.append(time.perf_counter() - sent)
+                    else:
+                        errors += 1
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors
+
+
+async def run_load(
+    url: str,
+    concurrency: int,
+    seconds: float,
+    warmup: float = 0,
+    transport: httpx.AsyncBaseTransport | None = None,
+) -> dict:
+    """Call `url` from `concurrency` clients for `warmup` + `seconds`.
+
+    Only the requests that start after the warm-up are measured.
+    """
+    latencies, errors = await _measure(url, concurrency, seconds, warmup, transport)
+    return summarize(latencies, errors, seconds)
+
+
+def _client_process(url: str, concurrency: int, seconds: float, warmup: float):
+    return asyncio.run(_measure(url, concurrency, seconds, warmup, None))
+
+
+def run_load_processes(
+    url: str, concurrency: int, seconds: float, warmup: float, processes: int
+) -> dict:
+    """Like `run_load`, with the clients split over `processes` processes.
+
+    A single client event loop would otherwise bound the throughput.
+    """
+    if processes <= 1:
+        return asyncio.run(run_load(url, concurrency, seconds, warmup))
+    shares = [len(part) for part in np.array_split(range(concurrency), processes)]
+    with ProcessPoolExecutor(processes) as pool:
+        futures = [
+            pool.submit(_client_process, url, share, seconds, warmup)
+            for share in shares
+            if share
+        ]
+        results = [future.result() for future in futures]
+    latencies = [latency for result in results for latency in result[0]]
+    return summarize(latencies, sum(result[1] for result in results), seconds)
+
+
+def summarize(latencies: list[float], errors: int, seconds: float) -> dict:
+    p50, p99 = (
+        np.percentile(latencies, [50, 99]) * 1000 if latencies else (np.nan, np.nan)
+    )
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / seconds,
+        "p50 ms": float(p50),
+        "p99 ms": float(p99),
+    }
+
+
+def run_case(
+    implementation: str,
+    instrumented: bool,
+    concurrency: int,
+    seconds: float,
+    warmup: float,
+    processes: int = 1,
+) -> dict:
+    collector = Collector() if instrumented else None
+    port = _free_port()
+    url = f"http://127.0.0.1:{port}/rolldice"
+    server = start_server(implementation, port, collector)
+    try:
+        wait_ready(url)
+        result = run_load_processes(url, concurrency, seconds, warmup, processes)
+    finally:
+        server.terminate()
+        server.wait()
+        if collector is not None:
+            collector.close()
+    return {"app": implementation, "otel": "on" if instrumented else "off", **result}
+
+
+def _format(value) -> str:
+    if isinstance(value, float):
+        return f"{value:.1f}" if value >= 10 else f"{value:.2f}"
+    return str(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--apps", default=",".join(IMPLEMENTATIONS))
+    parser.add_argument("--otel", default=",".join(INSTRUMENTATION))
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--warmup", type=float, default=1)
+    parser.add_argument(
+        "--processes", type=int, default=1, help="client processes sharing the load"
+    )
+    args = parser.parse_args()
+
+    print(" ".join(f"{column:>10}" for column in COLUMNS))
+    for implementation in args.apps.split(","):
+        for otel in args.otel.split(","):
+            result = run_case(
+                implementation,
+                otel == "on",
+                args.concurrency,
+                args.seconds,
+                args.warmup,
+                args.processes,
+            )
+            print(" ".join(f"{_format(result[column]):>10}" for column in COLUMNS))
+
+
+if __name__ == "__main__":
+    main()
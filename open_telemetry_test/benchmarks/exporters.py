@@ -0,0 +1,459 @@
+"""
+Benchmark the ways this repo publishes the vibration gauge.
+
+- prometheus_client: raw prometheus_client Gauge, served by the
+  `CachedExpositionServer` (invalidated on every update) and scraped over HTTP
+  (prometheus.prometheus_predictive)
+- otel_prometheus: OTEL observable gauge read by a PrometheusMetricReader, served by
+  the `CachedExpositionServer` (payload reused for PROMETHEUS_MAX_AGE_MS) and scraped
+  over HTTP (prometheus.prometheus_predictive_otel)
+- otlp_grpc / otlp_http: OTEL observable gauge pushed by a PeriodicExportingMetricReader
+  to an OTLP receiver (otel_common.otel_predictive)
+
+Every case drives `series` gauges (one per machine_id) at `rate` updates per second
+against an in-process stand-in: an OTLP gRPC or HTTP receiver, or a scraper polling
+the scrape endpoint every `interval` seconds. Each case runs in its own process, so
+that global state (the default prometheus registry) and the peak RSS are per case.
+
+Reported per case:
+- samples/s: gauge updates per second actually achieved by the driver
+- points/s, kB/s: data points and payload bytes received by the stand-in per second
+- p50 / p99 ms: latency of an export call (OTLP) or of a scrape request
+- cpu %: CPU of the process (one core = 100%), minus the CPU measured in the
+  stand-in receiver / scraper threads (the receivers' request parsing included;
+  only the HTTP/2 framing of gRPC, in its own threads, stays charged to otlp_grpc)
+- rss MB: peak resident memory of the process
+- renders: encodings of the registry by the scrape endpoint (scraped paths)
+
+    uv run python open_telemetry_test/benchmarks/exporters.py --series 10,100,1000
+"""
+
+import argparse
+import itertools
+import json
+import resource
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import grpc
+import numpy as np
+import requests
+from opentelemetry.proto.collector.metrics.v1 import metrics_service_pb2
+
+METRIC_NAME = "machine_vibration_acceleration"
+PATHS = ("prometheus_client", "otel_prometheus", "otlp_grpc", "otlp_http")
+
+
+class Stats:
+    """What the stand-in received, and the CPU it spent receiving it."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies: list[float] = []
+        self.points = 0
+        self.bytes = 0
+        self.harness_cpu = 0.0
+        self.renders: int | None = None  # of the scrape endpoint
+
+    def add(self, points: int, size: int, cpu: float, latency: float | None = None):
+        with self.lock:
+            self.points += points
+            self.bytes += size
+            self.harness_cpu += cpu
+            if latency is not None:
+                self.latencies.append(latency)
+
+
+def _count_points(request: metrics_service_pb2.ExportMetricsServiceRequest) -> int:
+    return sum(
+        len(metric.gauge.data_points)
+        for resource_metrics in request.resource_metrics
+        for scope_metrics in resource_metrics.scope_metrics
+        for metric in scope_metrics.metrics
+    )
+
+
+# --- Stand-ins ---
+
+
+class GrpcReceiver:
+    """OTLP gRPC metrics service, handed the raw request bytes.
+
+    The request is parsed (and the response serialized) in `Export`, so that its
+    CPU is measured like that of the HTTP receiver rather than charged to the
+    otlp_grpc path.
+    """
+
+    SERVICE = metrics_service_pb2.DESCRIPTOR.services_by_name["MetricsService"]
+
+    def __init__(self, stats: Stats):
+        self.stats = stats
+        self.executor = ThreadPoolExecutor(4)
+        self.server = grpc.server(self.executor)
+        # No (de)serializers: the handler gets and returns bytes
+        handler = grpc.method_handlers_generic_handler(
+            self.SERVICE.full_name,
+            {"Export": grpc.unary_unary_rpc_method_handler(self.Export)},
+        )
+        self.server.add_generic_rpc_handlers((handler,))
+        self.port = self.server.add_insecure_port("127.0.0.1:0")
+        self.server.start()
+
+    def Export(self, body: bytes, context) -> bytes:
+        cpu = time.thread_time()
+        request = metrics_service_pb2.ExportMetricsServiceRequest.FromString(body)
+        response = (
+            metrics_service_pb2.ExportMetricsServiceResponse().SerializeToString()
+        )
+        self.stats.add(_count_points(request), len(body), time.thread_time() - cpu)
+        return response
+
+    def close(self):
+        self.server.stop(None).wait()
+        self.executor.shutdown()
+
+
+class _HttpReceiverHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        cpu = time.thread_time()
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        request = metrics_service_pb2.ExportMetricsServiceRequest.FromString(body)
+        response = (
+            metrics_service_pb2.ExportMetricsServiceResponse().SerializeToString()
+        )
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-protobuf")
+        self.send_header("Content-Length", str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+        self.server.stats.add(  # type: ignore[attr-defined]
+            _count_points(request), len(body), time.thread_time() - cpu
+        )
+
+    def log_message(self, *args):
+        pass
+
+
+class HttpReceiver(ThreadingHTTPServer):
+    def __init__(self, stats: Stats):
+        super().__init__(("127.0.0.1", 0), _HttpReceiverHandler)
+        self.stats = stats
+        self.port = self.server_port
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.shutdown()
+        self.server_close()
+
+
+class Scraper:
+    """Poll a scrape endpoint every `interval` seconds, as Prometheus would."""
+
+    def __init__(self, url: str, interval: float, stats: Stats):
+        self.url = url
+        self.interval = interval
+        self.stats = stats
+        self.session = requests.Session()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def scrape(self):
+        start = time.perf_counter()
+        response = self.session.get(self.url, timeout=30)
+        latency = time.perf_counter() - start
+        cpu = time.thread_time()
+        points = sum(
+            1
+            for line in response.text.splitlines()
+            if line.startswith(METRIC_NAME) and not line.startswith("#")
+        )
+        self.stats.add(points, len(response.content), time.thread_time() - cpu, latency)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            cpu = time.thread_time()
+            self.scrape()
+            # The request itself (client side) is harness work too
+            with self.stats.lock:
+                self.stats.harness_cpu += time.thread_time() - cpu
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+        # Last scrape, so every path is measured over the same updates
+        self.scrape()
+        # Ends the server's thread of the kept-alive connection
+        self.session.close()
+
+
+# --- Paths ---
+
+
+def _timed(export, stats: Stats):
+    def timed_export(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return export(*args, **kwargs)
+        finally:
+            with stats.lock:
+                stats.latencies.append(time.perf_counter() - start)
+
+    return timed_export
+
+
+def _otel_gauge(reader, machine_ids: list[str]):
+    """Observable gauge of the last values set with the returned function."""
+    from opentelemetry import metrics
+    from opentelemetry.sdk.metrics import MeterProvider
+
+    current = np.zeros(len(machine_ids))
+    lock = threading.Lock()
+
+    def callback(options):
+        with lock:
+            values = current.tolist()
+        return [
+            metrics.Observation(value, {"machine_id": machine_id})
+            for machine_id, value in zip(machine_ids, values, strict=True)
+        ]
+
+    provider = MeterProvider(metric_readers=[reader])
+    provider.get_meter("vibration.meter").create_observable_gauge(
+        METRIC_NAME, callbacks=[callback], description="Machine vibration in g"
+    )
+
+    def set_values(values: np.ndarray):
+        with lock:
+            np.copyto(current, values)
+
+    return set_values, provider
+
+
+def setup(path: str, machine_ids: list[str], interval: float, stats: Stats):
+    """Publish the gauges through `path`.
+
+    Returns
+    -------
+    tuple[Callable[[np.ndarray], None], Callable[[], None]]
+        Set the values of every gauge, and stop (after a last export)
+    """
+    if path == "prometheus_client":
+        from prometheus_client import CollectorRegistry, Gauge
+
+        from open_telemetry_test.prometheus.exposition_server import (
+            start_cached_http_server,
+        )
+
+        registry = CollectorRegistry()
+        gauge = Gauge(METRIC_NAME, "Vibration", ["machine_id"], registry=registry)
+        children = [gauge.labels(machine_id=m) for m in machine_ids]
+        server = start_cached_http_server(0, addr="127.0.0.1", registry=registry)
+        scraper = Scraper(f"http://127.0.0.1:{server.server_port}", interval, stats)
+
+        def set_values(values: np.ndarray):
+            for child, value in zip(children, values.tolist(), strict=True):
+                child.set(value)
+            server.invalidate()
+
+        def close():
+            scraper.close()
+            server.stop()
+            stats.renders = server.renders
+
+        return set_values, close
+
+    if path == "otel_prometheus":
+        from opentelemetry.exporter.prometheus import PrometheusMetricReader
+
+        from open_telemetry_test.prometheus.exposition_server import (
+            start_cached_http_server,
+        )
+        from open_telemetry_test.telemetry import TelemetryConfig
+
+        # Registers to the default registry (one case per process)
+        set_values, provider = _otel_gauge(PrometheusMetricReader(), machine_ids)
+        server = start_cached_http_server(
+            0,
+            addr="127.0.0.1",
+            max_age=TelemetryConfig.prometheus_max_age_ms / 1000,
+        )
+        scraper = Scraper(f"http://127.0.0.1:{server.server_port}", interval, stats)
+
+        def close():
+            scraper.close()
+            server.stop()
+            stats.renders = server.renders
+            provider.shutdown()
+
+        return set_values, close
+
+    if path in ("otlp_grpc", "otlp_http"):
+        from opentelemetry.sdk.metrics.export import (
+            MetricExporter,
+            PeriodicExportingMetricReader,
+        )
+
+        receiver: GrpcReceiver | HttpReceiver
+        exporter: MetricExporter
+        if path == "otlp_grpc":
+            from opentelemetry.exporter.otlp.proto.grpc.metric_exporter import (
+                OTLPMetricExporter as GrpcExporter,
+            )
+
+            receiver = GrpcReceiver(stats)
+            exporter = GrpcExporter(
+                endpoint=f"localhost:{receiver.port}", insecure=True
+            )
+        else:
+            from opentelemetry.exporter.otlp.proto.http.metric_exporter import (
+                OTLPMetricExporter as HttpExporter,
+            )
+
+            receiver = HttpReceiver(stats)
+            exporter = HttpExporter(
+                endpoint=f"http://127.0.0.1:{receiver.port}/v1/metrics"
+            )
+        exporter.export = _timed(exporter.export, stats)  # type: ignore[method-assign]
+        reader = PeriodicExportingMetricReader(
+            exporter, export_interval_millis=interval * 1000
+        )
+        set_values, provider = _otel_gauge(reader, machine_ids)
+
+        def close():
+            # Shutting down exports once more
+            provider.shutdown()
+            receiver.close()
+
+        return set_values, close
+
+    raise ValueError(f"Unknown path {path!r}, expected one of {PATHS}")
+
+
+def run_case(
+    path: str, series: int, rate: float, seconds: float, interval: float
+) -> dict:
+    """Drive one path in this process (see the module docstring for the output)."""
+    stats = Stats()
+    machine_ids = [f"machine_{i}" for i in range(series)]
+    set_values, close = setup(path, machine_ids, interval, stats)
+    rng = np.random.default_rng(0)
+    period = 1 / rate
+
+    cpu = time.process_time()
+    start = time.perf_counter()
+    deadline = start + seconds
+    updates = 0
+    for tick in itertools.count():
+        set_values(rng.uniform(0, 5, series))
+        updates += 1
+        now = time.perf_counter()
+        next_tick = start + (tick + 1) * period
+        if next_tick >= deadline:
+            break
+        if next_tick > now:
+            time.sleep(next_tick - now)
+    driven = time.perf_counter() - start
+    close()
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu - stats.harness_cpu
+
+    latencies = np.array(stats.latencies) * 1000
+    return {
+        "path": path,
+        "series": series,
+        "rate": rate,
+        "samples/s": updates * series / driven,
+        "points/s": stats.points / elapsed,
+        "kB/s": stats.bytes / elapsed / 1000,
+        "p50 ms": float(np.percentile(latencies, 50)) if len(latencies) else None,
+        "p99 ms": float(np.percentile(latencies, 99)) if len(latencies) else None,
+        "cpu %": cpu / elapsed * 100,
+        # KiB on Linux
+        "rss MB": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "renders": stats.renders,
+    }
+
+
+COLUMNS = (
+    "path",
+    "series",
+    "rate",
+    "samples/s",
+    "points/s",
+    "kB/s",
+    "p50 ms",
+    "p99 ms",
+    "cpu %",
+    "rss MB",
+    "renders",
+)
+
+
+def _format(value) -> str:
+    if value is None:
+        return "-"
+    if isinstance(value, float):
+        return f"{value:.1f}" if value >= 10 else f"{value:.2f}"
+    return str(value)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--paths", default=",".join(PATHS))
+    parser.add_argument("--series", default="10,100,1000")
+    parser.add_argument("--rates", default="1,10", help="updates per second")
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--interval", type=float, default=1, help="export / scrape")
+    parser.add_argument("--json", action="store_true", help="one JSON line per case")
+    parser.add_argument("--case", nargs=3, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        path, series, rate = args.case
+        result = run_case(path, int(series), float(rate), args.seconds, args.interval)
+        print(json.dumps(result))
+        return
+
+    if not args.json:
+        print(
+            " ".join(
+                f"{column:>18}" if i == 0 else f"{column:>10}"
+                for i, column in enumerate(COLUMNS)
+            )
+        )
+    cases = itertools.product(
+        args.paths.split(","), args.series.split(","), args.rates.split(",")
+    )
+    for path, series, rate in cases:
+        child = subprocess.run(
+            [sys.executable, __file__, "--case", path, series, rate]
+            + ["--seconds", str(args.seconds), "--interval", str(args.interval)],
+            capture_output=True,
+            text=True,
+        )
+        if child.returncode != 0:
+            print(f"{path} {series} {rate} failed:\n{child.stderr}", file=sys.stderr)
+            continue
+        result = json.loads(child.stdout.splitlines()[-1])
+        if args.json:
+            print(json.dumps(result))
+        else:
+            print(
+                " ".join(
+                    f"{_format(result[column]):>18}"
+                    if i == 0
+                    else f"{_format(result[column]):>10}"
+                    for i, column in enumerate(COLUMNS)
+                )
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Compare one span per sample with one span per window per machine.
+
+Feeds simulated samples (with simulated timestamps, so the run is not bound by the
+sampling rate) through each span mode, a BatchSpanProcessor and an exporter that
+encodes the spans as OTLP protobuf and counts the bytes. Reports spans, export
+bytes and CPU time (all threads) per simulated second.
+
+    uv run python open_telemetry_test/benchmarks/span_batching.py --machines 20
+"""
+
+import argparse
+import time
+from collections.abc import Sequence
+
+import numpy as np
+from opentelemetry.exporter.otlp.proto.common.trace_encoder import encode_spans
+from opentelemetry.sdk.trace import ReadableSpan, TracerProvider
+from opentelemetry.sdk.trace.export import (
+    BatchSpanProcessor,
+    SpanExporter,
+    SpanExportResult,
+)
+
+from open_telemetry_test.otel_common.span_batcher import make_span_hook
+
+METRIC_NAME = "machine_vibration_acceleration"
+
+
+class CountingExporter(SpanExporter):
+    """Encode spans as an OTLP export request would, and count them."""
+
+    def __init__(self):
+        self.spans = 0
+        self.bytes = 0
+
+    def export(self, spans: Sequence[ReadableSpan]) -> SpanExportResult:
+        self.spans += len(spans)
+        self.bytes += len(encode_spans(spans).SerializeToString())
+        return SpanExportResult.SUCCESS
+
+    def shutdown(self) -> None:
+        pass
+
+
+def run(mode: str, machines: int, rate_hz: float, seconds: float, window: float):
+    exporter = CountingExporter()
+    provider = TracerProvider()
+    provider.add_span_processor(
+        BatchSpanProcessor(exporter, max_queue_size=1 << 16, max_export_batch_size=512)
+    )
+    tracer = provider.get_tracer("benchmark")
+    hook = make_span_hook(mode, tracer, METRIC_NAME, window)
+
+    machine_ids = [f"machine_{i}" for i in range(machines)]
+    rng = np.random.default_rng(0)
+    ticks = int(seconds * rate_hz)
+    values = rng.uniform(0, 5, size=(ticks, machines))
+    # A few spikes, reported as outlier events in window mode
+    values[rng.random(values.shape) < 0.001] = 50.0
+    start_ns = time.time_ns()
+    period_ns = int(1e9 / rate_hz)
+
+    cpu = time.process_time()
+    wall = time.perf_counter()
+    for tick in range(ticks):
+        hook(machine_ids, values[tick], now_ns=start_ns + tick * period_ns)
+    hook.flush()
+    provider.force_flush()
+    cpu = time.process_time() - cpu
+    wall = time.perf_counter() - wall
+    provider.shutdown()
+    return {
+        "spans/s": exporter.spans / seconds,
+        "bytes/s": exporter.bytes / seconds,
+        "cpu ms/s": cpu * 1000 / seconds,
+        "wall s": wall,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--machines", type=int, default=20)
+    parser.add_argument("--rate-hz", type=float, default=10)
+    parser.add_argument("--seconds", type=float, default=60, help="simulated time")
+    parser.add_argument("--window", type=float, default=5, help="window mode span")
+    args = parser.parse_args()
+
+    print(
+        f"{args.machines} machines at {args.rate_hz} Hz for {args.seconds:g}s "
+        f"(window {args.window:g}s)"
+    )
+    print(f"{'mode':<8}{'spans/s':>12}{'bytes/s':>14}{'cpu ms/s':>12}{'wall s':>10}")
+    for mode in ("sample", "window"):
+        result = run(mode, args.machines, args.rate_hz, args.seconds, args.window)
+        print(
+            f"{mode:<8}{result['spans/s']:>12.1f}{result['bytes/s']:>14.0f}"
+            f"{result['cpu ms/s']:>12.2f}{result['wall s']:>10.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,49 @@
+"""
+Online anomaly detection of the SMD series with TimeGPT, reported through OTEL.
+
+The dataset is read from a local file (`OAD_DATASET_PATH`, CSV or Parquet) or
+downloaded once from `OAD_DATASET_URL` into a Parquet cache under `OAD_CACHE_DIR`.
+Series are sent to `detect_anomalies_online` in shards of `OAD_SHARD_SIZE` series, at
+most `OAD_MAX_WORKERS` at a time, and the anomaly counts of each shard are added to the
+counters as soon as it finishes.
+
+    uv run python -m open_telemetry_test oad
+"""
+
+import importlib.util
+import os
+import time
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from urllib.parse import urlparse
+
 import pandas as pd
-from dotenv import load_dotenv
-from nixtla import NixtlaClient
 from opentelemetry import metrics, trace
+from opentelemetry.context import Context, get_current
 
-load_dotenv()
+from open_telemetry_test.telemetry import TelemetryConfig, setup_telemetry
+
+DATASET_URL = os.getenv(
+    "OAD_DATASET_URL", "https://datasets-nixtla.s3.us-east-1.amazonaws.com/SMD_test.csv"
+)
+# Local CSV or Parquet file, read instead of the URL (no network)
+DATASET_PATH = os.getenv("OAD_DATASET_PATH")
+CACHE_DIR = Path(
+    os.getenv("OAD_CACHE_DIR", Path(__file__).parent / "oad_cache")
+).resolve()
+SHARD_SIZE = int(os.getenv("OAD_SHARD_SIZE", "8"))
+MAX_WORKERS = int(os.getenv("OAD_MAX_WORKERS", "4"))
+
+DETECT_KWARGS = dict(
+    time_col="ts",
+    target_col="y",
+    freq="h",
+    h=24,
+    level=95,
+    detection_size=475,
+    threshold_method="univariate",  # Specify the threshold_method as 'univariate'
+)
 
 # Acquire a tracer
 tracer = trace.get_tracer("oad.tracer")
@@ -21,44 +61,164 @@ anomaly_counter_overall = meter.create_counter(
     description="The number of anomalies detected overall",
 )
 
-nixtla_client = NixtlaClient(
-    # defaults to os.environ.get("NIXTLA_API_KEY")
-    # api_key = "",
-)
 
+def _parquet_available() -> bool:
+    return importlib.util.find_spec("pyarrow") is not None
 
-df = pd.read_csv(
-    "https://datasets-nixtla.s3.us-east-1.amazonaws.com/SMD_test.csv",
-    parse_dates=["ts"],
-)
-print(df.head())
-
-with tracer.start_as_current_span("detect_anomaly") as detect_anomaly:
-    anomaly_online = nixtla_client.detect_anomalies_online(
-        df[["ts", "y", "unique_id"]],
-        time_col="ts",
-        target_col="y",
-        freq="h",
-        h=24,
-        level=95,
-        detection_size=475,
-        threshold_method="univariate",  # Specify the threshold_method as 'univariate'
-    )
 
-    current_time = df["ts"].max().isoformat()
-    detect_anomaly.set_attribute("current_time", current_time)
+def _read(path: Path) -> pd.DataFrame:
+    if path.suffix == ".parquet":
+        return pd.read_parquet(path)
+    return pd.read_csv(path, parse_dates=["ts"])
+
+
+def load_dataset(
+    path: str | Path | None = DATASET_PATH,
+    url: str = DATASET_URL,
+    cache_dir: Path = CACHE_DIR,
+) -> pd.DataFrame:
+    """Read the dataset from `path`, or from the cache of `url` (filled on a miss).
+
+    The cache is a Parquet file, or a CSV copy when pyarrow is not installed (never
+    a pickle: whatever is in the cache directory is only parsed, not executed).
+
+    Parameters
+    ----------
+    path : str | Path | None, optional
+        Local CSV or Parquet file, by default `OAD_DATASET_PATH`
+    url : str, optional
+        CSV to download when `path` is not set, by default `OAD_DATASET_URL`
+    cache_dir : Path, optional
+        Directory of the downloaded datasets, by default `OAD_CACHE_DIR`
+
+    Returns
+    -------
+    pd.DataFrame
+        Long format dataset (unique_id, ts, y)
+    """
+    if path:
+        return _read(Path(path))
+
+    suffix = ".parquet" if _parquet_available() else ".csv"
+    cached = cache_dir / (Path(urlparse(url).path).stem + suffix)
+    if cached.exists():
+        return _read(cached)
+
+    df = pd.read_csv(url, parse_dates=["ts"])
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    partial = cached.with_suffix(suffix + ".tmp")
+    if suffix == ".parquet":
+        df.to_parquet(partial, index=False)
+    else:
+        df.to_csv(partial, index=False)
+    # Readers never see a partly written cache
+    os.replace(partial, cached)
+    return df
 
-    anomaly_counts = anomaly_online.query("anomaly == True").groupby("unique_id").size()
 
-    # Capture the metrics
-    for unique_id, count in anomaly_counts.items():
-        anomaly_counter_per_id.add(
-            # convert numpy.int64 to plain int
-            int(count),
-            {"unique_id": str(unique_id)},
+def shards(df: pd.DataFrame, shard_size: int) -> Iterator[pd.DataFrame]:
+    """Split `df` into frames of at most `shard_size` whole series."""
+    codes, _ = pd.factorize(df["unique_id"])
+    for _, shard in df.groupby(codes // shard_size):
+        yield shard
+
+
+def detect_shard(
+    client, shard: pd.DataFrame, parent: Context | None = None, **kwargs
+) -> pd.Series:
+    """Anomaly count per series of one shard (in a span, child of `parent`)."""
+    with tracer.start_as_current_span("detect_anomaly_shard", parent) as span:
+        span.set_attribute("series", int(shard["unique_id"].nunique()))
+        anomalies = client.detect_anomalies_online(
+            shard[["ts", "y", "unique_id"]], **{**DETECT_KWARGS, **kwargs}
         )
+        counts = anomalies.query("anomaly == True").groupby("unique_id").size()
+        span.set_attribute("anomalies", int(counts.sum()))
+        return counts
+
+
+def detect(
+    client,
+    df: pd.DataFrame,
+    shard_size: int = SHARD_SIZE,
+    max_workers: int = MAX_WORKERS,
+    **kwargs,
+) -> pd.Series:
+    """Detect anomalies of every series of `df`, shard by shard, in parallel.
+
+    The counts of each shard are added to the counters when the shard finishes.
+
+    Parameters
+    ----------
+    client : TimeGPTClient
+        Client (or anything with a compatible `detect_anomalies_online`)
+    df : pd.DataFrame
+        Long format dataset (unique_id, ts, y)
+    shard_size : int, optional
+        Series per `detect_anomalies_online` call, by default `OAD_SHARD_SIZE`
+    max_workers : int, optional
+        Calls in flight, by default `OAD_MAX_WORKERS`
+    **kwargs
+        Overrides of `DETECT_KWARGS`
+
+    Returns
+    -------
+    pd.Series
+        Anomaly count per unique_id (series without anomalies are left out)
+    """
+    with (
+        tracer.start_as_current_span("detect_anomaly") as detect_anomaly,
+        ThreadPoolExecutor(max_workers) as pool,
+    ):
+        detect_anomaly.set_attribute("current_time", df["ts"].max().isoformat())
+        # Worker threads do not inherit the current context
+        parent = get_current()
+        futures = [
+            pool.submit(detect_shard, client, shard, parent, **kwargs)
+            for shard in shards(df, shard_size)
+        ]
+        results = []
+        for future in as_completed(futures):
+            counts = future.result()
+            # Capture the metrics
+            for unique_id, count in counts.items():
+                # convert numpy.int64 to plain int
+                anomaly_counter_per_id.add(int(count), {"unique_id": str(unique_id)})
+            # NOTE: open-telemetry does not support numpy types.
+            anomaly_counter_overall.add(int(counts.sum()), {"unique_id": "ALL"})
+            results.append(counts)
+    return pd.concat(results).sort_index() if results else pd.Series(dtype=int)
+
+
+def main():
+    from dotenv import load_dotenv
+
+    from open_telemetry_test.timegpt import get_client
+
+    # When main is called without the dispatcher, for the settings read from here on
+    load_dotenv()
+
+    # No-op for the providers already set up by `opentelemetry-instrument`. Beyond
+    # the traces budget, spans are only exported for errors and rare values
+    setup_telemetry(
+        TelemetryConfig.from_env(service_name="oad", traces_sampler="adaptive_rate")
+    )
+    # NIXTLA_API_KEY
+    nixtla_client = get_client()
+
+    df = load_dataset()
+    print(df.head())
+    started = time.perf_counter()
+    counts = detect(nixtla_client, df)
+    print(
+        f"{int(counts.sum())} anomalies in {len(counts)} of "
+        f"{df['unique_id'].nunique()} series "
+        f"({time.perf_counter() - started:.1f}s)"
+    )
+
+
+if __name__ == "__main__":
+    # Through the dispatcher, so that the settings read at import include .env
+    from open_telemetry_test.__main__ import run
 
-    # NOTE: convert numpy.int64 to plain int since
-    # open-telemetry does not support numpy types.
-    total_anomalies = int(anomaly_counts.sum())
-    anomaly_counter_overall.add(total_anomalies, {"unique_id": "ALL"})
+    run("oad")
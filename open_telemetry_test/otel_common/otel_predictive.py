@@ -1,78 +1,75 @@
-import time
-from threading import Lock
+import os
 
 from opentelemetry import metrics, trace
-from opentelemetry.exporter.otlp.proto.grpc.metric_exporter import OTLPMetricExporter
-from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
-from opentelemetry.sdk.metrics import MeterProvider
-from opentelemetry.sdk.metrics.export import PeriodicExportingMetricReader
-from opentelemetry.sdk.trace import TracerProvider
-from opentelemetry.sdk.trace.export import BatchSpanProcessor
 
+from open_telemetry_test.otel_common.sampler import MachineSampler
+from open_telemetry_test.otel_common.span_batcher import make_span_hook
 from open_telemetry_test.predictive.predictive_common import collect_vibration_data
+from open_telemetry_test.telemetry import TelemetryConfig, setup_telemetry
 
 TIME_SECS = 5
 
-# -----------------------------------------------------------------------------#
-# Metrics
-# -----------------------------------------------------------------------------#
+# Machines to sample (comma separated) and samples per second per machine
+MACHINE_IDS = os.getenv("MACHINE_IDS", "machine_1").split(",")
+SAMPLE_HZ = float(os.getenv("SAMPLE_HZ", "10"))
 
-# Initialize OTLP Metric exporter to send to local collector
-otlp_metric_exporter = OTLPMetricExporter(endpoint="localhost:4317", insecure=True)
-
-# Export metrics every 5 second (Default is 60 seconds)
-# Set this frequency to be higher than the frequency of the tools used to
-# collect the metrics. Example, prometheus may read the metrics every 15 seconds,
-# so if we leave this at 60 seconds, we will collect the same metric value 4 times.
-reader = PeriodicExportingMetricReader(
-    otlp_metric_exporter, export_interval_millis=TIME_SECS * 1000
-)
-provider = MeterProvider(metric_readers=[reader])
-metrics.set_meter_provider(provider)
-
-meter = metrics.get_meter("vibration.meter")
-
-# -----------------------------------------------------------------------------#
-# Span
-# -----------------------------------------------------------------------------#
-
-trace.set_tracer_provider(TracerProvider())
-tracer = trace.get_tracer("vibration.tracer")
-
-# Initialize OTLP Span exporter to send to local collector
-otlp_span_exporter = OTLPSpanExporter(endpoint="localhost:4317", insecure=True)
-
-trace.get_tracer_provider().add_span_processor(BatchSpanProcessor(otlp_span_exporter))
+# Spans carry the samples to Sentry: one span per sample ("sample"), or one span per
+# machine every SPAN_WINDOW_SECS with a summary and the outliers ("window")
+SPAN_MODE = os.getenv("SPAN_MODE", "window")
+SPAN_WINDOW_SECS = float(os.getenv("SPAN_WINDOW_SECS", str(TIME_SECS)))
 
 METRIC_NAME = "machine_vibration_acceleration"
 
-current_vibration = 0.0
-vibration_lock = Lock()
-
-
-def vibration_callback(options):
-    return [
-        metrics.Observation(current_vibration, attributes={"machine_id": "machine_1"})
-    ]
 
+def read_vibration(machine_id: str) -> float:
+    # Replace with the actual sensor reading of `machine_id`
+    return collect_vibration_data()
+
+
+def main():
+    # -------------------------------------------------------------------------#
+    # Telemetry (OTLP to the local collector, see TelemetryConfig for the settings)
+    # -------------------------------------------------------------------------#
+
+    # Export metrics every 5 second (Default is 60 seconds)
+    # Set this frequency to be higher than the frequency of the tools used to
+    # collect the metrics. Example, prometheus may read the metrics every 15
+    # seconds, so if we leave this at 60 seconds, we will collect the same metric
+    # value 4 times.
+    telemetry = setup_telemetry(
+        TelemetryConfig.from_env(
+            service_name="vibration", export_interval_ms=TIME_SECS * 1000
+        )
+    )
+
+    meter = metrics.get_meter("vibration.meter")
+    tracer = trace.get_tracer("vibration.tracer")
+
+    # Add values to spans (for Sentry) as we can not export metrics to Sentry
+    span_hook = make_span_hook(SPAN_MODE, tracer, METRIC_NAME, SPAN_WINDOW_SECS)
+
+    # Samples are aggregated per export interval, and exported (for tools like
+    # Prometheus) as the last value and the min / max / mean / count of the interval
+    sampler = MachineSampler(
+        MACHINE_IDS,
+        read_vibration,
+        rate_hz=SAMPLE_HZ,
+        on_sample=span_hook,
+        interval_secs=TIME_SECS,
+    )
+    sampler.register(meter, METRIC_NAME, "Machine vibration acceleration in g")
+
+    print(f"Sampling {len(MACHINE_IDS)} machine(s) at {SAMPLE_HZ} Hz")
+    try:
+        sampler.run()
+    except KeyboardInterrupt:
+        print("🛑 Exiting...")
+    finally:
+        # Also on errors, so that the last window span and export are not lost
+        sampler.stop()
+        span_hook.flush()
+        telemetry.shutdown()
 
-vibration_gauge = meter.create_observable_gauge(
-    name=METRIC_NAME,
-    callbacks=[vibration_callback],
-    description="Machine vibration acceleration in g",
-)
 
 if __name__ == "__main__":
-    while True:
-        with tracer.start_as_current_span("vibration-sample") as span:
-            value = collect_vibration_data()
-            print(f"Vibration data collected: {value}")
-
-            # Add value to the span (for Sentry) as we can not export metrics to Sentry
-            span.set_attribute("machine_id", "machine_1")
-            span.set_attribute(METRIC_NAME, value)
-
-            # Update metric value (for tools like Prometheus)
-            with vibration_lock:
-                current_vibration = value
-        time.sleep(TIME_SECS)
+    main()
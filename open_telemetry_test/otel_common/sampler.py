@@ -0,0 +1,234 @@
+"""
+Sample many machines at a high rate and pre-aggregate every export interval.
+
+Only the aggregates (min / max / mean / count and the last value per machine) are
+exported through the OTEL meter, instead of every raw point.
+"""
+
+import threading
+import time
+from collections.abc import Callable, Sequence
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from opentelemetry import metrics
+
+# Statistics of an export interval, exported as the `stat` attribute
+STATS = ("min", "max", "mean", "count")
+
+ReadFn = Callable[[str], float]
+SampleHook = Callable[[Sequence[str], np.ndarray], None]
+
+
+class MachineSampler:
+    """Poll every machine concurrently and aggregate the samples per machine.
+
+    Every machine has a slot (index) in flat numpy arrays of running count, sum, min,
+    max and last value, so a tick of samples for all machines is folded in with a
+    few vectorized operations. Intervals end on a fixed grid of `interval_secs`
+    (the export interval). `snapshot` returns the aggregates of the last completed
+    interval without resetting anything, so every reader and every collection of
+    the OTEL callback sees the same complete interval.
+
+    Parameters
+    ----------
+    machine_ids : Sequence[str]
+        Machines to sample
+    read_fn : Callable[[str], float]
+        Reads the current value of a machine (may block, e.g. on I/O)
+    rate_hz : float, optional
+        Samples per second per machine, by default 10
+    max_workers : int | None, optional
+        Concurrent reads, by default one per machine (up to 32)
+    on_sample : Callable[[Sequence[str], np.ndarray], None] | None, optional
+        Called with the values of every tick (nan for failed reads)
+    interval_secs : float, optional
+        Length of the aggregation intervals, by default 60 (the OTEL export
+        interval)
+    """
+
+    def __init__(
+        self,
+        machine_ids: Sequence[str],
+        read_fn: ReadFn,
+        rate_hz: float = 10,
+        max_workers: int | None = None,
+        on_sample: SampleHook | None = None,
+        interval_secs: float = 60.0,
+    ):
+        self.machine_ids = list(machine_ids)
+        self.read_fn = read_fn
+        self.period = 1 / rate_hz
+        self.on_sample = on_sample
+        self.interval_secs = interval_secs
+        n = len(self.machine_ids)
+        self._executor = ThreadPoolExecutor(max_workers or min(n, 32), "sampler")
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+        # Current interval, and the last completed one (count, sum, min, max)
+        self._count = np.zeros(n, dtype=np.int64)
+        self._sum = np.zeros(n)
+        self._min = np.full(n, np.inf)
+        self._max = np.full(n, -np.inf)
+        self._interval_end = time.monotonic() + interval_secs
+        self._completed = (self._count.copy(), *self._empty())
+        # Kept across intervals
+        self.last = np.full(n, np.nan)
+        self.total = np.zeros(n, dtype=np.int64)
+
+    def _read(self, machine_id: str) -> float:
+        try:
+            return float(self.read_fn(machine_id))
+        except Exception as e:
+            print(f"Error reading {machine_id}: {e}")
+            return np.nan
+
+    def _empty(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        n = len(self.machine_ids)
+        return np.zeros(n), np.full(n, np.inf), np.full(n, -np.inf)
+
+    def _roll(self) -> None:
+        """Complete the current interval if it has ended (holding the lock)."""
+        now = time.monotonic()
+        if now < self._interval_end:
+            return
+        if now < self._interval_end + self.interval_secs:
+            self._completed = (self._count, self._sum, self._min, self._max)
+        else:
+            # No sample since the end of the previous interval
+            self._completed = (np.zeros_like(self._count), *self._empty())
+        self._count = np.zeros_like(self._count)
+        self._sum, self._min, self._max = self._empty()
+        elapsed = (now - self._interval_end) // self.interval_secs + 1
+        self._interval_end += elapsed * self.interval_secs
+
+    def record(self, values: np.ndarray) -> None:
+        """Fold one value per machine (nan for a missing value) into the interval."""
+        values = np.asarray(values, dtype=np.float64)
+        ok = ~np.isnan(values)
+        clean = np.where(ok, values, 0.0)
+        with self._lock:
+            self._roll()
+            self._count += ok
+            self.total += ok
+            self._sum += clean
+            np.fmin(self._min, values, out=self._min)
+            np.fmax(self._max, values, out=self._max)
+            np.copyto(self.last, values, where=ok)
+
+    def sample(self) -> np.ndarray:
+        """Read every machine concurrently and record the values."""
+        values = np.fromiter(
+            self._executor.map(self._read, self.machine_ids),
+            dtype=np.float64,
+            count=len(self.machine_ids),
+        )
+        self.record(values)
+        if self.on_sample is not None:
+            self.on_sample(self.machine_ids, values)
+        return values
+
+    def snapshot(self) -> dict[str, np.ndarray]:
+        """Aggregates of every machine over the last completed interval.
+
+        Machines without samples in the interval have a count of 0 and nan values.
+        """
+        with self._lock:
+            self._roll()
+            # Completed intervals are never updated in place
+            count, total, low, high = self._completed
+        empty = count == 0
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = total / count
+        return {
+            "min": np.where(empty, np.nan, low),
+            "max": np.where(empty, np.nan, high),
+            "mean": np.where(empty, np.nan, mean),
+            "count": count,
+        }
+
+    # --- OTEL ---
+
+    def _observe_stats(self, options) -> list[metrics.Observation]:
+        stats = self.snapshot()
+        return [
+            metrics.Observation(
+                float(stats[stat][i]), {"machine_id": machine_id, "stat": stat}
+            )
+            for i, machine_id in enumerate(self.machine_ids)
+            if stats["count"][i]
+            for stat in STATS
+        ]
+
+    def _observe_last(self, options) -> list[metrics.Observation]:
+        with self._lock:
+            last = self.last.copy()
+        return [
+            metrics.Observation(float(value), {"machine_id": machine_id})
+            for machine_id, value in zip(self.machine_ids, last, strict=True)
+            if not np.isnan(value)
+        ]
+
+    def _observe_total(self, options) -> list[metrics.Observation]:
+        with self._lock:
+            total = self.total.copy()
+        return [
+            metrics.Observation(int(count), {"machine_id": machine_id})
+            for machine_id, count in zip(self.machine_ids, total, strict=True)
+        ]
+
+    def register(self, meter: metrics.Meter, name: str, description: str = "") -> None:
+        """Export the samples through `meter`.
+
+        - `<name>`: last value per machine
+        - `<name>_interval`: min / max / mean / count per machine of the samples of
+          the last completed interval (`stat` attribute)
+        - `<name>_samples`: number of samples per machine (counter)
+        """
+        meter.create_observable_gauge(
+            name=name, callbacks=[self._observe_last], description=description
+        )
+        meter.create_observable_gauge(
+            name=f"{name}_interval",
+            callbacks=[self._observe_stats],
+            description=f"{description} (aggregated per export interval)",
+        )
+        meter.create_observable_counter(
+            name=f"{name}_samples",
+            callbacks=[self._observe_total],
+            description="Number of samples",
+        )
+
+    # --- Sampling loop ---
+
+    def run(self, duration: float | None = None) -> None:
+        """Sample at `rate_hz` until `stop` is called (or for `duration` seconds).
+
+        Ticks are scheduled on a fixed grid; ticks missed because reads are slower
+        than the period are skipped rather than bunched up.
+        """
+        start = time.monotonic()
+        deadline = None if duration is None else start + duration
+        tick = start
+        while not self._stop.is_set():
+            self.sample()
+            now = time.monotonic()
+            tick += self.period
+            if tick < now:
+                tick = now + self.period - (now - start) % self.period
+            if deadline is not None and tick >= deadline:
+                break
+            self._stop.wait(tick - now)
+
+    def start(self) -> None:
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._executor.shutdown()
@@ -0,0 +1,180 @@
+"""
+Carry sampled values to tracing backends (e.g. Sentry) as spans.
+
+`SampleSpans` emits one span per sample. `WindowSpans` emits one span per window per
+machine, with summary attributes and an event for every outlier sample, so the span
+rate no longer grows with the sampling rate.
+"""
+
+import time
+from collections.abc import Sequence
+
+import numpy as np
+from opentelemetry.trace import Tracer
+
+SPAN_NAME = "vibration-sample"
+WINDOW_SPAN_NAME = "vibration-window"
+
+
+class SampleSpans:
+    """One span per sample (`on_sample` hook of `MachineSampler`).
+
+    Failed reads (NaN) give no span.
+    """
+
+    def __init__(self, tracer: Tracer, metric_name: str):
+        self.tracer = tracer
+        self.metric_name = metric_name
+
+    def __call__(
+        self,
+        machine_ids: Sequence[str],
+        values: np.ndarray,
+        now_ns: int | None = None,
+    ) -> None:
+        for machine_id, value in zip(machine_ids, values, strict=True):
+            if np.isnan(value):
+                continue
+            span = self.tracer.start_span(
+                SPAN_NAME,
+                start_time=now_ns,
+                attributes={"machine_id": machine_id, self.metric_name: float(value)},
+            )
+            span.end(end_time=now_ns)
+
+    def flush(self, now_ns: int | None = None) -> None:
+        pass
+
+
+class WindowSpans:
+    """One span per window per machine (`on_sample` hook of `MachineSampler`).
+
+    Samples are folded into per-machine slots (count, sum, sum of squares, min, max,
+    last). When a window ends, every machine with samples gets a span covering the
+    window, with the summary as attributes (`<metric_name>.mean`, ...). Samples
+    further than `outlier_threshold` standard deviations from the mean of the
+    machine's previous window are added as `outlier` events (at most `max_events`
+    per span).
+
+    Parameters
+    ----------
+    tracer : Tracer
+        Tracer of the spans
+    metric_name : str
+        Prefix of the summary attributes
+    window_secs : float, optional
+        Length of a window, by default 5
+    outlier_threshold : float, optional
+        Z-score of an outlier sample, by default 3.0
+    max_events : int, optional
+        Maximum number of outlier events per span, by default 10
+    """
+
+    def __init__(
+        self,
+        tracer: Tracer,
+        metric_name: str,
+        window_secs: float = 5,
+        outlier_threshold: float = 3.0,
+        max_events: int = 10,
+    ):
+        self.tracer = tracer
+        self.metric_name = metric_name
+        self.window_ns = int(window_secs * 1e9)
+        self.outlier_threshold = outlier_threshold
+        self.max_events = max_events
+        self.machine_ids: list[str] = []
+        self._start_ns: int | None = None
+
+    def _reset(self, n: int) -> None:
+        self._count = np.zeros(n, dtype=np.int64)
+        self._sum = np.zeros(n)
+        self._sumsq = np.zeros(n)
+        self._min = np.full(n, np.inf)
+        self._max = np.full(n, -np.inf)
+        self._last = np.full(n, np.nan)
+        self._events: list[list[tuple[int, float]]] = [[] for _ in range(n)]
+
+    def __call__(
+        self,
+        machine_ids: Sequence[str],
+        values: np.ndarray,
+        now_ns: int | None = None,
+    ) -> None:
+        now_ns = time.time_ns() if now_ns is None else now_ns
+        if self._start_ns is None or list(machine_ids) != self.machine_ids:
+            self.flush(now_ns)
+            self.machine_ids = list(machine_ids)
+            n = len(self.machine_ids)
+            self._reset(n)
+            # Reference of the outliers: the previous window of every machine
+            self._mean = np.full(n, np.nan)
+            self._std = np.full(n, np.nan)
+            self._start_ns = now_ns
+        elif now_ns - self._start_ns >= self.window_ns:
+            self.flush(now_ns)
+
+        values = np.asarray(values, dtype=np.float64)
+        ok = ~np.isnan(values)
+        clean = np.where(ok, values, 0.0)
+        self._count += ok
+        self._sum += clean
+        self._sumsq += clean * clean
+        np.fmin(self._min, values, out=self._min)
+        np.fmax(self._max, values, out=self._max)
+        np.copyto(self._last, values, where=ok)
+
+        with np.errstate(invalid="ignore"):
+            outliers = np.abs(values - self._mean) > self.outlier_threshold * self._std
+        for i in np.flatnonzero(outliers):
+            if len(self._events[i]) < self.max_events:
+                self._events[i].append((now_ns, float(values[i])))
+
+    def flush(self, now_ns: int | None = None) -> None:
+        """End the current window: emit its spans and start the next one."""
+        if self._start_ns is None:
+            return
+        now_ns = time.time_ns() if now_ns is None else now_ns
+        count = self._count
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = self._sum / count
+            std = np.sqrt(np.maximum(self._sumsq / count - mean * mean, 0.0))
+        for i in np.flatnonzero(count):
+            attributes: dict[str, str | int | float] = {
+                "machine_id": self.machine_ids[i],
+                f"{self.metric_name}.count": int(count[i]),
+                f"{self.metric_name}.mean": float(mean[i]),
+                f"{self.metric_name}.std": float(std[i]),
+                f"{self.metric_name}.min": float(self._min[i]),
+                f"{self.metric_name}.max": float(self._max[i]),
+                f"{self.metric_name}.last": float(self._last[i]),
+            }
+            span = self.tracer.start_span(
+                WINDOW_SPAN_NAME, start_time=self._start_ns, attributes=attributes
+            )
+            for timestamp, value in self._events[i]:
+                span.add_event(
+                    "outlier", {self.metric_name: value}, timestamp=timestamp
+                )
+            span.end(end_time=now_ns)
+
+        # Keep the reference of machines without samples in this window
+        seen = count > 0
+        self._mean = np.where(seen, mean, self._mean)
+        self._std = np.where(seen, std, self._std)
+        self._reset(len(self.machine_ids))
+        self._start_ns = now_ns
+
+
+SPAN_MODES = ("sample", "window")
+
+
+def make_span_hook(
+    mode: str, tracer: Tracer, metric_name: str, window_secs: float = 5
+) -> SampleSpans | WindowSpans:
+    """Span hook of a `MachineSampler` for `mode` (one of SPAN_MODES)."""
+    if mode == "sample":
+        return SampleSpans(tracer, metric_name)
+    if mode == "window":
+        return WindowSpans(tracer, metric_name, window_secs)
+    raise ValueError(f"Unknown span mode {mode!r}, expected one of {SPAN_MODES}")
@@ -0,0 +1,150 @@
+"""
+Scrape endpoint that serves a cached, pre-encoded registry.
+
+`prometheus_client.start_http_server` encodes the whole registry on every scrape.
+`CachedExpositionServer` encodes it once per change: the payload (text or OpenMetrics,
+identity or gzip, as negotiated by the scraper) is cached until `invalidate` is called
+after metrics are updated, or until it is older than `max_age` (for registries whose
+values are only known at collection time, e.g. OTEL observable gauges).
+"""
+
+import gzip
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from prometheus_client import REGISTRY, CollectorRegistry
+from prometheus_client import exposition as text_exposition
+from prometheus_client.openmetrics import exposition as openmetrics_exposition
+
+# Scrapes are small and frequent: favour speed over ratio
+GZIP_LEVEL = 1
+
+
+def _accepts(header: str | None, value: str) -> bool:
+    return header is not None and any(
+        part.split(";")[0].strip() == value for part in header.split(",")
+    )
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are separate writes on a kept-alive connection
+    disable_nagle_algorithm = True
+    server: "CachedExpositionServer"
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        openmetrics = _accepts(
+            self.headers.get("Accept"), openmetrics_exposition.CONTENT_TYPE_LATEST
+        ) or _accepts(self.headers.get("Accept"), "application/openmetrics-text")
+        compress = _accepts(self.headers.get("Accept-Encoding"), "gzip")
+        body = self.server.payload(openmetrics, compress)
+
+        self.send_response(200)
+        self.send_header(
+            "Content-Type",
+            openmetrics_exposition.CONTENT_TYPE_LATEST
+            if openmetrics
+            else text_exposition.CONTENT_TYPE_LATEST,
+        )
+        if compress:
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Vary", "Accept, Accept-Encoding")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class CachedExpositionServer(ThreadingHTTPServer):
+    """Serve `registry` at `/metrics`, encoding it once per change.
+
+    Parameters
+    ----------
+    port : int, optional
+        Port to listen on, by default 8000 (0 for any free port)
+    addr : str, optional
+        Address to listen on, by default "0.0.0.0"
+    registry : CollectorRegistry, optional
+        Registry to serve, by default the default registry
+    max_age : float | None, optional
+        Seconds after which the payload is encoded again even without `invalidate`,
+        by default None (only on `invalidate`)
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        port: int = 8000,
+        addr: str = "0.0.0.0",
+        registry: CollectorRegistry = REGISTRY,
+        max_age: float | None = None,
+    ):
+        super().__init__((addr, port), _Handler)
+        self.registry = registry
+        self.max_age = max_age
+        self.renders = 0
+        self._version = 0
+        self._cache: dict[tuple[bool, bool], bytes] = {}
+        self._cache_version = -1
+        self._cached_at = 0.0
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+
+    def invalidate(self) -> None:
+        """Mark the payload stale (call after updating metrics)."""
+        self._version += 1
+
+    def payload(self, openmetrics: bool, compress: bool) -> bytes:
+        """Encoded registry, from the cache unless it is stale.
+
+        Concurrent scrapes of a stale payload wait for a single encoding.
+        """
+        with self._lock:
+            now = time.monotonic()
+            expired = self.max_age is not None and now - self._cached_at > self.max_age
+            if self._cache_version != self._version or expired:
+                self._cache.clear()
+                # Updates during the encoding make the next scrape encode again
+                self._cache_version = self._version
+                self._cached_at = now
+
+            body = self._cache.get((openmetrics, compress))
+            if body is None:
+                raw = self._cache.get((openmetrics, False))
+                if raw is None:
+                    exposition = (
+                        openmetrics_exposition if openmetrics else text_exposition
+                    )
+                    raw = exposition.generate_latest(self.registry)
+                    self.renders += 1
+                    self._cache[(openmetrics, False)] = raw
+                body = gzip.compress(raw, GZIP_LEVEL) if compress else raw
+                self._cache[(openmetrics, compress)] = body
+            return body
+
+    def start(self) -> "CachedExpositionServer":
+        """Serve in a daemon thread."""
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+
+def start_cached_http_server(
+    port: int = 8000,
+    addr: str = "0.0.0.0",
+    registry: CollectorRegistry = REGISTRY,
+    max_age: float | None = None,
+) -> CachedExpositionServer:
+    """Drop-in for `prometheus_client.start_http_server`, see CachedExpositionServer."""
+    return CachedExpositionServer(port, addr, registry, max_age).start()
@@ -4,9 +4,10 @@ Script uses Prometheus Client directly to scrape metrics (no OTEL involved).
 
 import time
 
-from prometheus_client import Gauge, start_http_server
+from prometheus_client import Gauge
 
 from open_telemetry_test.predictive.predictive_common import collect_vibration_data
+from open_telemetry_test.prometheus.exposition_server import start_cached_http_server
 
 # Create a Gauge metric for vibration
 vibration_gauge = Gauge(
@@ -17,13 +18,20 @@ vibration_gauge = Gauge(
     ],  # labels to use, e.g. machine_id="machine_1", "machine_id=machine_2", etc
 )
 
-if __name__ == "__main__":
+
+def main():
     # Start HTTP server on port 8000
-    # Mention this port in the YAML file to catch these metrics
-    start_http_server(8000)
+    # Mention this port in the YAML file to catch these metrics.
+    # The encoded payload is reused by every scrape until the gauge changes
+    server = start_cached_http_server(8000)
     machine_id = "machine_1"
     while True:
         value = collect_vibration_data()
         print(f"Vibration data collected: {value}")
         vibration_gauge.labels(machine_id=machine_id).set(value)
+        server.invalidate()
         time.sleep(5)  # Spit out the metric every 5 seconds
+
+
+if __name__ == "__main__":
+    main()
@@ -11,21 +11,9 @@ import time
 from threading import Lock
 
 from opentelemetry import metrics
-from opentelemetry.exporter.prometheus import PrometheusMetricReader
-from opentelemetry.sdk.metrics import MeterProvider
-from prometheus_client import start_http_server
 
 from open_telemetry_test.predictive.predictive_common import collect_vibration_data
-
-# Start Prometheus server on port 8000
-start_http_server(port=8000)
-
-# Initialize OpenTelemetry
-reader = PrometheusMetricReader()
-provider = MeterProvider(metric_readers=[reader])
-metrics.set_meter_provider(provider)
-
-meter = metrics.get_meter("vibration.meter")
+from open_telemetry_test.telemetry import TelemetryConfig, setup_telemetry
 
 # Thread-safe storage for vibration value
 current_vibration = 0.0
@@ -39,17 +27,36 @@ def vibration_callback(options):
     ]
 
 
-vibration_gauge = meter.create_observable_gauge(
-    name="machine_vibration_acceleration",
-    callbacks=[vibration_callback],
-    # unit="g",
-    description="Machine vibration acceleration in g",
-)
+def main():
+    global current_vibration
+
+    # Initialize OpenTelemetry, with a Prometheus server on port 8000
+    setup_telemetry(
+        TelemetryConfig.from_env(
+            service_name="vibration",
+            traces_exporter="none",
+            metrics_exporter="prometheus",
+            prometheus_port=8000,
+            # The value changes every 5 seconds
+            prometheus_max_age_ms=5000,
+        )
+    )
+
+    meter = metrics.get_meter("vibration.meter")
+    meter.create_observable_gauge(
+        name="machine_vibration_acceleration",
+        callbacks=[vibration_callback],
+        # unit="g",
+        description="Machine vibration acceleration in g",
+    )
 
-if __name__ == "__main__":
     while True:
         value = collect_vibration_data()
         print(f"Vibration data collected: {value}")
         with vibration_lock:
             current_vibration = value
         time.sleep(5)
+
+
+if __name__ == "__main__":
+    main()
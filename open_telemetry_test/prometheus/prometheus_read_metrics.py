@@ -1,44 +1,390 @@
 import argparse
+import contextlib
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections.abc import Iterable
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 
+import numpy as np
 import pandas as pd
-from prometheus_api_client import PrometheusConnect
+import requests
+from requests.adapters import HTTPAdapter
 
-# Connect to your Prometheus server
-prom = PrometheusConnect(url="http://localhost:9090", disable_ssl=True)
+PROMETHEUS_URL = os.getenv("PROMETHEUS_URL", "http://localhost:9090")
 
-# Define time range
-end_time = datetime.now()
-start_time = end_time - timedelta(minutes=10)
+# Points per series per request (Prometheus refuses more than 11,000)
+CHUNK_POINTS = 1000
+MAX_WORKERS = 8
+REQUEST_TIMEOUT = 30
+# Range fetched per request by `fetch_raw`
+RAW_CHUNK = "1h"
+# Chunks ending less than this many seconds ago may still receive samples
+SETTLE_SECS = 300
 
+CACHE_DIR = os.getenv(
+    "PROMETHEUS_CACHE_DIR", os.path.join(os.path.dirname(__file__), "chunk_cache")
+)
+CACHE_MAX_BYTES = int(os.getenv("PROMETHEUS_CACHE_MAX_BYTES", 256 * 1024 * 1024))
 
-def get_metric(query: str) -> pd.DataFrame:
-    """Fetch metric data over the time range
+_DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+_DURATION = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h|d|w)")
+
+
+def parse_duration(duration: str | float | timedelta) -> float:
+    """Seconds in a Prometheus duration, e.g. "90s", "1m30s" or 60."""
+    if isinstance(duration, timedelta):
+        return duration.total_seconds()
+    if isinstance(duration, (int, float)):
+        return float(duration)
+    parts = _DURATION.findall(duration)
+    if not parts or "".join(v + u for v, u in parts) != duration:
+        raise ValueError(f"Invalid duration: {duration!r}")
+    return sum(float(value) * _DURATION_UNITS[unit] for value, unit in parts)
+
+
+def _epoch(t: datetime | float) -> float:
+    return t.timestamp() if isinstance(t, datetime) else float(t)
+
+
+def series_id(labels: dict[str, str]) -> str:
+    """Prometheus style name of a series, e.g. `up{job="node"}`."""
+    name = labels.get("__name__", "")
+    rest = ",".join(f'{k}="{v}"' for k, v in sorted(labels.items()) if k != "__name__")
+    return f"{name}{{{rest}}}" if rest or not name else name
+
+
+class ChunkCache:
+    """On-disk cache of range query results of fully-past chunks.
+
+    One JSON file per chunk, keyed by a hash of the server, query and chunk range.
+    Reading a chunk refreshes its mtime; once the cache exceeds `max_bytes`, the
+    least recently used chunks are evicted.
+
+    Parameters
+    ----------
+    directory : str, optional
+        Directory of the cached chunks, by default CACHE_DIR
+    max_bytes : int, optional
+        Size limit of the cache, by default CACHE_MAX_BYTES
+    """
+
+    def __init__(self, directory: str = CACHE_DIR, max_bytes: int = CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(*parts) -> str:
+        return hashlib.sha256(json.dumps(parts).encode()).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key: str) -> list[dict] | None:
+        path = self._path(key)
+        try:
+            with open(path) as f:
+                result = json.load(f)
+            os.utime(path)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        return result
+
+    def put(self, key: str, result: list[dict]) -> None:
+        path = self._path(key)
+        # Write then rename, so that readers never see a partial chunk
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(result, f)
+        os.replace(tmp, path)
+        self.evict()
+
+    def size(self) -> int:
+        return sum(entry.stat().st_size for entry in os.scandir(self.directory))
+
+    def evict(self) -> None:
+        """Remove the least recently used chunks until the cache fits `max_bytes`."""
+        with self._lock:
+            entries = []
+            for entry in os.scandir(self.directory):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(path)
+                total -= size
+
+
+class RangeFetcher:
+    """Fetch long range queries as concurrent, step-aligned chunks.
+
+    Chunks are aligned to multiples of their length (`chunk_points` steps from the
+    epoch), so that the same chunks are requested (and cached) whatever the
+    requested range, e.g. for rolling "last N hours" queries.
+
+    Parameters
+    ----------
+    url : str, optional
+        Prometheus server, by default PROMETHEUS_URL
+    max_workers : int, optional
+        Concurrent requests (and pooled connections), by default MAX_WORKERS
+    chunk_points : int, optional
+        Points per series per request, by default CHUNK_POINTS
+    cache : ChunkCache | None, optional
+        Cache of the chunks that ended more than SETTLE_SECS ago, by default None
+    timeout : float, optional
+        Timeout of every request in seconds, by default REQUEST_TIMEOUT
+    """
+
+    def __init__(
+        self,
+        url: str = PROMETHEUS_URL,
+        max_workers: int = MAX_WORKERS,
+        chunk_points: int = CHUNK_POINTS,
+        cache: ChunkCache | None = None,
+        timeout: float = REQUEST_TIMEOUT,
+    ):
+        self.url = url.rstrip("/")
+        self.max_workers = max_workers
+        self.chunk_points = chunk_points
+        self.cache = cache
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._executor = ThreadPoolExecutor(max_workers, "prometheus-range")
+
+    def close(self) -> None:
+        self._executor.shutdown()
+        self.session.close()
+
+    def chunks(
+        self, start: float, end: float, step: float
+    ) -> list[tuple[float, float]]:
+        """Inclusive `(start, end)` of the aligned chunks covering `[start, end]`.
+
+        The first and last chunks can extend past the range.
+        """
+        span = self.chunk_points * step
+        first = np.floor(np.ceil(start / step) * step / span) * span
+        last = np.floor(end / step) * step
+        starts = np.arange(first, last + step / 2, span)
+        return [(s, s + span - step) for s in starts.tolist()]
+
+    def _query(self, path: str, params: dict[str, str | float]) -> list[dict]:
+        response = self.session.get(
+            f"{self.url}/api/v1/{path}", params=params, timeout=self.timeout
+        )
+        # Error pages of proxies are not JSON
+        response.raise_for_status()
+        payload = response.json()
+        if payload.get("status") != "success":
+            raise RuntimeError(f"Prometheus query failed: {payload.get('error')}")
+        return payload["data"]["result"]
+
+    def _cached(self, end: float, now: float, path: str, params: dict) -> list[dict]:
+        # Only chunks that can no longer change are cached
+        cache = self.cache if end <= now - SETTLE_SECS else None
+        key = ChunkCache.key(self.url, path, params)
+        if cache is not None:
+            result = cache.get(key)
+            if result is not None:
+                return result
+        result = self._query(path, params)
+        if cache is not None:
+            cache.put(key, result)
+        return result
+
+    @staticmethod
+    def _to_frame(results: Iterable[list[dict]]) -> pd.DataFrame:
+        """Long-format frame of the chunked results (in time order) of a query."""
+        values: dict[str, list[np.ndarray]] = {}
+        for result in results:
+            for series in result:
+                points = np.array(series["values"], dtype=np.float64).reshape(-1, 2)
+                values.setdefault(series_id(series["metric"]), []).append(points)
+
+        if not values:
+            return pd.DataFrame(
+                {
+                    "unique_id": pd.Series(dtype=str),
+                    "ds": pd.Series(dtype="datetime64[ns]"),
+                    "y": pd.Series(dtype=np.float64),
+                }
+            )
+        ids = list(values)
+        per_series = []
+        for i in ids:
+            points = np.concatenate(values[i])
+            # Samples on a chunk boundary can be returned by both chunks
+            keep = np.ones(len(points), dtype=bool)
+            keep[1:] = points[1:, 0] > points[:-1, 0]
+            per_series.append(points[keep])
+        stacked = np.concatenate(per_series)
+        return pd.DataFrame(
+            {
+                "unique_id": np.repeat(ids, [len(p) for p in per_series]),
+                "ds": pd.to_datetime(stacked[:, 0], unit="s"),
+                "y": stacked[:, 1],
+            }
+        )
+
+    def fetch(
+        self,
+        query: str,
+        start: datetime | float,
+        end: datetime | float,
+        step: str | float | timedelta,
+    ) -> pd.DataFrame:
+        """Evaluate `query` at every `step` in `[start, end]`.
+
+        Parameters
+        ----------
+        query : str
+            PromQL query
+        start, end : datetime | float
+            Range of the query (datetimes or epoch seconds)
+        step : str | float | timedelta
+            Interval between points, e.g. "60s"
+
+        Returns
+        -------
+        pd.DataFrame
+            Every matching series in long format (columns: unique_id, ds, y)
+        """
+        start_secs, end_secs = _epoch(start), _epoch(end)
+        step_secs = parse_duration(step)
+        now = time.time()
+        chunks = self.chunks(start_secs, end_secs, step_secs)
+
+        def fetch_chunk(chunk: tuple[float, float]) -> list[dict]:
+            chunk_start, chunk_end = chunk
+            params = {
+                "query": query,
+                "start": chunk_start,
+                "end": chunk_end,
+                "step": step_secs,
+            }
+            return self._cached(chunk_end, now, "query_range", params)
+
+        df = self._to_frame(self._executor.map(fetch_chunk, chunks))
+        return _clip(df, start_secs, end_secs)
+
+    def fetch_raw(
+        self,
+        selector: str,
+        start: datetime | float,
+        end: datetime | float,
+        chunk: str | float | timedelta = RAW_CHUNK,
+    ) -> pd.DataFrame:
+        """Raw samples of the series matching `selector` in `[start, end]`.
+
+        The range is fetched as concurrent range-vector queries
+        (`selector[<chunk>]`), aligned to multiples of `chunk`.
+
+        Parameters
+        ----------
+        selector : str
+            Series selector, e.g. `node_load1{job="node"}`
+        start, end : datetime | float
+            Range of the samples (datetimes or epoch seconds)
+        chunk : str | float | timedelta, optional
+            Length of the range fetched per request, by default RAW_CHUNK
+
+        Returns
+        -------
+        pd.DataFrame
+            Every matching series in long format (columns: unique_id, ds, y)
+        """
+        start_secs, end_secs = _epoch(start), _epoch(end)
+        chunk_secs = parse_duration(chunk)
+        ends = np.arange(
+            np.floor(start_secs / chunk_secs) * chunk_secs + chunk_secs,
+            np.ceil(end_secs / chunk_secs) * chunk_secs + chunk_secs / 2,
+            chunk_secs,
+        )
+        now = time.time()
+        window = f"{round(chunk_secs * 1000)}ms"
+
+        def fetch_chunk(chunk_end: float) -> list[dict]:
+            params = {"query": f"{selector}[{window}]", "time": chunk_end}
+            return self._cached(chunk_end, now, "query", params)
+
+        df = self._to_frame(self._executor.map(fetch_chunk, ends.tolist()))
+        return _clip(df, start_secs, end_secs)
+
+
+def _clip(df: pd.DataFrame, start: float, end: float) -> pd.DataFrame:
+    """Rows of `df` in `[start, end]` (epoch seconds)."""
+    ds = df["ds"]
+    return df[
+        (ds >= pd.to_datetime(start, unit="s")) & (ds <= pd.to_datetime(end, unit="s"))
+    ].reset_index(drop=True)
+
+
+_fetcher: RangeFetcher | None = None
+
+
+def default_fetcher() -> RangeFetcher:
+    """Shared fetcher (and chunk cache) of PROMETHEUS_URL."""
+    global _fetcher
+    if _fetcher is None:
+        _fetcher = RangeFetcher(cache=ChunkCache())
+    return _fetcher
+
+
+def fetch_range(
+    query: str,
+    start: datetime | float,
+    end: datetime | float,
+    step: str | float | timedelta,
+) -> pd.DataFrame:
+    """`RangeFetcher.fetch` on the `default_fetcher`."""
+    return default_fetcher().fetch(query, start, end, step)
+
+
+def fetch_raw(
+    selector: str, start: datetime | float, end: datetime | float
+) -> pd.DataFrame:
+    """`RangeFetcher.fetch_raw` on the `default_fetcher`."""
+    return default_fetcher().fetch_raw(selector, start, end)
+
+
+def get_metric(query: str, minutes: float = 10, step: str = "15s") -> pd.DataFrame:
+    """Fetch metric data over the last `minutes`
 
     Parameters
     ----------
     query : str
         PromQL query to fetch the metric data
+    minutes : float, optional
+        Length of the time range, by default 10
+    step : str, optional
+        The time interval between data points, by default "15s"
 
     Returns
     -------
     pd.DataFrame
-        The metric data in a DataFrame format (columns: ds, metric_name)
+        Every matching series in long format (columns: unique_id, ds, y)
     """
-    result = prom.get_metric_range_data(
-        query,
-        start_time=start_time,
-        end_time=end_time,
-        chunk_size=timedelta(minutes=10),
-    )
+    end_time = datetime.now()
+    return fetch_range(query, end_time - timedelta(minutes=minutes), end_time, step)
 
-    metric_name = result[0].get("metric").get("__name__")
-    metric = pd.DataFrame(result[0].get("values"), columns=["ds", metric_name])
-    metric["ds"] = pd.to_datetime(metric["ds"], unit="s")
-    return metric
 
-
-def get_average_metric(query: str, step: str) -> pd.DataFrame:
+def get_average_metric(query: str, step: str, minutes: float = 10) -> pd.DataFrame:
     """Fetch the average for the last N seconds (from query), at `step` intervals
 
     Parameters
@@ -47,21 +393,18 @@ def get_average_metric(query: str, step: str) -> pd.DataFrame:
         PromQL query to fetch the average metric data
     step : str
         The time interval between data points, e.g. 60s, 1m, etc.
+    minutes : float, optional
+        Length of the time range, by default 10
 
     Returns
     -------
     pd.DataFrame
-        The average metric data in a DataFrame format (columns: ds, avg)
+        The average metric data in a DataFrame format (columns: unique_id, ds, avg)
     """
-    result = prom.custom_query_range(
-        query=query, start_time=start_time, end_time=end_time, step=step
-    )
-    metric_avg = pd.DataFrame(result[0].get("values"), columns=["ds", "avg"])
-    metric_avg["ds"] = pd.to_datetime(metric_avg["ds"], unit="s")
-    return metric_avg
+    return get_metric(query, minutes, step).rename(columns={"y": "avg"})
 
 
-if __name__ == "__main__":
+def main():
     # Parse command line arguments
     parser = argparse.ArgumentParser(
         description="Fetch Prometheus metrics with a given prefix."
@@ -93,3 +436,7 @@ if __name__ == "__main__":
     print(f"Average Query: {query}")
     metric_avg = get_average_metric(query, step="60s")
     print(metric_avg)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+"""
+Client-side evaluation of PromQL range functions (`<func>_over_time`, `rate`) over raw
+samples, e.g. from `prometheus_read_metrics.fetch_raw`.
+
+Every evaluation time `t` of a grid aligned to `step` covers the samples in
+`(t - window, t]`, as in Prometheus. Window bounds are found with `searchsorted`, so
+sweeping many windows over the same samples needs a single fetch.
+"""
+
+from collections.abc import Iterable
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+from open_telemetry_test.prometheus.prometheus_read_metrics import parse_duration
+
+Duration = str | float | timedelta
+
+
+def _epoch(t) -> float:
+    return float(t) if isinstance(t, (int, float)) else pd.Timestamp(t).timestamp()
+
+
+def _bounds(ts: np.ndarray, t: np.ndarray, window: float):
+    lo = np.searchsorted(ts, t - window, side="right")
+    hi = np.searchsorted(ts, t, side="right")
+    return lo, hi
+
+
+def _reduce(ufunc: np.ufunc, values: np.ndarray, lo, hi) -> np.ndarray:
+    # Even positions of reduceat over interleaved (lo, hi) reduce values[lo:hi]
+    padded = np.append(values, np.nan)
+    indices = np.column_stack([lo, hi]).ravel()
+    out = ufunc.reduceat(padded, indices)[::2]
+    return np.where(hi > lo, out, np.nan)
+
+
+def _padded(values: np.ndarray, lo, hi) -> np.ndarray:
+    """Windows as the rows of a matrix, padded with nan."""
+    count = hi - lo
+    width = max(int(count.max(initial=0)), 1)
+    index = lo[:, None] + np.arange(width)
+    padded = np.append(values, np.nan)
+    return np.where(index < hi[:, None], padded[np.minimum(index, len(values))], np.nan)
+
+
+def _rate(ts: np.ndarray, values: np.ndarray, t: np.ndarray, window: float, lo, hi):
+    """Per-second increase of a counter, extrapolated as Prometheus' `rate`."""
+    # Counter resets: add the value before every drop to the later samples
+    drops = np.zeros(len(values))
+    drops[1:] = np.where(values[1:] < values[:-1], values[:-1], 0)
+    adjusted = values + np.cumsum(drops)
+
+    valid = hi - lo >= 2
+    first, last = lo[valid], hi[valid] - 1
+    increase = adjusted[last] - adjusted[first]
+    sampled = ts[last] - ts[first]
+    average = sampled / (hi[valid] - lo[valid] - 1)
+    to_start = ts[first] - (t[valid] - window)
+    to_end = t[valid] - ts[last]
+    # A counter can not be extrapolated below zero
+    with np.errstate(divide="ignore", invalid="ignore"):
+        to_zero = sampled * values[first] / increase
+    to_start = np.where((increase > 0) & (to_zero < to_start), to_zero, to_start)
+    threshold = average * 1.1
+    extrapolated = (
+        sampled
+        + np.where(to_start < threshold, to_start, average / 2)
+        + np.where(to_end < threshold, to_end, average / 2)
+    )
+    out = np.full(len(t), np.nan)
+    out[valid] = increase * extrapolated / sampled / window
+    return out
+
+
+FUNCTIONS = (
+    "avg_over_time",
+    "min_over_time",
+    "max_over_time",
+    "sum_over_time",
+    "count_over_time",
+    "quantile_over_time",
+    "rate",
+    "increase",
+)
+
+
+def evaluate(
+    func: str,
+    ts: np.ndarray,
+    values: np.ndarray,
+    t: np.ndarray,
+    window: float,
+    q: float | None = None,
+) -> np.ndarray:
+    """Evaluate a range function of a single series at the times `t`.
+
+    Parameters
+    ----------
+    func : str
+        One of FUNCTIONS
+    ts : np.ndarray
+        Sorted sample times (epoch seconds)
+    values : np.ndarray
+        Sample values
+    t : np.ndarray
+        Evaluation times (epoch seconds)
+    window : float
+        Range of every evaluation in seconds
+    q : float | None, optional
+        Quantile (0 to 1), only for `quantile_over_time`
+
+    Returns
+    -------
+    np.ndarray
+        The value at every evaluation time (nan for empty windows)
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if len(t) == 0:
+        return np.empty(0)
+    lo, hi = _bounds(ts, t, window)
+    count = (hi - lo).astype(np.float64)
+
+    if func in ("sum_over_time", "avg_over_time"):
+        cumsum = np.concatenate([[0.0], np.cumsum(values)])
+        total = cumsum[hi] - cumsum[lo]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            out = total / count if func == "avg_over_time" else total
+        return np.where(count > 0, out, np.nan)
+    if func == "count_over_time":
+        return np.where(count > 0, count, np.nan)
+    if func == "min_over_time":
+        return _reduce(np.minimum, values, lo, hi)
+    if func == "max_over_time":
+        return _reduce(np.maximum, values, lo, hi)
+    if func == "quantile_over_time":
+        if q is None:
+            raise ValueError("quantile_over_time needs a quantile `q`")
+        out = np.full(len(t), np.nan)
+        valid = count > 0
+        if valid.any():
+            out[valid] = np.nanquantile(
+                _padded(values, lo[valid], hi[valid]), q, axis=1
+            )
+        return out
+    if func in ("rate", "increase"):
+        rate = _rate(ts, values, t, window, lo, hi)
+        return rate * window if func == "increase" else rate
+    raise ValueError(f"Unknown range function {func!r}, expected one of {FUNCTIONS}")
+
+
+def over_time(
+    df: pd.DataFrame,
+    func: str,
+    window: Duration,
+    step: Duration,
+    q: float | None = None,
+    start=None,
+    end=None,
+) -> pd.DataFrame:
+    """Evaluate a range function of every series of raw samples.
+
+    Equivalent to the range query `func(<selector>[window])` at every `step`.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Raw samples in long format (columns: unique_id, ds, y)
+    func : str
+        One of FUNCTIONS
+    window : str | float | timedelta
+        Range of every evaluation, e.g. "30s"
+    step : str | float | timedelta
+        Interval between evaluations, e.g. "60s"
+    q : float | None, optional
+        Quantile (0 to 1), only for `quantile_over_time`
+    start, end : optional
+        Range of the evaluations, by default the range of the samples
+
+    Returns
+    -------
+    pd.DataFrame
+        Long format (columns: unique_id, ds, y)
+    """
+    return sweep(df, func, [window], step, q, start, end).drop(columns="window")
+
+
+def sweep(
+    df: pd.DataFrame,
+    func: str,
+    windows: Iterable[Duration],
+    step: Duration,
+    q: float | None = None,
+    start=None,
+    end=None,
+) -> pd.DataFrame:
+    """Evaluate a range function for several windows over the same samples.
+
+    Parameters are as for `over_time`, with the list of `windows` to evaluate.
+
+    Returns
+    -------
+    pd.DataFrame
+        Long format (columns: unique_id, window, ds, y), where `window` is the
+        window as given
+    """
+    columns = ["unique_id", "window", "ds", "y"]
+    if df.empty:
+        # No samples: no series (and no range to derive from them)
+        return pd.DataFrame(columns=columns)
+    step_secs = parse_duration(step)
+    windows = list(windows)
+    ds = df["ds"].to_numpy("datetime64[ns]").astype(np.int64) / 1e9
+    first = ds.min() if start is None else _epoch(start)
+    last = ds.max() if end is None else _epoch(end)
+    t = np.arange(np.ceil(first / step_secs), np.floor(last / step_secs) + 1)
+    t *= step_secs
+
+    frames = []
+    for unique_id, index in df.groupby("unique_id", sort=False).indices.items():
+        order = index[np.argsort(ds[index], kind="stable")]
+        ts, values = ds[order], df["y"].to_numpy(np.float64)[order]
+        for window in windows:
+            y = evaluate(func, ts, values, t, parse_duration(window), q)
+            frames.append(
+                pd.DataFrame(
+                    {
+                        "unique_id": unique_id,
+                        "window": str(window),
+                        "ds": pd.to_datetime(t, unit="s"),
+                        "y": y,
+                    }
+                )
+            )
+    if not frames:
+        return pd.DataFrame(columns=columns)
+    return pd.concat(frames, ignore_index=True)
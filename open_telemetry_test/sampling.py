@@ -0,0 +1,195 @@
+"""
+Trace sampling that keeps the exported span rate near a budget.
+
+`AdaptiveRateSampler` samples traces with a probability adjusted to the observed
+rate of spans, so that about `target_sps` spans per second are exported whatever the
+traffic. With `record_unsampled`, unsampled spans are still recorded (not
+exported), so that `KeepErrorsAndRareValues` can keep the traces of the interesting
+ones: errors, and spans with a rare value of attributes such as `roll.value` or
+`unique_id`.
+
+`setup_telemetry` wires both with `OTEL_TRACES_SAMPLER=adaptive_rate`
+(`OTEL_TRACES_SAMPLER_ARG` is the budget in spans per second). The sampler is also
+registered as an `opentelemetry_traces_sampler` entry point for
+`opentelemetry-instrument`, which samples by rate but can not keep errors.
+"""
+
+import threading
+import time
+from collections import Counter
+from collections.abc import Sequence
+
+from opentelemetry.context import Context
+from opentelemetry.sdk.trace import ReadableSpan
+from opentelemetry.sdk.trace.sampling import (
+    Decision,
+    Sampler,
+    SamplingResult,
+    TraceIdRatioBased,
+)
+from opentelemetry.trace import Link, SpanKind, StatusCode, get_current_span
+from opentelemetry.trace.span import TraceState
+from opentelemetry.util.types import Attributes
+
+DEFAULT_TARGET_SPS = 10.0
+DEFAULT_RARE_KEYS = ("roll.value", "unique_id")
+
+
+class AdaptiveRateSampler(Sampler):
+    """Sample about `target_sps` spans per second.
+
+    Decisions are taken for whole traces: on root spans, from the trace id only
+    like TraceIdRatioBased, and child spans follow their parent. The rate of all
+    spans (children included) is measured over windows of `window_secs` and
+    smoothed (exponentially, by `smoothing`); the probability of the next window
+    is `target_sps / rate` (at most 1), so that traces of many spans count for
+    as many spans in the budget.
+
+    Parameters
+    ----------
+    target_sps : float, optional
+        Spans to sample per second, by default 10
+    window_secs : float, optional
+        Length of the rate measurement windows, by default 1
+    smoothing : float, optional
+        Weight of the last window in the rate estimate, by default 0.5
+    record_unsampled : bool, optional
+        Record the unsampled spans (for a span processor that keeps some of them)
+        rather than dropping them, by default False
+    """
+
+    def __init__(
+        self,
+        target_sps: float = DEFAULT_TARGET_SPS,
+        window_secs: float = 1.0,
+        smoothing: float = 0.5,
+        record_unsampled: bool = False,
+    ):
+        if target_sps <= 0:
+            raise ValueError("target_sps must be positive")
+        self.target_sps = target_sps
+        self.window_secs = window_secs
+        self.smoothing = smoothing
+        self.record_unsampled = record_unsampled
+        self.rate: float | None = None
+        self.probability = 1.0
+        self._bound = TraceIdRatioBased.get_bound_for_rate(1.0)
+        self._count = 0
+        self._window_start = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _observe(self) -> int:
+        """Count a span; return the sampling bound of the current window."""
+        with self._lock:
+            self._count += 1
+            now = time.monotonic()
+            elapsed = now - self._window_start
+            if elapsed >= self.window_secs:
+                rate = self._count / elapsed
+                self.rate = (
+                    rate
+                    if self.rate is None
+                    else self.smoothing * rate + (1 - self.smoothing) * self.rate
+                )
+                self.probability = min(1.0, self.target_sps / self.rate)
+                self._bound = TraceIdRatioBased.get_bound_for_rate(self.probability)
+                self._count = 0
+                self._window_start = now
+            return self._bound
+
+    def should_sample(
+        self,
+        parent_context: Context | None,
+        trace_id: int,
+        name: str,
+        kind: SpanKind | None = None,
+        attributes: Attributes = None,
+        links: Sequence[Link] | None = None,
+        trace_state: TraceState | None = None,
+    ) -> SamplingResult:
+        parent = get_current_span(parent_context).get_span_context()
+        bound = self._observe()
+        if parent.is_valid:
+            sampled = parent.trace_flags.sampled
+            trace_state = parent.trace_state
+        else:
+            sampled = trace_id & TraceIdRatioBased.TRACE_ID_LIMIT < bound
+        if sampled:
+            decision = Decision.RECORD_AND_SAMPLE
+        elif self.record_unsampled:
+            decision = Decision.RECORD_ONLY
+        else:
+            decision = Decision.DROP
+        return SamplingResult(decision, attributes, trace_state)
+
+    def get_description(self) -> str:
+        return f"AdaptiveRateSampler{{{self.target_sps:g}/s}}"
+
+
+def adaptive_rate_sampler(
+    arg: str | float | None = None, record_unsampled: bool = False
+) -> AdaptiveRateSampler:
+    """Entry point factory: `arg` (OTEL_TRACES_SAMPLER_ARG) is the spans/s budget."""
+    return AdaptiveRateSampler(
+        float(arg) if arg else DEFAULT_TARGET_SPS, record_unsampled=record_unsampled
+    )
+
+
+class KeepErrorsAndRareValues:
+    """Tell whether an unsampled span (and its trace) should be exported anyway.
+
+    Keeps spans with an error status or an exception event, and spans with a rare
+    value of one of `keys`: seen less than `rare_ratio` times as often as the
+    average value of that key, e.g. a face of a loaded die or a series that only
+    shows up now and then. Counts are halved every `memory` spans, so that they
+    follow the traffic.
+
+    Parameters
+    ----------
+    keys : Sequence[str], optional
+        Attributes whose rare values are kept, by default ("roll.value", "unique_id")
+    rare_ratio : float, optional
+        Frequency, relative to the average value, below which a value is rare, by
+        default 0.1
+    memory : int, optional
+        Spans per key after which the counts are halved, by default 10000
+    """
+
+    def __init__(
+        self,
+        keys: Sequence[str] = DEFAULT_RARE_KEYS,
+        rare_ratio: float = 0.1,
+        memory: int = 10000,
+    ):
+        self.keys = tuple(keys)
+        self.rare_ratio = rare_ratio
+        self.memory = memory
+        self._counts: dict[str, Counter] = {key: Counter() for key in self.keys}
+        self._totals = dict.fromkeys(self.keys, 0)
+        self._lock = threading.Lock()
+
+    def _rare(self, key: str, value: object) -> bool:
+        counts = self._counts[key]
+        with self._lock:
+            counts[value] += 1
+            self._totals[key] += 1
+            total = self._totals[key]
+            rare = counts[value] < self.rare_ratio * total / len(counts)
+            if total >= self.memory:
+                for seen in list(counts):
+                    counts[seen] //= 2
+                    if not counts[seen]:
+                        del counts[seen]
+                self._totals[key] = sum(counts.values())
+        return rare
+
+    def __call__(self, span: ReadableSpan) -> bool:
+        keep = span.status.status_code is StatusCode.ERROR or any(
+            event.name == "exception" for event in span.events
+        )
+        attributes = span.attributes or {}
+        for key in self.keys:
+            if key in attributes:
+                # Count every value, even once the span is known to be kept
+                keep = self._rare(key, attributes[key]) or keep
+        return keep
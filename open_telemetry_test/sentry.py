@@ -1,24 +1,44 @@
+"""
+Anomaly detection of the Sentry transaction durations of a project, with TimeGPT.
+
+The 5 minute series of each project is kept in a local state store
+(`SENTRY_STATE_DIR`). Each run only requests the buckets from the last stored one
+(the watermark, which may have been incomplete) on, merges them and trims the series
+to the detection horizon. The projects (`SENTRY_PROJECT_SLUGS`) are fetched
+concurrently into one long frame, and detected in a single call.
+
+    uv run python -m open_telemetry_test sentry
+"""
+
+import json
 import os
+import threading
+from collections.abc import Sequence
+from concurrent.futures import ThreadPoolExecutor
 
 import pandas as pd
 import requests  # type: ignore[import]
-import resend
-from dotenv import load_dotenv
-from nixtla import NixtlaClient
-from utilsforecast.preprocessing import fill_gaps
-
-load_dotenv()
 
-nixtla_client = NixtlaClient(
-    # defaults to os.environ.get("NIXTLA_API_KEY")
-    # api_key = "",
-)
-resend.api_key = os.getenv("RESEND_API_KEY")
+from open_telemetry_test.alerts import Alert, AlertDispatcher, default_transport
 
 # Sentry Settings ----
+SENTRY_API_URL = os.getenv("SENTRY_API_URL", "https://sentry.io/api/0").rstrip("/")
 SENTRY_AUTH_TOKEN = os.getenv("SENTRY_AUTH_TOKEN")
 ORG_SLUG = os.getenv("SENTRY_ORG_SLUG")
 PROJECT_SLUG = os.getenv("SENTRY_PROJECT_SLUG")
+# Comma separated, by default the single SENTRY_PROJECT_SLUG
+PROJECT_SLUGS = [
+    slug.strip()
+    for slug in os.getenv("SENTRY_PROJECT_SLUGS", PROJECT_SLUG or "").split(",")
+    if slug.strip()
+]
+MAX_WORKERS = int(os.getenv("SENTRY_MAX_WORKERS", "8"))
+STATE_DIR = os.getenv(
+    "SENTRY_STATE_DIR", os.path.join(os.path.dirname(__file__), "sentry_state")
+)
+# Series older than this are dropped
+HORIZON = pd.Timedelta(os.getenv("SENTRY_HORIZON", "1D"))
+REQUEST_TIMEOUT = 30
 
 # TIMEGPT Settings ----
 FREQ = "5min"
@@ -29,92 +49,252 @@ TARGET_COL = "event_count"
 current_time = pd.Timestamp.now(tz="UTC").floor(FREQ).strftime("%Y-%m-%d %H:%M")
 
 
-def get_sentry_events_data() -> pd.DataFrame:
-    """Get the sentry events data from the Sentry API.
+class SeriesStore:
+    """Fetched series per project, one JSON file each.
+
+    Parameters
+    ----------
+    directory : str, optional
+        Directory of the state files, by default STATE_DIR
+    """
+
+    def __init__(self, directory: str = STATE_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, project: str) -> str:
+        return os.path.join(self.directory, f"{project}.json")
+
+    def load(self, project: str) -> pd.DataFrame:
+        """Stored series of `project` (TIME_COL, TARGET_COL), empty if none."""
+        try:
+            with open(self._path(project)) as f:
+                state = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            state = {"timestamps": [], "values": []}
+        return pd.DataFrame(
+            {
+                TIME_COL: pd.to_datetime(state["timestamps"], unit="s"),
+                TARGET_COL: pd.Series(state["values"], dtype=float),
+            }
+        )
+
+    def save(self, project: str, series: pd.DataFrame) -> None:
+        path = self._path(project)
+        state = {
+            "timestamps": (
+                (series[TIME_COL] - pd.Timestamp(0)) // pd.Timedelta("1s")
+            ).tolist(),
+            "values": series[TARGET_COL].tolist(),
+        }
+        # Write then rename, so that readers never see a partial state
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp, path)
+
+
+def fetch_events_stats(
+    project: str,
+    start: pd.Timestamp,
+    end: pd.Timestamp,
+    session: requests.Session | None = None,
+) -> pd.DataFrame:
+    """Average transaction duration of `project` per 5 minutes from `start` to `end`.
 
     Refer to https://github.com/ngupta23/Data-Science-Knowlege-Base/issues/212
     for details on various endpoints and their usage.
+    """
+    session = session or requests.Session()
+    response = session.get(
+        f"{SENTRY_API_URL}/organizations/{ORG_SLUG}/events-stats/",
+        params={
+            "query": f"project:{project}",
+            "transaction": "/forecast",
+            "interval": "5m",
+            "start": start.strftime("%Y-%m-%dT%H:%M:%S"),
+            "end": end.strftime("%Y-%m-%dT%H:%M:%S"),
+            "yAxis": "avg(transaction.duration)",
+        },
+        headers={"Authorization": f"Bearer {SENTRY_AUTH_TOKEN}"},
+        timeout=REQUEST_TIMEOUT,
+    )
+    response.raise_for_status()
+    # [[<bucket start, epoch seconds>, [{"count": <value>}]], ...]
+    data = response.json().get("data", [])
+    return pd.DataFrame(
+        {
+            TIME_COL: pd.to_datetime([bucket for bucket, _ in data], unit="s"),
+            TARGET_COL: pd.Series(
+                [sum(v.get("count") or 0 for v in values) for _, values in data],
+                dtype=float,
+            ),
+        }
+    )
+
+
+def get_sentry_events_data(
+    project: str | None = None,
+    store: SeriesStore | None = None,
+    now: pd.Timestamp | None = None,
+    session: requests.Session | None = None,
+) -> pd.DataFrame:
+    """Series of `project` over the horizon, updated from the Sentry API.
+
+    Only the buckets from the stored watermark on are requested.
+
+    Parameters
+    ----------
+    project : str | None, optional
+        Project slug, by default SENTRY_PROJECT_SLUG
+    store : SeriesStore | None, optional
+        State store, by default one in STATE_DIR
+    now : pd.Timestamp | None, optional
+        End of the series (UTC, naive), by default the current time
+    session : requests.Session | None, optional
+        Session of the requests
 
     Returns
     -------
     pd.DataFrame
-        Sentry events data
+        Sentry events data (ID_COL, TIME_COL, TARGET_COL)
     """
-    headers = {
-        "Authorization": f"Bearer {SENTRY_AUTH_TOKEN}",
-        "Content-Type": "application/json",
-    }
-
-    # category = error, span_indexed, transaction_indexed, span, transaction
-    # url = (
-    #     f"https://sentry.io/api/0/organizations/{ORG_SLUG}/stats_v2/"
-    #     "?query="
-    #     f"project:{PROJECT_SLUG}"
-    #     "&interval=5m"
-    #     "&statsPeriod=1d"
-    #     "&groupBy=category"
-    #     "&category=error"
-    #     "&field=sum(quantity)"
-    # )
-
-    # Does not take interval as a parameter (returns single average value)
-    url = (
-        f"https://sentry.io/api/0/organizations/{ORG_SLUG}/events/"
-        "?query="
-        f"project:{PROJECT_SLUG}"
-        "&transaction=/forecast"
-        "&statsPeriod=1d"
-        "&field=avg(transaction.duration)"
-    )
-    response = requests.get(url, headers=headers)
-    print(response.json().get("data"))
-
-    # Returns the average transaction duration for the last 24 hours in 5 minute
-    # intervals. Average value is returned as a key called "count"
-    url = (
-        f"https://sentry.io/api/0/organizations/{ORG_SLUG}/events-stats/"
-        "?query="
-        f"project:{PROJECT_SLUG}"
-        "&transaction=/forecast"
-        "&interval=5m"
-        "&statsPeriod=1d"
-        "&yAxis=avg(transaction.duration)"
+    project = project or PROJECT_SLUG or ""
+    store = store or SeriesStore()
+    now = now if now is not None else pd.Timestamp.now(tz="UTC").tz_localize(None)
+    horizon_start = (now - HORIZON).floor(FREQ)
+
+    stored = store.load(project)
+    stored = stored[stored[TIME_COL] >= horizon_start]
+    # The last stored bucket may have been incomplete: fetch it again
+    watermark = stored[TIME_COL].max() if len(stored) else horizon_start
+    fetched = fetch_events_stats(project, watermark, now, session)
+
+    series = (
+        pd.concat([stored, fetched], ignore_index=True)
+        .drop_duplicates(TIME_COL, keep="last")
+        .sort_values(TIME_COL, ignore_index=True)
     )
-    response = requests.get(url, headers=headers)
-    print(response.json().get("data"))
+    series = series[series[TIME_COL] >= horizon_start].reset_index(drop=True)
+    store.save(project, series)
+    return series.assign(**{ID_COL: project})[[ID_COL, TIME_COL, TARGET_COL]]
+
+
+def get_projects_data(
+    projects: Sequence[str] | None = None,
+    store: SeriesStore | None = None,
+    now: pd.Timestamp | None = None,
+    max_workers: int = MAX_WORKERS,
+) -> pd.DataFrame:
+    """Series of several projects, fetched concurrently, as one long frame.
+
+    A project whose request fails is reported and left out.
+
+    Parameters
+    ----------
+    projects : Sequence[str] | None, optional
+        Project slugs, by default SENTRY_PROJECT_SLUGS
+    store : SeriesStore | None, optional
+        State store, by default one in STATE_DIR
+    now : pd.Timestamp | None, optional
+        End of the series (UTC, naive), by default the current time
+    max_workers : int, optional
+        Requests in flight, by default SENTRY_MAX_WORKERS
 
-    # Process events data ----
-    events = pd.DataFrame(
+    Returns
+    -------
+    pd.DataFrame
+        Sentry events data (ID_COL, TIME_COL, TARGET_COL) of every project, on a
+        common 5 minute grid (missing buckets are 0)
+    """
+    projects = PROJECT_SLUGS if projects is None else projects
+    store = store or SeriesStore()
+    now = now if now is not None else pd.Timestamp.now(tz="UTC").tz_localize(None)
+    session = requests.Session()
+    session.mount("https://", requests.adapters.HTTPAdapter(pool_maxsize=max_workers))
+    session.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=max_workers))
+
+    def fetch(project: str) -> pd.DataFrame | None:
+        try:
+            return get_sentry_events_data(project, store, now, session)
+        except requests.RequestException as e:
+            print(f"Skipping project {project}: {e}")
+            return None
+
+    with ThreadPoolExecutor(max_workers) as pool:
+        frames = [frame for frame in pool.map(fetch, projects) if frame is not None]
+    events = pd.concat(frames, ignore_index=True) if frames else _empty_events()
+    start = (now - HORIZON).floor(FREQ)
+    return fill_grid(events, start=start, end=now.floor(FREQ))
+
+
+def _empty_events() -> pd.DataFrame:
+    return pd.DataFrame(
         {
-            TIME_COL: response.json().get("intervals"),
-            TARGET_COL: response.json().get("groups")[0]["series"]["sum(quantity)"],
+            ID_COL: pd.Series(dtype=str),
+            TIME_COL: pd.Series(dtype="datetime64[ns]"),
+            TARGET_COL: pd.Series(dtype=float),
         }
     )
-    events[TIME_COL] = pd.to_datetime(events[TIME_COL])
-    events[ID_COL] = PROJECT_SLUG
 
-    return events
+
+def fill_grid(
+    events: pd.DataFrame,
+    start: pd.Timestamp | None = None,
+    end: str | pd.Timestamp | None = None,
+) -> pd.DataFrame:
+    """Reindex the long frame `events` on every (ID_COL, FREQ bucket) pair.
+
+    Buckets from `start` (by default the earliest bucket of any series) to `end`
+    (by default the current time); missing ones are 0.
+    """
+    times = events[TIME_COL]
+    last = pd.Timestamp(current_time if end is None else end)
+    if times.dt.tz is not None and last.tz is None:
+        last = last.tz_localize("UTC")
+    if start is None:
+        start = times.min() if len(times) else last
+    grid = pd.MultiIndex.from_product(
+        [
+            pd.unique(events[ID_COL]),
+            pd.date_range(pd.Timestamp(start).floor(FREQ), last, freq=FREQ),
+        ],
+        names=[ID_COL, TIME_COL],
+    )
+    return (
+        events.set_index([ID_COL, TIME_COL])[TARGET_COL]
+        .reindex(grid, fill_value=0)
+        .reset_index()
+    )
 
 
 def extract_error_data(events: pd.DataFrame) -> pd.DataFrame:
-    error_events = events.query("`event.type` == 'error'")
+    """Error counts per ID_COL and FREQ bucket, up to the current time."""
+    error_events = events[events["event.type"] == "error"]
     resampled_events = (
-        error_events.groupby(ID_COL)
-        .resample(FREQ, on=TIME_COL)
+        error_events.groupby(
+            [error_events[ID_COL], error_events[TIME_COL].dt.floor(FREQ)]
+        )
         .size()
+        .rename(TARGET_COL)
         .reset_index()
-        .rename(columns={0: TARGET_COL})
     )
-    resampled_events = fill_gaps(
-        resampled_events,
-        freq=FREQ,
-        time_col=TIME_COL,
+    return fill_grid(resampled_events)
+
+
+def detect(nixtla_client, events: pd.DataFrame) -> pd.DataFrame:
+    """Anomalies of every series of `events`, in one batched call."""
+    return nixtla_client.detect_anomalies_online(
+        events,
         id_col=ID_COL,
-        start="global",
-        end=current_time,
+        time_col=TIME_COL,
+        target_col=TARGET_COL,
+        freq=FREQ,
+        h=1,
+        level=99,
+        detection_size=24,  # last 1 hour
+        threshold_method="univariate",  # Specify the threshold_method as 'univariate'
     )
-    resampled_events[TARGET_COL] = resampled_events[TARGET_COL].fillna(0)
-    return resampled_events
 
 
 def summarize(anomaly_online: pd.DataFrame) -> pd.DataFrame:
@@ -129,48 +309,59 @@ def summarize(anomaly_online: pd.DataFrame) -> pd.DataFrame:
     return anomaly_summary
 
 
-def report_anomalies(anomaly_summary):
+def report_anomalies(anomaly_summary: pd.DataFrame, alerts: AlertDispatcher):
+    """Hand one alert per series with anomalies to `alerts`."""
     # Report anomalies ----
     if anomaly_summary["anomaly"].sum() > 0:
-        html_summary = anomaly_summary.to_html(index=False, border=0, justify="center")
-        params: resend.Emails.SendParams = {
-            "from": os.getenv("EMAIL_FROM"),
-            "to": [os.getenv("EMAIL_TO")],
-            "subject": f"Anomaly Detection Summary | {current_time}",
-            "html": f"""
-                "<html>
-                    <body>
-                        <h2>Anomaly Detection Summary</h2>
-                        {html_summary}
-                    </body>
-                </html>
-                """,
-        }
-        _ = resend.Emails.send(params)
-        print("Email sent successfully!")
+        for row in anomaly_summary.itertuples(index=False):
+            alerts.submit(
+                Alert(
+                    series=str(row[0]),
+                    ts=pd.Timestamp(row.last_time).timestamp(),
+                    value=float(row.last_value),
+                    message=f"{int(row.anomaly)} anomalies",
+                )
+            )
+        print(f"Reported anomalies of {len(anomaly_summary)} series.")
     else:
         print("No anomalies detected.")
 
 
-# Step 1: Retrieve Sentry events ----
-error_events = get_sentry_events_data()
+def main():
+    from dotenv import load_dotenv
 
-# # Step 2: Extract error events ----
-# error_events = extract_error_data(events=events)
+    from open_telemetry_test.timegpt import get_client
 
-# Step 3: Detect anomalies ----
-anomaly_online = nixtla_client.detect_anomalies_online(
-    error_events,
-    id_col=ID_COL,
-    time_col=TIME_COL,
-    target_col=TARGET_COL,
-    freq=FREQ,
-    h=1,
-    level=99,
-    detection_size=24,  # last 1 hour
-    threshold_method="univariate",  # Specify the threshold_method as 'univariate'
-)
+    # When main is called without the dispatcher, for the settings read from here on
+    load_dotenv()
+
+    # NIXTLA_API_KEY
+    nixtla_client = get_client()
+
+    # Step 1: Retrieve Sentry events of every project ----
+    error_events = get_projects_data()
+    if error_events.empty:
+        print("No Sentry data retrieved.")
+        return
+
+    # # Step 2: Extract error events ----
+    # error_events = extract_error_data(events=events)
+
+    # Step 3: Detect anomalies (all projects at once) ----
+    anomaly_online = detect(nixtla_client, error_events)
+
+    # Step 4: Summarize & Report anomalies ----
+    anomaly_summary = summarize(anomaly_online=anomaly_online)
+    alerts = AlertDispatcher(
+        default_transport(), subject=f"Anomaly Detection Summary | {current_time}"
+    )
+    report_anomalies(anomaly_summary=anomaly_summary, alerts=alerts)
+    # Sends the pending alerts
+    alerts.stop()
+
+
+if __name__ == "__main__":
+    # Through the dispatcher, so that the settings read at import include .env
+    from open_telemetry_test.__main__ import run
 
-# Step 4: Summarize & Report anomalies ----
-anomaly_summary = summarize(anomaly_online=anomaly_online)
-report_anomalies(anomaly_summary=anomaly_summary)
+    run("sentry")
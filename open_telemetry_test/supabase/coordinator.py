@@ -0,0 +1,156 @@
+"""
+Batches detection requests from many series into a single (remote) call.
+"""
+
+import threading
+import time
+from collections.abc import Callable
+from concurrent.futures import Future
+
+import pandas as pd
+
+ID_COL = "unique_id"
+
+# Runs detection over a long-format frame (unique_id, ds, y) and returns the result
+# for each series that could be scored
+BatchDetectFn = Callable[[pd.DataFrame], dict]
+
+
+class DetectionCoordinator:
+    """Gather series that are ready for detection and score them in one call.
+
+    Series submitted by any thread are buffered until `max_batch_size` distinct
+    series are pending or `flush_deadline` seconds have passed since the first
+    one was submitted. The batch is then concatenated into one long-format frame
+    keyed by `unique_id`, passed to `detect_fn`, and each caller receives the
+    result for its own series (None if it was not scored).
+
+    Parameters
+    ----------
+    detect_fn : BatchDetectFn
+        Function that scores the long-format frame
+    max_batch_size : int, optional
+        Flush as soon as this many series are pending, by default 64
+    flush_deadline : float, optional
+        Maximum seconds a submitted series waits for others, by default 5.0
+    """
+
+    def __init__(
+        self,
+        detect_fn: BatchDetectFn,
+        max_batch_size: int = 64,
+        flush_deadline: float = 5.0,
+    ):
+        self.detect_fn = detect_fn
+        self.max_batch_size = max_batch_size
+        self.flush_deadline = flush_deadline
+        self._pending: dict[str, tuple[pd.DataFrame, list[Future]]] = {}
+        self._first_submit: float | None = None
+        self._condition = threading.Condition()
+        self._thread: threading.Thread | None = None
+        self._closed = False
+        self._flush = False
+        self._busy = False
+
+    def submit(self, unique_id: str, frame: pd.DataFrame) -> Future:
+        """Queue `frame` (columns ds, y) for detection under `unique_id`.
+
+        If the same series is submitted again before the batch is flushed, the
+        newer frame replaces the older one and both callers get its result.
+        """
+        future: Future = Future()
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("DetectionCoordinator is closed")
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            futures = self._pending.pop(unique_id, (None, []))[1]
+            self._pending[unique_id] = (frame, [*futures, future])
+            if self._first_submit is None:
+                self._first_submit = time.monotonic()
+            self._condition.notify_all()
+        return future
+
+    def detect(self, unique_id: str, frame: pd.DataFrame, timeout=None):
+        """Submit `frame` and block until its result is available."""
+        return self.submit(unique_id, frame).result(timeout=timeout)
+
+    def flush(self, wait: bool = False) -> None:
+        """Send what is pending now, without waiting for more series.
+
+        For submitters that know no other series is coming, e.g. at the end of a
+        scrape. With `wait`, block until every submitted series has its result and
+        the callbacks of its futures have run.
+        """
+        with self._condition:
+            while True:
+                if self._pending:
+                    # Callbacks of a batch may submit again
+                    self._flush = True
+                    self._condition.notify_all()
+                if not (wait and (self._pending or self._busy)):
+                    return
+                self._condition.wait()
+
+    def close(self) -> None:
+        """Flush whatever is pending and stop the background thread."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _take_batch(self) -> dict[str, tuple[pd.DataFrame, list[Future]]] | None:
+        with self._condition:
+            while True:
+                timeout = None
+                if self._first_submit is not None:
+                    elapsed = time.monotonic() - self._first_submit
+                    timeout = self.flush_deadline - elapsed
+                if self._pending and (
+                    self._closed
+                    or self._flush
+                    or len(self._pending) >= self.max_batch_size
+                    or (timeout is not None and timeout <= 0)
+                ):
+                    break
+                if self._closed:
+                    return None
+                self._condition.wait(timeout)
+
+            batch = dict(list(self._pending.items())[: self.max_batch_size])
+            for unique_id in batch:
+                del self._pending[unique_id]
+            self._first_submit = time.monotonic() if self._pending else None
+            self._flush = self._flush and bool(self._pending)
+            self._busy = True
+            return batch
+
+    def _run(self) -> None:
+        while (batch := self._take_batch()) is not None:
+            try:
+                self._detect(batch)
+            finally:
+                with self._condition:
+                    self._busy = False
+                    self._condition.notify_all()
+
+    def _detect(self, batch: dict[str, tuple[pd.DataFrame, list[Future]]]) -> None:
+        try:
+            frame = pd.concat(
+                [
+                    df.assign(**{ID_COL: unique_id})
+                    for unique_id, (df, _) in batch.items()
+                ],
+                ignore_index=True,
+            )
+            results = self.detect_fn(frame)
+        except Exception as e:
+            for _, futures in batch.values():
+                for future in futures:
+                    future.set_exception(e)
+            return
+        for unique_id, (_, futures) in batch.items():
+            for future in futures:
+                future.set_result(results.get(unique_id))
@@ -1,68 +1,220 @@
+import functools
+import json
 import os
+import time
 
-import pandas as pd
-import plotly.graph_objects as go
 import uvicorn
-from fastapi import FastAPI
+from fastapi import FastAPI, Query, Request, Response
 from fastapi.responses import HTMLResponse
+from plotly.offline import get_plotlyjs, get_plotlyjs_version
+
+from open_telemetry_test.supabase.derived import DerivedMetrics
+from open_telemetry_test.supabase.downsample import lttb, minmax
+from open_telemetry_test.supabase.rollup import (
+    DEFAULT_TIERS,
+    ROLLUP_DIR,
+    ROLLUP_DTYPE,
+    mean,
+    select_tier,
+)
+from open_telemetry_test.supabase.store import STORE_DIR, MetricStore
 
 app = FastAPI()
 
+# Upper bound of the per-series point budget (the budget is the plot width in px)
+MAX_POINTS = 4000
+DOWNSAMPLERS = {"lttb": lttb, "minmax": minmax}
+REFRESH_SECS = 60
 
-def load_metrics(file):
-    df = pd.read_csv(file)
-    df["ds"] = pd.to_datetime(df["ds"])
-    return df
+# Versioned so that browsers can cache it forever
+PLOTLY_JS_PATH = f"/static/plotly-{get_plotlyjs_version()}.min.js"
 
+TITLE = "System Metrics (Resampled)"
+# Height of the subplot of every unit
+SUBPLOT_HEIGHT = 350
+UNIT_TITLES = {"%": "Percent", "B/s": "Bytes/s", "/s": "Per second", "": "Value"}
 
-@app.get("/", response_class=HTMLResponse)
-def dashboard():
-    try:
-        BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-        cpu = load_metrics(os.path.join(BASE_DIR, "cpu_metrics.csv"))
-        mem = load_metrics(os.path.join(BASE_DIR, "memory_metrics.csv"))
-    except Exception as e:
-        return f"<h1>Error loading metrics: {e}</h1>"
-
-    fig = go.Figure()
-    fig.add_trace(
-        go.Scatter(
-            x=cpu["ds"],
-            y=cpu["y"],
-            name="CPU Usage",
-            line=dict(color="blue"),
-        )
-    )
-    fig.add_trace(
-        go.Scatter(
-            x=mem["ds"],
-            y=mem["y"],
-            name="Memory Usage",
-            line=dict(color="green"),
+# Units of the series written by the detector
+registry = DerivedMetrics()
+
+# The page is static: data is fetched from /data and only re-drawn when it changed
+PAGE = f"""
+<html>
+<head>
+    <title>System Dashboard</title>
+    <script src="{PLOTLY_JS_PATH}"></script>
+</head>
+<body>
+    <h1>System Monitoring Dashboard</h1>
+    <div id="plot"></div>
+    <script>
+        const plot = document.getElementById("plot");
+        let etag = null;
+        async function refresh() {{
+            const params = new URLSearchParams(window.location.search);
+            params.set("width", plot.clientWidth || window.innerWidth);
+            const headers = etag ? {{"If-None-Match": etag}} : {{}};
+            const response = await fetch(`/data?${{params}}`, {{headers}});
+            if (response.status === 200) {{
+                etag = response.headers.get("ETag");
+                const data = await response.json();
+                Plotly.react(plot, data.traces, data.layout);
+            }}
+        }}
+        refresh();
+        setInterval(refresh, {REFRESH_SECS * 1000});
+    </script>
+</body>
+</html>
+"""
+
+
+@functools.lru_cache(maxsize=1)
+def _plotly_js() -> bytes:
+    return get_plotlyjs().encode()
+
+
+def source_tier(points: int, start: int | None) -> str | None:
+    """Rollup tier to draw the range from `start` with `points` from.
+
+    None for the 1 minute series; ranges too long to draw from them are read from
+    the coarsest rollup tier that is still detailed enough for `points`.
+    """
+    if start is None:
+        return None
+    now = int(time.time())
+    tier = select_tier(DEFAULT_TIERS, start, now, points, now)
+    if tier == min(DEFAULT_TIERS, key=lambda tier: tier.width):
+        return None
+    return tier.name
+
+
+def source_store(tier: str | None) -> MetricStore:
+    if tier is None:
+        return MetricStore(STORE_DIR)
+    return MetricStore(os.path.join(ROLLUP_DIR, tier), ROLLUP_DTYPE)
+
+
+def layout(units: list[str]) -> dict:
+    """Plotly layout with one subplot (y axis) per unit, sharing the time axis."""
+    gap = 0.05
+    height = (1 - gap * (len(units) - 1)) / max(len(units), 1)
+    result: dict = {
+        "title": {"text": TITLE},
+        # Drawn under the bottom subplot
+        "xaxis": {
+            "title": {"text": "Time"},
+            "type": "date",
+            "anchor": _axis(max(len(units) - 1, 0)),
+        },
+        "height": SUBPLOT_HEIGHT * max(len(units), 1),
+    }
+    for i, unit in enumerate(units):
+        top = 1 - i * (height + gap)
+        result["yaxis" + _axis(i)[1:]] = {
+            "title": {"text": UNIT_TITLES.get(unit, unit)},
+            "domain": [max(top - height, 0), top],
+        }
+    return result
+
+
+def _axis(i: int) -> str:
+    """Plotly name of the i-th y axis: y, y2, y3..."""
+    return "y" if i == 0 else f"y{i + 1}"
+
+
+@functools.lru_cache(maxsize=64)
+def render_data(
+    tier: str | None, version: int, points: int, start: int | None, method: str
+) -> bytes:
+    """Downsampled traces of every series of `tier` (see `source_tier`), as JSON.
+
+    Cached on the `version` of the store read, so the data is only read and
+    serialized again after the detector (or the rollups) appended to it. Series
+    of different units (%, B/s, ...) are drawn on their own y axis.
+    """
+    store = source_store(tier)
+    downsample = DOWNSAMPLERS[method]
+    names = store.series()
+    units = sorted({registry.unit(name) for name in names}, key=_unit_order)
+    axes = {unit: _axis(i) for i, unit in enumerate(units)}
+    traces = []
+    # One series per monitored project and signal, e.g. <project>/CPU
+    for name in names:
+        records = store.read(name, start=start)
+        ts = records["ts"]
+        y = mean(records) if store.dtype == ROLLUP_DTYPE else records["y"]
+        keep = downsample(ts, y, points)
+        traces.append(
+            {
+                "name": name,
+                "yaxis": axes[registry.unit(name)],
+                "type": "scatter",
+                "mode": "lines",
+                # Milliseconds since epoch (the x axis is a date axis)
+                "x": (ts[keep] * 1000).tolist(),
+                "y": y[keep].tolist(),
+            }
         )
+    return json.dumps(
+        {"version": version, "traces": traces, "layout": layout(units)}
+    ).encode()
+
+
+def _unit_order(unit: str) -> tuple[int, str]:
+    # Percentages first, then the other units in the order of UNIT_TITLES
+    order = list(UNIT_TITLES)
+    return (order.index(unit) if unit in order else len(order), unit)
+
+
+@app.get(PLOTLY_JS_PATH)
+def plotly_js():
+    return Response(
+        _plotly_js(),
+        media_type="application/javascript",
+        headers={"Cache-Control": "public, max-age=31536000, immutable"},
     )
 
-    fig.update_layout(
-        title="CPU & Memory Usage (Resampled)",
-        xaxis_title="Time",
-        yaxis_title="Percent",
-        height=500,
+
+@app.get("/data")
+def data(
+    request: Request,
+    width: int = 1000,
+    hours: float | None = None,
+    method: str = Query("lttb", pattern="^(lttb|minmax)$"),
+):
+    # Round to limit the number of distinct cache entries
+    points = min(max(round(width, -2), 100), MAX_POINTS)
+    start = int(time.time() - hours * 3600) // 60 * 60 if hours else None
+    tier = source_tier(points, start)
+    try:
+        version = source_store(tier).version()
+    except Exception as e:
+        return Response(f"Error loading metrics: {e}", status_code=500)
+
+    etag = f'"{tier or "raw"}-{version}-{points}-{start}-{method}"'
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    return Response(
+        render_data(tier, version, points, start, method),
+        media_type="application/json",
+        headers={"ETag": etag},
     )
 
-    html_plot = fig.to_html(full_html=False)
-    return f"""
-    <html>
-    <head>
-        <meta http-equiv="refresh" content="60">
-        <title>System Dashboard</title>
-    </head>
-    <body>
-        <h1>System Monitoring Dashboard</h1>
-        {html_plot}
-    </body>
-    </html>
-    """
+
+@app.get("/", response_class=HTMLResponse)
+def dashboard():
+    return PAGE
+
+
+def main():
+    uvicorn.run(
+        "open_telemetry_test.supabase.dashboard:app",
+        host="0.0.0.0",
+        port=8050,
+        reload=True,
+    )
 
 
 if __name__ == "__main__":
-    uvicorn.run("dashboard:app", host="0.0.0.0", port=8050, reload=True)
+    main()
@@ -0,0 +1,351 @@
+"""
+Declarative registry of the metrics derived from a scrape.
+
+A derived metric is an expression over the scraped samples, declared once:
+
+    DerivedMetric(
+        "CPU_CORE",
+        100 * Rate(CPU, by=("cpu",), exclude={"mode": IDLE}) / Rate(CPU, by=("cpu",)),
+        unit="%",
+    )
+
+`Sum` adds the samples of a metric over the label sets it selects, grouped by the
+`by` labels, and `Rate` is the per second rate of such a sum of counters. Expressions
+combine with numbers and with each other (grouped by the same labels) through
+`+ - * /`. The samples are grouped in a single pass, after which every expression is
+computed on arrays holding all the label combinations of a scrape at once. Each
+combination is a series, e.g. `<target>/CPU_CORE{cpu=0}`. Metrics missing from a
+scrape give no series.
+"""
+
+import operator
+from abc import ABC, abstractmethod
+from collections.abc import Callable, Iterable, Mapping
+from dataclasses import dataclass, field
+from typing import NamedTuple, TypeAlias, Union
+
+import numpy as np
+
+from open_telemetry_test.supabase.exposition import Sample
+
+
+class Grouped(NamedTuple):
+    """Values per label combination (`keys`, e.g. "cpu=0", "" when not grouped)."""
+
+    keys: tuple[str, ...]
+    values: np.ndarray
+
+    def align(self, other: "Grouped") -> tuple["Grouped", "Grouped"]:
+        """Both restricted to their common keys, in the same order."""
+        if self.keys == other.keys:
+            return self, other
+        position = {key: i for i, key in enumerate(other.keys)}
+        mine = [i for i, key in enumerate(self.keys) if key in position]
+        keys = tuple(self.keys[i] for i in mine)
+        return (
+            Grouped(keys, self.values[mine]),
+            Grouped(keys, other.values[[position[key] for key in keys]]),
+        )
+
+
+EMPTY = Grouped((), np.empty(0))
+
+Operand = Union["Expr", float]
+Values: TypeAlias = Grouped | float
+
+
+class DerivedSample(NamedTuple):
+    """One value of a derived series (`ts` in epoch seconds)."""
+
+    series: str
+    ts: float
+    value: float
+    unit: str = ""
+
+
+class Scrape:
+    """Samples of one scrape of a target, and the state kept for that target."""
+
+    def __init__(
+        self, metrics: dict[str, list[Sample]], ts: float, state: dict[object, tuple]
+    ):
+        self.metrics = metrics
+        self.ts = ts
+        self.state = state
+        self._values: dict[int, Values] = {}
+
+    def evaluate(self, expr: "Expr") -> Values:
+        """Value of `expr`, computed once per scrape."""
+        key = id(expr)
+        if key not in self._values:
+            self._values[key] = expr.compute(self)
+        return self._values[key]
+
+
+class Expr(ABC):
+    """Expression over the samples of a scrape, see the module docstring."""
+
+    @abstractmethod
+    def compute(self, scrape: Scrape) -> Values:
+        """Value of the expression for `scrape`."""
+
+    @abstractmethod
+    def families(self) -> set[str]:
+        """Metric families the expression reads."""
+
+    def __add__(self, other: Operand) -> "Expr":
+        return BinaryOp(operator.add, self, other)
+
+    def __radd__(self, other: Operand) -> "Expr":
+        return BinaryOp(operator.add, other, self)
+
+    def __sub__(self, other: Operand) -> "Expr":
+        return BinaryOp(operator.sub, self, other)
+
+    def __rsub__(self, other: Operand) -> "Expr":
+        return BinaryOp(operator.sub, other, self)
+
+    def __mul__(self, other: Operand) -> "Expr":
+        return BinaryOp(operator.mul, self, other)
+
+    def __rmul__(self, other: Operand) -> "Expr":
+        return BinaryOp(operator.mul, other, self)
+
+    def __truediv__(self, other: Operand) -> "Expr":
+        return BinaryOp(operator.truediv, self, other)
+
+    def __rtruediv__(self, other: Operand) -> "Expr":
+        return BinaryOp(operator.truediv, other, self)
+
+
+LabelSets = Mapping[str, Iterable[str] | str]
+
+
+def _label_sets(labels: LabelSets | None) -> tuple[tuple[str, frozenset], ...]:
+    return tuple(
+        (label, frozenset((values,) if isinstance(values, str) else values))
+        for label, values in (labels or {}).items()
+    )
+
+
+@dataclass(eq=False)
+class Sum(Expr):
+    """Sum of the samples of `metric`, per combination of the `by` labels.
+
+    Parameters
+    ----------
+    metric : str
+        Sample name
+    by : tuple[str, ...], optional
+        Labels kept, the others are summed over, by default none
+    where : LabelSets | None, optional
+        Only the samples with one of these values of each label
+    exclude : LabelSets | None, optional
+        Leave out the samples with one of these values of a label
+    """
+
+    metric: str
+    by: tuple[str, ...] = ()
+    where: LabelSets | None = None
+    exclude: LabelSets | None = None
+
+    def __post_init__(self):
+        self.by = tuple(self.by)
+        self._where = _label_sets(self.where)
+        self._exclude = _label_sets(self.exclude)
+
+    def families(self) -> set[str]:
+        return {self.metric}
+
+    def compute(self, scrape: Scrape) -> Values:
+        samples = scrape.metrics.get(self.metric)
+        if not samples:
+            return EMPTY
+        where, exclude, by = self._where, self._exclude, self.by
+        sums: dict[str, float] = {}
+        for labels, value in samples:
+            if where and not all(labels.get(k) in values for k, values in where):
+                continue
+            if exclude and any(labels.get(k) in values for k, values in exclude):
+                continue
+            key = ",".join([f"{label}={labels.get(label, '')}" for label in by])
+            sums[key] = sums.get(key, 0.0) + value
+        keys = tuple(sorted(sums))
+        return Grouped(keys, np.fromiter(map(sums.__getitem__, keys), float, len(keys)))
+
+
+@dataclass(eq=False)
+class Rate(Expr):
+    """Per second rate of a `Sum` of counters, between consecutive scrapes.
+
+    No value on the first scrape of a target, nor after a counter reset.
+    """
+
+    metric: str
+    by: tuple[str, ...] = ()
+    where: LabelSets | None = None
+    exclude: LabelSets | None = None
+    total: Sum = field(init=False)
+
+    def __post_init__(self):
+        self.total = Sum(self.metric, self.by, self.where, self.exclude)
+
+    def families(self) -> set[str]:
+        return {self.metric}
+
+    def compute(self, scrape: Scrape) -> Values:
+        current = scrape.evaluate(self.total)
+        previous = scrape.state.get(self)
+        scrape.state[self] = (scrape.ts, current)
+        if previous is None or not isinstance(current, Grouped):
+            return EMPTY
+        ts, last = previous
+        if scrape.ts <= ts:
+            return EMPTY
+        current, last = current.align(last)
+        rate = (current.values - last.values) / (scrape.ts - ts)
+        # Counter resets
+        kept = rate >= 0
+        return Grouped(tuple(np.asarray(current.keys, dtype=object)[kept]), rate[kept])
+
+
+@dataclass(eq=False)
+class BinaryOp(Expr):
+    op: Callable
+    left: Operand
+    right: Operand
+
+    def families(self) -> set[str]:
+        return {
+            family
+            for operand in (self.left, self.right)
+            if isinstance(operand, Expr)
+            for family in operand.families()
+        }
+
+    def compute(self, scrape: Scrape) -> Values:
+        left, right = (
+            scrape.evaluate(operand) if isinstance(operand, Expr) else operand
+            for operand in (self.left, self.right)
+        )
+        with np.errstate(divide="ignore", invalid="ignore"):
+            if isinstance(left, Grouped) and isinstance(right, Grouped):
+                left, right = left.align(right)
+                return Grouped(left.keys, self.op(left.values, right.values))
+            if isinstance(left, Grouped):
+                return Grouped(left.keys, self.op(left.values, right))
+            if isinstance(right, Grouped):
+                return Grouped(right.keys, self.op(left, right.values))
+            return self.op(left, right)
+
+
+@dataclass(frozen=True)
+class DerivedMetric:
+    """A named expression; its series are `<target>/<name>{<labels>}`."""
+
+    name: str
+    expr: Expr
+    unit: str = ""
+
+
+CPU = "node_cpu_seconds_total"
+IDLE = ("idle", "iowait")
+
+DEFAULT_METRICS = (
+    DerivedMetric("CPU", 100 * Rate(CPU, exclude={"mode": IDLE}) / Rate(CPU), unit="%"),
+    DerivedMetric(
+        "CPU_CORE",
+        100 * Rate(CPU, by=("cpu",), exclude={"mode": IDLE}) / Rate(CPU, by=("cpu",)),
+        unit="%",
+    ),
+    DerivedMetric(
+        "MEM",
+        100
+        * (Sum("node_memory_MemTotal_bytes") - Sum("node_memory_MemAvailable_bytes"))
+        / Sum("node_memory_MemTotal_bytes"),
+        unit="%",
+    ),
+    DerivedMetric(
+        "DISK_BUSY",
+        100 * Rate("node_disk_io_time_seconds_total", by=("device",)),
+        unit="%",
+    ),
+    DerivedMetric(
+        "NET_RX",
+        Rate(
+            "node_network_receive_bytes_total", by=("device",), exclude={"device": "lo"}
+        ),
+        unit="B/s",
+    ),
+    DerivedMetric(
+        "NET_TX",
+        Rate(
+            "node_network_transmit_bytes_total",
+            by=("device",),
+            exclude={"device": "lo"},
+        ),
+        unit="B/s",
+    ),
+    DerivedMetric(
+        "PG_CONNECTIONS", Sum("pg_stat_database_num_backends", by=("datname",))
+    ),
+    DerivedMetric(
+        "PG_XACT",
+        Rate("pg_stat_database_xact_commit_total", by=("datname",))
+        + Rate("pg_stat_database_xact_rollback_total", by=("datname",)),
+        unit="/s",
+    ),
+)
+
+
+class DerivedMetrics:
+    """Registry of derived metrics, evaluated on every scrape of every target.
+
+    Parameters
+    ----------
+    metrics : Iterable[DerivedMetric], optional
+        Metrics to derive, by default CPU (overall and per core), memory, disk,
+        network and Postgres ones
+    """
+
+    def __init__(self, metrics: Iterable[DerivedMetric] = DEFAULT_METRICS):
+        self.metrics: list[DerivedMetric] = []
+        # Per target: the previous value of every rate
+        self._state: dict[str, dict[object, tuple]] = {}
+        for metric in metrics:
+            self.register(metric)
+
+    def register(self, metric: DerivedMetric) -> None:
+        if any(m.name == metric.name for m in self.metrics):
+            raise ValueError(f"A metric named {metric.name} is already registered.")
+        self.metrics.append(metric)
+
+    def unit(self, series: str) -> str:
+        """Unit of a derived series `<target>/<name>{<labels>}` ("" if unknown)."""
+        name = series.split("{", 1)[0].rsplit("/", 1)[-1]
+        return next((m.unit for m in self.metrics if m.name == name), "")
+
+    @property
+    def families(self) -> tuple[str, ...]:
+        """Metric families to scrape, e.g. as the parser allowlist."""
+        return tuple(sorted(set().union(*(m.expr.families() for m in self.metrics))))
+
+    def evaluate(
+        self, target: str, ts: float, metrics: dict[str, list[Sample]]
+    ) -> list[DerivedSample]:
+        """Values of all the derived series of `target` for one scrape."""
+        scrape = Scrape(metrics, ts, self._state.setdefault(target, {}))
+        samples = []
+        for metric in self.metrics:
+            grouped = scrape.evaluate(metric.expr)
+            if not isinstance(grouped, Grouped):
+                continue
+            prefix = f"{target}/{metric.name}"
+            finite = np.isfinite(grouped.values)
+            for labels, value, keep in zip(
+                grouped.keys, grouped.values.tolist(), finite, strict=True
+            ):
+                if keep:
+                    name = f"{prefix}{{{labels}}}" if labels else prefix
+                    samples.append(DerivedSample(name, ts, value, metric.unit))
+        return samples
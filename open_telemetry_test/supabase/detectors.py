@@ -0,0 +1,233 @@
+"""
+Local online anomaly detectors.
+
+Each detector scores a new sample against the state built from the previous
+samples and then folds the sample into that state. Updates are constant time per
+sample (for a fixed window size), so many series can be monitored without an API
+round-trip per point.
+"""
+
+import bisect
+import math
+from abc import ABC, abstractmethod
+from collections import deque
+
+# Scale factor that makes the MAD a consistent estimator of the standard deviation
+# for normally distributed data
+MAD_TO_STD = 1.4826
+
+
+class Detector(ABC):
+    """Base class for the online detectors.
+
+    Parameters
+    ----------
+    threshold : float, optional
+        Number of standard deviations from the expected value beyond which a
+        sample is flagged as an anomaly, by default 3.0
+    warmup : int, optional
+        Number of samples to observe before any sample can be flagged, by
+        default 10
+    """
+
+    def __init__(self, threshold: float = 3.0, warmup: int = 10):
+        self.threshold = threshold
+        self.warmup = warmup
+        self.n = 0
+
+    @abstractmethod
+    def expected(self) -> float:
+        """Expected value of the next sample."""
+
+    @abstractmethod
+    def scale(self) -> float:
+        """Current estimate of the standard deviation of the series."""
+
+    @abstractmethod
+    def _observe(self, value: float) -> None:
+        """Fold `value` into the state."""
+
+    def score(self, value: float) -> float:
+        """Return the (absolute) z-score of `value` against the current state."""
+        scale = self.scale()
+        if self.n < max(self.warmup, 2) or not scale > 0:
+            return 0.0
+        return abs(value - self.expected()) / scale
+
+    def update(self, value: float) -> bool:
+        """Score `value`, add it to the state and return whether it is anomalous."""
+        is_anomaly = self.score(value) > self.threshold
+        self._observe(value)
+        self.n += 1
+        return is_anomaly
+
+    def reset(self) -> None:
+        self.n = 0
+
+
+class RollingZScoreDetector(Detector):
+    """Z-score against the rolling mean / variance of the last `window` samples.
+
+    The mean and the sum of squared deviations are updated with Welford's add /
+    remove steps, which neither cancel out on series with a large offset nor drift
+    as samples go in and out of the window (unlike a running sum of squares).
+    """
+
+    def __init__(self, window: int = 60, threshold: float = 3.0, warmup: int = 10):
+        self.window = window
+        super().__init__(threshold=threshold, warmup=warmup)
+        self.reset()
+
+    def reset(self) -> None:
+        super().reset()
+        self.values: deque = deque(maxlen=self.window)
+        self.mean = 0.0
+        self.m2 = 0.0  # sum of squared deviations from the mean
+
+    def expected(self) -> float:
+        return self.mean
+
+    def scale(self) -> float:
+        count = len(self.values)
+        if count < 2:
+            return 0.0
+        return math.sqrt(max(self.m2, 0.0) / (count - 1))
+
+    def _observe(self, value: float) -> None:
+        if len(self.values) == self.window:
+            oldest = self.values[0]
+            count = self.window - 1
+            if count:
+                diff = oldest - self.mean
+                self.mean -= diff / count
+                self.m2 -= diff * (oldest - self.mean)
+            else:
+                self.mean = self.m2 = 0.0
+        self.values.append(value)
+        diff = value - self.mean
+        self.mean += diff / len(self.values)
+        self.m2 += diff * (value - self.mean)
+
+
+class EWMADetector(Detector):
+    """Z-score against an exponentially weighted mean / variance.
+
+    Parameters
+    ----------
+    alpha : float, optional
+        Smoothing factor, by default 0.1 (higher reacts faster)
+    """
+
+    def __init__(self, alpha: float = 0.1, threshold: float = 3.0, warmup: int = 10):
+        self.alpha = alpha
+        super().__init__(threshold=threshold, warmup=warmup)
+        self.reset()
+
+    def reset(self) -> None:
+        super().reset()
+        self.mean = 0.0
+        self.variance = 0.0
+
+    def expected(self) -> float:
+        return self.mean
+
+    def scale(self) -> float:
+        return math.sqrt(self.variance)
+
+    def _observe(self, value: float) -> None:
+        if self.n == 0:
+            self.mean = value
+            return
+        diff = value - self.mean
+        increment = self.alpha * diff
+        self.mean += increment
+        self.variance = (1 - self.alpha) * (self.variance + diff * increment)
+
+
+class MADDetector(Detector):
+    """Robust z-score against the rolling median / MAD of the last `window` samples.
+
+    The window is also kept sorted (`bisect`): the median is read in constant time
+    and the MAD, the median of the distances to it, is selected in O(log window)
+    from the two sorted runs of distances on either side of the median. Inserting
+    and removing a sample moves O(window) items of a list, a memmove.
+    """
+
+    def __init__(self, window: int = 60, threshold: float = 3.0, warmup: int = 10):
+        self.window = window
+        super().__init__(threshold=threshold, warmup=warmup)
+        self.reset()
+
+    def reset(self) -> None:
+        super().reset()
+        self.values: deque = deque(maxlen=self.window)
+        self.sorted: list[float] = []
+        self._median = 0.0
+        self._scale = 0.0
+
+    def expected(self) -> float:
+        return self._median
+
+    def scale(self) -> float:
+        return self._scale
+
+    def _observe(self, value: float) -> None:
+        ordered = self.sorted
+        if len(self.values) == self.window:
+            del ordered[bisect.bisect_left(ordered, self.values[0])]
+        self.values.append(value)
+        bisect.insort(ordered, value)
+
+        count = len(ordered)
+        half = count // 2
+        median = ordered[half] if count % 2 else (ordered[half - 1] + ordered[half]) / 2
+        # Distances to the median, ascending: below it (right to left), and above it
+        split = bisect.bisect_left(ordered, median)
+
+        def below(i: int) -> float:
+            return median - ordered[split - 1 - i]
+
+        def above(j: int) -> float:
+            return ordered[split + j] - median
+
+        sizes = split, count - split
+        mad = _kth(half, below, above, *sizes)
+        if not count % 2:
+            mad = (mad + _kth(half - 1, below, above, *sizes)) / 2
+        self._median = median
+        self._scale = MAD_TO_STD * mad
+
+
+def _kth(k: int, a, b, size_a: int, size_b: int) -> float:
+    """k-th smallest (from 0) of the union of the ascending sequences a and b."""
+    low, high = max(0, k + 1 - size_b), min(k + 1, size_a)
+    # Number of items taken from a
+    while low < high:
+        i = (low + high) // 2
+        if a(i) < b(k - i):
+            low = i + 1
+        else:
+            high = i
+    candidates = []
+    if low > 0:
+        candidates.append(a(low - 1))
+    if k + 1 - low > 0:
+        candidates.append(b(k - low))
+    return max(candidates)
+
+
+DETECTORS: dict[str, type[Detector]] = {
+    "zscore": RollingZScoreDetector,
+    "ewma": EWMADetector,
+    "mad": MADDetector,
+}
+
+
+def make_detector(name: str, **kwargs) -> Detector:
+    """Create a detector by its registered name (see `DETECTORS`)."""
+    try:
+        return DETECTORS[name](**kwargs)
+    except KeyError:
+        raise ValueError(
+            f"Unknown detector '{name}'. Choose one of {sorted(DETECTORS)}."
+        ) from None
@@ -0,0 +1,83 @@
+"""
+Downsampling of time series to a fixed point budget for plotting.
+"""
+
+import numpy as np
+
+
+def minmax(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """Indices of the min and max point of `n_out // 2` equal-count buckets.
+
+    Keeps every spike visible, which matters more than the shape for anomalies.
+
+    Parameters
+    ----------
+    x : np.ndarray
+        Sorted x values
+    y : np.ndarray
+        y values
+    n_out : int
+        Maximum number of points to keep
+
+    Returns
+    -------
+    np.ndarray
+        Sorted indices of the points to keep
+    """
+    n = len(y)
+    n_buckets = n_out // 2
+    if n <= n_out or n_buckets < 1:
+        return np.arange(n)
+    edges = np.linspace(0, n, n_buckets + 1).astype(np.int64)
+    starts = edges[:-1]
+    # Bucket of every point, then the position of its min / max within the bucket
+    bucket = np.repeat(np.arange(n_buckets), np.diff(edges))
+    order = np.lexsort((y, bucket))
+    sizes = np.diff(edges)
+    mins = order[starts]
+    maxs = order[starts + sizes - 1]
+    return np.unique(np.concatenate([mins, maxs]))
+
+
+def lttb(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """Largest-Triangle-Three-Buckets downsampling.
+
+    Ref: Steinarsson, "Downsampling Time Series for Visual Representation" (2013)
+
+    Parameters
+    ----------
+    x : np.ndarray
+        Sorted x values
+    y : np.ndarray
+        y values
+    n_out : int
+        Number of points to keep (including the first and the last)
+
+    Returns
+    -------
+    np.ndarray
+        Sorted indices of the points to keep
+    """
+    n = len(y)
+    if n <= n_out or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    # Inner points are split into n_out - 2 buckets
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    previous = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        # Average of the next bucket (the last point for the last bucket)
+        next_start, next_end = end, edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[next_start:next_end].mean()
+        avg_y = y[next_start:next_end].mean()
+        area = np.abs(
+            (x[previous] - avg_x) * (y[start:end] - y[previous])
+            - (x[previous] - x[start:end]) * (avg_y - y[previous])
+        )
+        previous = start + int(np.argmax(area))
+        selected[i + 1] = previous
+    return selected
@@ -0,0 +1,191 @@
+"""
+Streaming parser for the Prometheus text exposition format.
+
+Ref: https://prometheus.io/docs/instrumenting/exposition_formats/
+"""
+
+import sys
+from collections.abc import Iterable
+from typing import NamedTuple
+
+# Suffixes that Prometheus appends to the samples of a summary / histogram family
+_FAMILY_SUFFIXES = ("_bucket", "_sum", "_count", "_created")
+_ESCAPES = {"\\": "\\", '"': '"', "n": "\n"}
+
+
+class Sample(NamedTuple):
+    labels: dict[str, str]
+    value: float
+
+
+def family_name(name: str) -> str:
+    """Return the metric family a sample name belongs to.
+
+    Parameters
+    ----------
+    name : str
+        Sample name, e.g. `http_request_duration_seconds_bucket`
+
+    Returns
+    -------
+    str
+        The family name, e.g. `http_request_duration_seconds`
+    """
+    for suffix in _FAMILY_SUFFIXES:
+        if name.endswith(suffix):
+            return name[: -len(suffix)]
+    return name
+
+
+def _unescape(value: str) -> str:
+    out = []
+    i = 0
+    while i < len(value):
+        char = value[i]
+        if char == "\\" and i + 1 < len(value):
+            out.append(_ESCAPES.get(value[i + 1], value[i + 1]))
+            i += 2
+        else:
+            out.append(char)
+            i += 1
+    return "".join(out)
+
+
+def _parse_labels(line: str, pos: int) -> tuple[dict[str, str], int]:
+    """Parse the label set starting right after `{`.
+
+    Returns the labels and the position right after the closing `}`.
+    """
+    labels: dict[str, str] = {}
+    while True:
+        while line[pos] in " ,":
+            pos += 1
+        if line[pos] == "}":
+            return labels, pos + 1
+        eq = line.index("=", pos)
+        key = sys.intern(line[pos:eq].strip())
+        start = line.index('"', eq) + 1
+        end = line.index('"', start)
+        # Skip escaped quotes (preceded by an odd number of backslashes)
+        while True:
+            backslashes = 0
+            while line[end - 1 - backslashes] == "\\":
+                backslashes += 1
+            if backslashes % 2 == 0:
+                break
+            end = line.index('"', end + 1)
+        value = line[start:end]
+        if "\\" in value:
+            value = _unescape(value)
+        # Label values repeat across samples (mode="idle", cpu="0", ...)
+        labels[key] = sys.intern(value)
+        pos = end + 1
+
+
+class ExpositionParser:
+    """Incremental parser for exposition text, fed one line at a time.
+
+    Parameters
+    ----------
+    families : Iterable[str] | None, optional
+        Only keep samples whose name (or metric family) is in this allowlist.
+        Other lines are skipped before their labels are parsed. By default None
+        which keeps everything.
+    """
+
+    def __init__(self, families: Iterable[str] | None = None):
+        self.allowed = frozenset(families) if families is not None else None
+        self.metrics: dict[str, list[Sample]] = {}
+
+    def feed(self, line: str | bytes) -> None:
+        """Parse a single line (without the trailing newline)."""
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+        if not line or line[0] == "#":
+            return
+        brace = line.find("{")
+        space = line.find(" ")
+        has_labels = brace != -1 and (space == -1 or brace < space)
+        name = line[:brace] if has_labels else line[:space]
+        allowed = self.allowed
+        if (
+            allowed is not None
+            and name not in allowed
+            and family_name(name) not in allowed
+        ):
+            return
+        try:
+            if has_labels:
+                labels, pos = _parse_labels(line, brace + 1)
+            else:
+                labels, pos = {}, space
+            # Value is the first token after the labels (an optional
+            # timestamp may follow it)
+            value = float(line[pos:].split(maxsplit=1)[0])
+        except (ValueError, IndexError):
+            return
+        samples = self.metrics.get(name)
+        if samples is None:
+            samples = self.metrics[sys.intern(name)] = []
+        samples.append(Sample(labels, value))
+
+
+def _candidate_lines(source: str, families: Iterable[str]) -> list[str]:
+    """Lines of `source` that start with one of `families`, in order.
+
+    A superset of the lines the parser keeps (sample names start with their family
+    name), found with `str.find` instead of visiting every line.
+    """
+    starts = set()
+    for name in families:
+        if source.startswith(name):
+            starts.add(0)
+        needle = "\n" + name
+        pos = source.find(needle)
+        while pos != -1:
+            starts.add(pos + 1)
+            pos = source.find(needle, pos + len(needle))
+    lines = []
+    for start in sorted(starts):
+        end = source.find("\n", start)
+        lines.append(source[start : None if end == -1 else end].rstrip("\r"))
+    return lines
+
+
+def parse_prometheus_metrics(
+    source: str | Iterable[str | bytes],
+    families: Iterable[str] | None = None,
+) -> dict[str, list[Sample]]:
+    """Parse Prometheus exposition text in a single pass.
+
+    Lines are consumed one at a time, so `source` can be a streaming iterator
+    (e.g. `response.iter_lines()`) and the full payload is never held in memory.
+    With an allowlist, a `source` string is first scanned for the lines of the
+    allowed families only.
+
+    Parameters
+    ----------
+    source : str | Iterable[str | bytes]
+        The exposition text, or an iterable over its lines
+    families : Iterable[str] | None, optional
+        Only keep samples whose name (or metric family) is in this allowlist,
+        by default None which keeps everything.
+
+    Returns
+    -------
+    dict[str, list[Sample]]
+        Samples (labels, value) keyed by sample name
+    """
+    lines: Iterable[str | bytes]
+    if isinstance(source, str):
+        lines = (
+            source.splitlines()
+            if families is None
+            else _candidate_lines(source, families)
+        )
+    else:
+        lines = source
+    parser = ExpositionParser(families)
+    for line in lines:
+        parser.feed(line)
+    return parser.metrics
@@ -1,139 +1,80 @@
 # https://supabase.com/docs/guides/telemetry/metrics
 
-import glob
+import asyncio
+import functools
 import os
-import re
 import threading
-import time
-from collections import deque
+import zlib
+from collections.abc import Callable
+from concurrent.futures import Future, wait
+from dataclasses import dataclass, field
 from datetime import datetime
 from queue import Queue
 
+import numpy as np
 import pandas as pd
-import requests  # type: ignore
-from dotenv import load_dotenv
-from nixtla import NixtlaClient
-from requests.auth import HTTPBasicAuth  # type: ignore
 
-load_dotenv()
+from open_telemetry_test.alerts import Alert, AlertDispatcher, default_transport
+from open_telemetry_test.supabase.coordinator import ID_COL, DetectionCoordinator
+from open_telemetry_test.supabase.derived import DerivedMetrics, DerivedSample
+from open_telemetry_test.supabase.detectors import Detector, make_detector
+from open_telemetry_test.supabase.recorder import RECORD_DIR, Recorder
+from open_telemetry_test.supabase.rollup import RollupEngine
+from open_telemetry_test.supabase.scraper import AsyncScraper, Target, load_targets
+from open_telemetry_test.supabase.store import RECORD_DTYPE, STORE_DIR, MetricStore
+from open_telemetry_test.supabase.window import TimeSeriesWindow
+from open_telemetry_test.timegpt import get_client
 
 # --- CONFIGURATION ---
-SUPABASE_PROJECT = os.getenv("SUPABASE_PROJECT")
-SUPABASE_JWT = os.getenv("SUPABASE_JWT")
-if not SUPABASE_PROJECT or not SUPABASE_JWT:
-    raise ValueError(
-        "Please set SUPABASE_PROJECT and SUPABASE_JWT environment variables."
-    )
+# Read from the environment (and `.env` with `python -m open_telemetry_test supabase`)
+# Projects are read from SUPABASE_PROJECTS (or SUPABASE_PROJECT) and SUPABASE_JWT,
+# see `scraper.load_targets`
 
 # Supabase only collects it's metrics every 60 seconds
 # (sends to Prometheus at this frequency)
 INTERVAL = 60  # seconds
+SCRAPE_TIMEOUT = 10  # seconds, per target
 MAX_WINDOW_SIZE = 180
 ANOMALY_THRESHOLD = 3.0
 
-# --- SHARED STATE ---
-# Queue for shared data across threads
-cpu_queue: Queue = Queue()
-mem_queue: Queue = Queue()
-
-# Sliding window of length MAX_WINDOW_SIZE
-cpu_timestamp_window: deque = deque(maxlen=MAX_WINDOW_SIZE)
-cpu_usage_window: deque = deque(maxlen=MAX_WINDOW_SIZE)
-mem_timestamp_window: deque = deque(maxlen=MAX_WINDOW_SIZE)
-mem_usage_window: deque = deque(maxlen=MAX_WINDOW_SIZE)
-
+# Local detector engine used on every sample (zscore, ewma, mad). Set to "nixtla"
+# to call TimeGPT on every sample instead.
+DETECTOR_ENGINE = os.getenv("SUPABASE_DETECTOR", "zscore")
+# Recalibrate the local detector against TimeGPT every N samples (0 to disable)
+NIXTLA_EVERY = int(os.getenv("SUPABASE_NIXTLA_EVERY", "30"))
+# Series that become ready together are sent to TimeGPT in one call
+NIXTLA_MAX_BATCH_SIZE = 64
+NIXTLA_FLUSH_DEADLINE = 5.0  # seconds
 
-# cpu_data = []
-# mem_data = []
-# data_lock = threading.Lock()
+# Anomalies of a series within this window are sent as one alert entry, and alert
+# digests are sent at most every ALERT_MIN_INTERVAL seconds
+ALERT_WINDOW = int(os.getenv("SUPABASE_ALERT_WINDOW", "300"))  # seconds
+ALERT_MIN_INTERVAL = 60  # seconds
 
+# Derived series (CPU, memory, disk, network, Postgres) of every target
+registry = DerivedMetrics()
+# Only these metric families are parsed from the (large) privileged endpoint
+SCRAPE_FAMILIES = registry.families
 
-# --- CPU State ---
-class CPUTracker:
-    def __init__(self):
-        self.prev_total = None
-        self.prev_idle = None
-
-    def compute_usage(self, total, idle):
-        if self.prev_total is None:
-            self.prev_total, self.prev_idle = total, idle
-            return None
-        delta_total = total - self.prev_total
-        delta_idle = idle - self.prev_idle
-        self.prev_total, self.prev_idle = total, idle
-        return 100 * (1 - delta_idle / delta_total) if delta_total > 0 else None
-
-
-# --- METRICS ---
-def fetch_metrics():
-    url = f"https://{SUPABASE_PROJECT}.supabase.co/customer/v1/privileged/metrics"
-    auth = HTTPBasicAuth("service_role", SUPABASE_JWT)
-    try:
-        response = requests.get(url, auth=auth, timeout=10)
-        response.raise_for_status()
-        return response.text
-    except Exception as e:
-        print(f"[{datetime.utcnow().isoformat()}] ⚠️ Error fetching metrics: {e}")
-        return None
-
-
-def parse_prometheus_metrics(text):
-    metrics: dict = {}
-    for line in text.splitlines():
-        if not line or line.startswith("#"):
-            continue
-        try:
-            key = line.split()[0].split("{")[0]
-            value = float(line.split()[-1])
-            metrics.setdefault(key, []).append((line, value))
-        except Exception:
-            continue
-    return metrics
-
-
-# --- PARSE TOTAL & IDLE ---
-def extract_total_and_idle(metrics):
-    total, idle = 0.0, 0.0
-    for line, val in metrics.get("node_cpu_seconds_total", []):
-        match = re.search(r'mode="(\w+)"', line)
-        if match:
-            mode = match.group(1)
-            total += val
-            if mode in ("idle", "iowait"):
-                idle += val
-    return total, idle
-
-
-def extract_memory_usage(metrics):
-    mem_total = mem_available = None
-    for _, val in metrics.get("node_memory_MemTotal_bytes", []):
-        mem_total = val
-    for _, val in metrics.get("node_memory_MemAvailable_bytes", []):
-        mem_available = val
-    return (
-        100 * (mem_total - mem_available) / mem_total
-        if mem_total and mem_available
-        else None
-    )
+# Detection threads; every series is always handled by the same one
+DETECT_WORKERS = int(os.getenv("SUPABASE_DETECT_WORKERS", "4"))
 
 
 # --- DETECTION ---
-def detect_anomaly_nixtla(timestamps, usage_vals, export_path=None):
-    df = pd.DataFrame({"ds": timestamps, "y": usage_vals})
-    df["ds"] = pd.to_datetime(df["ds"])
-    df = df.set_index("ds").resample("1min").mean().interpolate().reset_index()
-
-    if export_path:
-        df.to_csv(export_path, index=False)
-        print(f"📁 Exported: {export_path}")
+def detect_batch_nixtla(df: pd.DataFrame) -> dict:
+    """Run TimeGPT over a long-format frame of windows (unique_id, ds, y).
 
-    if len(df) < 10:
-        return False
+    Returns the row for the latest sample of each series, keyed by unique_id.
+    """
+    # Too short windows are not scored
+    df = df[df.groupby(ID_COL)["ds"].transform("size") >= 10]
+    if df.empty:
+        return {}
 
     try:
-        client = NixtlaClient()
-        result = client.detect_anomalies_online(
+        result = get_client().detect_anomalies_online(
             df,
+            id_col=ID_COL,
             time_col="ds",
             target_col="y",
             freq="min",
@@ -141,86 +82,309 @@ def detect_anomaly_nixtla(timestamps, usage_vals, export_path=None):
             level=99,
             detection_size=1,
         )
-        return result.tail(1)["anomaly"].iloc[0]
+        latest = result.groupby(ID_COL).tail(1)
+        return {row[ID_COL]: row for _, row in latest.iterrows()}
     except Exception as e:
         print(f"⚠️ Nixtla error: {e}")
-        return False
+        return {}
 
 
-def detect_loop(name, queue, ts_window, usage_window, export_path):
-    while True:
-        ts, usage = queue.get()
-        ts_window.append(ts)
-        usage_window.append(usage)
+detection_coordinator = DetectionCoordinator(
+    detect_batch_nixtla,
+    max_batch_size=NIXTLA_MAX_BATCH_SIZE,
+    flush_deadline=NIXTLA_FLUSH_DEADLINE,
+)
 
-        # with data_lock:
-        #     store.append({"timestamp": ts, "value": usage})
 
-        if detect_anomaly_nixtla(ts_window, usage_window, export_path):
-            print(f"[{ts}] 🚨 {name} Anomaly: {usage:.2f}%")
+def _anomaly(future: Future) -> Future:
+    """Future of whether TimeGPT's row (the result of `future`) is an anomaly."""
+    verdict: Future = Future()
+
+    def done(row: Future) -> None:
+        try:
+            latest = row.result()
+        except Exception as e:
+            verdict.set_exception(e)
         else:
-            print(f"[{ts}] {name} OK: {usage:.2f}%")
+            verdict.set_result(False if latest is None else bool(latest["anomaly"]))
+
+    future.add_done_callback(done)
+    return verdict
+
+
+def recalibrate_detector(detector: Detector, latest) -> None:
+    """Match the local detector's threshold to the width of TimeGPT's interval.
+
+    TimeGPT's 99% interval for the latest sample is converted into the number of
+    local standard deviations it spans, which becomes the new threshold.
+    """
+    scale = detector.scale()
+    if latest is None or not scale > 0:
+        return
+    half_width = (latest["TimeGPT-hi-99"] - latest["TimeGPT-lo-99"]) / 2
+    detector.threshold = min(max(half_width / scale, 1.5), 10.0)
 
-        queue.task_done()
+
+def _recalibrate(detector: Detector, unique_id: str, future: Future) -> None:
+    try:
+        recalibrate_detector(detector, future.result())
+    except Exception as e:
+        print(f"⚠️ {unique_id} Recalibration error: {e!r}")
+
+
+def _make_detector():
+    if DETECTOR_ENGINE == "nixtla":
+        return None
+    return make_detector(DETECTOR_ENGINE, threshold=ANOMALY_THRESHOLD)
+
+
+@dataclass
+class SeriesState:
+    """Sliding window (of MAX_WINDOW_SIZE 1 minute bins) and detector of a series."""
+
+    window: TimeSeriesWindow = field(
+        default_factory=lambda: TimeSeriesWindow(MAX_WINDOW_SIZE, freq=60)
+    )
+    detector: Detector | None = field(default_factory=_make_detector)
+    samples: int = 0
+
+
+def persist_window(store: MetricStore, unique_id: str, window, first: int):
+    """Append the bins from position `first` on (changed by a sample) to the store.
+
+    A late sample also updates bins already stored; their new records win when
+    the store is read.
+    """
+    if first >= len(window):
+        return
+    records = np.empty(len(window) - first, dtype=RECORD_DTYPE)
+    records["ts"] = window.timestamps[first:]
+    records["y"] = window.values[first:]
+    store.append(unique_id, records)
+
+
+def detect_sample(
+    series: dict[str, SeriesState],
+    unique_id: str,
+    epoch: float,
+    usage: float,
+    store: MetricStore | None = None,
+    rollups: RollupEngine | None = None,
+    nixtla_every: int = NIXTLA_EVERY,
+    state_factory: Callable[[], SeriesState] | None = None,
+    coordinator: DetectionCoordinator | None = None,
+) -> bool | Future:
+    """Add a sample to its series in `series` and return whether it is an anomaly.
+
+    With a local detector, the sample is scored in constant time and TimeGPT is
+    only called every `nixtla_every` samples to recalibrate it, in the background.
+    Without one, every sample is sent to TimeGPT and a `Future` of whether it is an
+    anomaly is returned. New series get `state_factory()`, by default a
+    `SeriesState` for `DETECTOR_ENGINE`.
+
+    TimeGPT calls never block: they are batched with the other series by
+    `coordinator` (by default one flushing every NIXTLA_FLUSH_DEADLINE seconds or
+    NIXTLA_MAX_BATCH_SIZE series, call its `flush` when no other series is coming).
+
+    The aligned series is appended to `store` and the sample is folded into the
+    long-retention `rollups`.
+    """
+    if coordinator is None:
+        coordinator = detection_coordinator
+    state = series.get(unique_id)
+    if state is None:
+        state = series[unique_id] = (state_factory or SeriesState)()
+    window, detector = state.window, state.detector
+    first_changed = window.append(epoch, usage)
+    state.samples += 1
+
+    if store is not None:
+        persist_window(store, unique_id, window, first_changed)
+    if rollups is not None:
+        rollups.update(unique_id, epoch, usage)
+
+    if detector is None:
+        return _anomaly(coordinator.submit(unique_id, window.to_frame()))
+    is_anomaly = detector.update(usage)
+    if nixtla_every and state.samples % nixtla_every == 0:
+        future = coordinator.submit(unique_id, window.to_frame())
+        # Runs on the coordinator's thread, and only sets the detector's threshold
+        future.add_done_callback(functools.partial(_recalibrate, detector, unique_id))
+    return is_anomaly
+
+
+class DetectionPool:
+    """A fixed number of detection threads, shared by all the series.
+
+    A series is always sent to the same thread (by a hash of its name), so its
+    samples are detected in order, and its window and detector are only used by
+    that thread. The threads never wait for TimeGPT: its calls (every sample of the
+    "nixtla" engine, the recalibrations) go to `coordinator`, which batches them
+    with the other series until its size or deadline is reached, and the verdicts
+    are reported when their batch returns. Anomalies are handed to `alerts`, which
+    never blocks.
+
+    Parameters
+    ----------
+    workers : int, optional
+        Threads, by default `SUPABASE_DETECT_WORKERS`
+    store, rollups, nixtla_every, state_factory, coordinator
+        See `detect_sample`
+    alerts : AlertDispatcher | None, optional
+        Receives the anomalies, by default they are only printed
+    """
+
+    def __init__(
+        self,
+        workers: int = DETECT_WORKERS,
+        store: MetricStore | None = None,
+        rollups: RollupEngine | None = None,
+        nixtla_every: int = NIXTLA_EVERY,
+        alerts: AlertDispatcher | None = None,
+        state_factory: Callable[[], SeriesState] | None = None,
+        coordinator: DetectionCoordinator | None = None,
+    ):
+        self.store = store
+        self.rollups = rollups
+        self.nixtla_every = nixtla_every
+        self.alerts = alerts
+        self.state_factory = state_factory
+        self.coordinator = coordinator or detection_coordinator
+        # TimeGPT verdicts not reported yet
+        self._verdicts: set[Future] = set()
+        self._lock = threading.Lock()
+        self.queues: list[Queue] = [Queue() for _ in range(max(workers, 1))]
+        for i, queue in enumerate(self.queues):
+            threading.Thread(
+                target=self._run, args=(queue,), name=f"detect-{i}", daemon=True
+            ).start()
+
+    def submit(self, sample: DerivedSample) -> None:
+        index = zlib.crc32(sample.series.encode()) % len(self.queues)
+        self.queues[index].put(sample)
+
+    def join(self) -> None:
+        """Wait until every submitted sample is detected and reported."""
+        for queue in self.queues:
+            queue.join()
+        while True:
+            with self._lock:
+                verdicts = list(self._verdicts)
+            if not verdicts:
+                return
+            self.coordinator.flush()
+            wait(verdicts)
+
+    def _run(self, queue: Queue) -> None:
+        series: dict[str, SeriesState] = {}
+        while True:
+            sample: DerivedSample = queue.get()
+            try:
+                verdict = detect_sample(
+                    series,
+                    sample.series,
+                    sample.ts,
+                    sample.value,
+                    self.store,
+                    self.rollups,
+                    self.nixtla_every,
+                    self.state_factory,
+                    self.coordinator,
+                )
+                if isinstance(verdict, Future):
+                    with self._lock:
+                        self._verdicts.add(verdict)
+                    verdict.add_done_callback(functools.partial(self._reported, sample))
+                else:
+                    self._report(sample, verdict)
+            except Exception as e:
+                # The thread keeps serving its other series
+                self._report(sample, e)
+            finally:
+                queue.task_done()
+
+    def _reported(self, sample: DerivedSample, verdict: Future) -> None:
+        try:
+            self._report(sample, verdict.exception() or verdict.result())
+        finally:
+            with self._lock:
+                self._verdicts.discard(verdict)
+
+    def _report(self, sample: DerivedSample, verdict: bool | BaseException) -> None:
+        unique_id, epoch, value, unit = sample
+        ts = datetime.utcfromtimestamp(epoch).isoformat()
+        if isinstance(verdict, BaseException):
+            print(f"[{ts}] ⚠️ {unique_id} Detection error: {verdict!r}")
+        elif verdict:
+            print(f"[{ts}] 🚨 {unique_id} Anomaly: {value:.2f}{unit}")
+            if self.alerts is not None:
+                self.alerts.submit(Alert(unique_id, epoch, value, f"{value:.2f}{unit}"))
+        else:
+            print(f"[{ts}] {unique_id} OK: {value:.2f}{unit}")
 
 
 # --- SCRAPE LOOP ---
-def scrape_loop():
-    tracker = CPUTracker()
-    next_run = time.monotonic()
-    while True:
-        ts = datetime.utcnow().isoformat()
-        text = fetch_metrics()
-        if text:
-            metrics = parse_prometheus_metrics(text)
-            total, idle = extract_total_and_idle(metrics)
-            cpu_usage = tracker.compute_usage(total, idle)
-            mem_usage = extract_memory_usage(metrics)
-            if cpu_usage is not None:
-                cpu_queue.put((ts, cpu_usage))
-            if mem_usage is not None:
-                mem_queue.put((ts, mem_usage))
-        next_run += INTERVAL
-        time.sleep(max(0, next_run - time.monotonic()))
+def handle_metrics(pool: DetectionPool, target: Target, ts: float, metrics) -> None:
+    """Hand the derived samples of one scrape to the detection `pool`."""
+    for sample in registry.evaluate(target.name, ts, metrics):
+        pool.submit(sample)
+
+
+def scrape_loop(
+    targets: list[Target], pool: DetectionPool, recorder: Recorder | None = None
+):
+    """Scrape `targets` forever, also saving the raw payloads to `recorder`."""
+    scraper = AsyncScraper(
+        targets,
+        functools.partial(handle_metrics, pool),
+        interval=INTERVAL,
+        timeout=SCRAPE_TIMEOUT,
+        families=SCRAPE_FAMILIES,
+        on_payload=recorder.record if recorder is not None else None,
+    )
+    asyncio.run(scraper.run())
 
 
 # --- MAIN ---
-if __name__ == "__main__":
-    print("⏳ Monitoring started...")
+def main():
+    from dotenv import load_dotenv
+
+    # When main is called without the dispatcher, for the settings read from here on
+    load_dotenv()
+
+    targets = load_targets()
+    print(f"⏳ Monitoring started for {len(targets)} project(s)...")
+
+    # Start from an empty metrics store (rollups are kept across restarts)
+    store = MetricStore(STORE_DIR)
+    store.clear()
+    print(f"🗑️ Cleared: {STORE_DIR}")
+    rollups = RollupEngine()
+    alerts = AlertDispatcher(
+        default_transport(),
+        window_secs=ALERT_WINDOW,
+        min_interval_secs=ALERT_MIN_INTERVAL,
+        subject="Supabase anomalies",
+    )
 
-    # Delete existing metrics files
-    BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-    for f in glob.glob(os.path.join(BASE_DIR, "*_metrics.csv")):
-        try:
-            os.remove(f)
-            print(f"🗑️ Deleted: {f}")
-        except Exception as e:
-            print(f"⚠️ Could not delete {f}: {e}")
-
-    threading.Thread(
-        target=detect_loop,
-        args=(
-            "CPU",
-            cpu_queue,
-            cpu_timestamp_window,
-            cpu_usage_window,
-            # cpu_data,
-            os.path.join(BASE_DIR, "cpu_metrics.csv"),
-        ),
-        daemon=True,
-    ).start()
-    threading.Thread(
-        target=detect_loop,
-        args=(
-            "MEM",
-            mem_queue,
-            mem_timestamp_window,
-            mem_usage_window,
-            os.path.join(BASE_DIR, "memory_metrics.csv"),
-        ),
-        daemon=True,
-    ).start()
+    pool = DetectionPool(store=store, rollups=rollups, alerts=alerts)
+    # Raw scrapes, for `replay`
+    recorder = Recorder(RECORD_DIR) if RECORD_DIR else None
+    if recorder is not None:
+        print(f"⏺️ Recording scrapes to: {RECORD_DIR}")
     try:
-        scrape_loop()
+        scrape_loop(targets, pool, recorder)
     except KeyboardInterrupt:
         print("🛑 Exiting...")
+    finally:
+        rollups.flush()
+        alerts.stop(timeout=10)
+        if recorder is not None:
+            recorder.close()
+
+
+if __name__ == "__main__":
+    # Through the dispatcher, so that the settings read at import include .env
+    from open_telemetry_test.__main__ import run
+
+    run("supabase")
@@ -0,0 +1,137 @@
+"""
+Compact recording of the raw scrapes of the Supabase metrics endpoints.
+
+Payloads are appended, gzip compressed, to time stamped segment files (one per
+`segment_secs`), to be replayed offline with `open_telemetry_test.supabase.replay`.
+"""
+
+import glob
+import gzip
+import json
+import math
+import os
+import threading
+import time
+import zlib
+from collections.abc import Iterator
+from typing import NamedTuple
+
+# Recording is off unless this is set
+RECORD_DIR = os.getenv("SUPABASE_RECORD_DIR")
+SEGMENT_SECS = 3600
+
+_SUFFIX = ".prom.gz"
+
+
+class Recording(NamedTuple):
+    """One scrape: target name, scrape time (epoch seconds) and exposition text."""
+
+    target: str
+    ts: float
+    payload: str
+
+
+class Recorder:
+    """Append scrapes to gzip segments under `root`.
+
+    The scrapes of each `segment_secs` go to one gzip stream (a JSON header line,
+    then the payload, per scrape), so consecutive scrapes share the compression
+    window. The stream is flushed after every scrape: segments can be read while
+    they are written, and a crash only loses the scrape being written. Files are
+    never reopened, a new recorder starts new ones
+    (`<segment start>-<time opened>.prom.gz`).
+
+    Parameters
+    ----------
+    root : str
+        Directory holding the segments
+    segment_secs : int, optional
+        Time span of a segment, by default 3600
+    compresslevel : int, optional
+        gzip compression level, by default 6
+    """
+
+    def __init__(
+        self, root: str, segment_secs: int = SEGMENT_SECS, compresslevel: int = 6
+    ):
+        self.root = root
+        self.segment_secs = segment_secs
+        self.compresslevel = compresslevel
+        # Open file per segment: the newest and the one before it, for the late
+        # scrapes of concurrent targets around a boundary
+        self._files: dict[int, gzip.GzipFile] = {}
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def _open(self, segment: int) -> gzip.GzipFile:
+        name = f"{segment:010d}-{time.time_ns()}{_SUFFIX}"
+        f = gzip.GzipFile(os.path.join(self.root, name), "wb", self.compresslevel)
+        self._files[segment] = f
+        return f
+
+    def record(self, target: str, ts: float, payload: str) -> None:
+        """Append one scrape (a `PayloadCallback` of the scraper)."""
+        data = payload.encode("utf-8")
+        header = json.dumps({"target": target, "ts": ts, "size": len(data)})
+        segment = int(ts // self.segment_secs * self.segment_secs)
+        with self._lock:
+            f = self._files.get(segment)
+            if f is None:
+                f = self._open(segment)
+            f.write(header.encode() + b"\n" + data)
+            f.flush()
+            newest = max(self._files)
+            for older in [s for s in self._files if s < newest - self.segment_secs]:
+                self._files.pop(older).close()
+
+    def close(self) -> None:
+        """Complete the open segments."""
+        with self._lock:
+            for f in self._files.values():
+                f.close()
+            self._files.clear()
+
+
+def _start(path: str) -> int:
+    return int(os.path.basename(path).split("-")[0])
+
+
+def segments(
+    root: str, start: float | None = None, end: float | None = None
+) -> list[str]:
+    """Segment files of `root` that may hold scrapes in [start, end), in order."""
+    paths = sorted(glob.glob(os.path.join(root, "*" + _SUFFIX)))
+    bounds = sorted({_start(path) for path in paths}) + [math.inf]
+    following = dict(zip(bounds[:-1], bounds[1:], strict=True))
+    return [
+        path
+        for path in paths
+        if (end is None or _start(path) < end)
+        and (start is None or following[_start(path)] > start)
+    ]
+
+
+def read_recordings(
+    root: str, start: float | None = None, end: float | None = None
+) -> Iterator[Recording]:
+    """Recorded scrapes of `root` made in [start, end), in recording order."""
+    for path in segments(root, start, end):
+        with gzip.open(path, "rb") as f:
+            while True:
+                try:
+                    header = f.readline()
+                    if not header:
+                        break
+                    meta = json.loads(header)
+                    data = f.read(meta["size"])
+                    if len(data) < meta["size"]:
+                        raise EOFError("truncated scrape")
+                except EOFError:
+                    # Segment still being written, or cut short by a crash
+                    break
+                except (gzip.BadGzipFile, zlib.error, json.JSONDecodeError) as e:
+                    print(f"⚠️ Skipping the end of {path}: {e}")
+                    break
+                ts = meta["ts"]
+                if (start is None or ts >= start) and (end is None or ts < end):
+                    yield Recording(meta["target"], ts, data.decode("utf-8"))
@@ -0,0 +1,221 @@
+"""
+Replay recorded Supabase scrapes through the detection pipeline, offline.
+
+The payloads saved by `recorder.Recorder` (SUPABASE_RECORD_DIR) go through the same
+stages as live scrapes, `parse_prometheus_metrics`, the derived metrics and detection,
+as fast as they can be read rather than one per minute. A day of history takes seconds,
+to try a detector change or to backfill a metrics store:
+
+    uv run python -m open_telemetry_test replay recordings --engine ewma
+
+TimeGPT is not called unless `--nixtla-every` (or the "nixtla" engine) asks for it.
+Then the samples of each scrape are sent in one batch, and the replay waits for it
+(and for the recalibrations) before the next scrape, so it runs at TimeGPT's pace.
+"""
+
+import argparse
+import time
+from collections.abc import Iterable
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+
+import pandas as pd
+
+from open_telemetry_test.alerts import Alert
+from open_telemetry_test.supabase.coordinator import DetectionCoordinator
+from open_telemetry_test.supabase.derived import DerivedMetrics
+from open_telemetry_test.supabase.detectors import make_detector
+from open_telemetry_test.supabase.exposition import parse_prometheus_metrics
+from open_telemetry_test.supabase.performance import (
+    ANOMALY_THRESHOLD,
+    DETECTOR_ENGINE,
+    SeriesState,
+    detect_sample,
+    detection_coordinator,
+)
+from open_telemetry_test.supabase.recorder import RECORD_DIR, Recording, read_recordings
+from open_telemetry_test.supabase.rollup import RollupEngine
+from open_telemetry_test.supabase.store import MetricStore
+
+# read: decompress and frame, parse: exposition text, derive: derived metrics,
+# detect: windows, detectors (and store / rollups)
+STAGES = ("read", "parse", "derive", "detect")
+
+
+@dataclass
+class ReplayStats:
+    """Throughput, time per stage and anomalies of a replay."""
+
+    events: int = 0  # scrapes
+    samples: int = 0  # derived samples
+    elapsed: float = 0.0
+    timings: dict[str, float] = field(
+        default_factory=lambda: dict.fromkeys(STAGES, 0.0)
+    )
+    anomalies: list[Alert] = field(default_factory=list)
+
+    @property
+    def events_per_sec(self) -> float:
+        return self.events / self.elapsed if self.elapsed else 0.0
+
+    def report(self) -> str:
+        lines = [
+            f"{self.events} scrapes, {self.samples} samples, "
+            f"{len(self.anomalies)} anomalies in {self.elapsed:.2f}s "
+            f"({self.events_per_sec:,.0f} scrapes/s)"
+        ]
+        for stage, secs in self.timings.items():
+            share = secs / self.elapsed if self.elapsed else 0.0
+            per_event = secs / self.events if self.events else 0.0
+            lines.append(
+                f"  {stage:<7}{secs:8.3f}s {share:6.1%} {per_event * 1e6:9.1f}µs/scrape"
+            )
+        return "\n".join(lines)
+
+
+def replay(
+    source: str | Iterable[Recording],
+    engine: str = DETECTOR_ENGINE,
+    nixtla_every: int = 0,
+    store: MetricStore | None = None,
+    rollups: RollupEngine | None = None,
+    registry: DerivedMetrics | None = None,
+    start: float | None = None,
+    end: float | None = None,
+    coordinator: DetectionCoordinator | None = None,
+) -> ReplayStats:
+    """Run recorded scrapes through parsing, derived metrics and detection.
+
+    Parameters
+    ----------
+    source : str | Iterable[Recording]
+        Recording directory, or the recordings themselves
+    engine : str, optional
+        Detector of every series (see `detectors.make_detector`, or "nixtla"), by
+        default `SUPABASE_DETECTOR`
+    nixtla_every : int, optional
+        Recalibrate the detectors against TimeGPT every N samples, by default 0
+        (offline)
+    store : MetricStore | None, optional
+        Backfill the aligned series into this store, by default None
+    rollups : RollupEngine | None, optional
+        Fold the samples into these rollups, by default None
+    registry : DerivedMetrics | None, optional
+        Derived metrics, by default a new registry of the default ones
+    start, end : float | None, optional
+        Only replay the scrapes made in [start, end) (epoch seconds)
+    coordinator : DetectionCoordinator | None, optional
+        Batches the TimeGPT calls of each scrape, by default the shared one
+
+    Returns
+    -------
+    ReplayStats
+        Scrapes per second, time spent per stage and the anomalies found
+    """
+    recordings = (
+        read_recordings(source, start, end) if isinstance(source, str) else source
+    )
+
+    def new_state() -> SeriesState:
+        detector = (
+            None
+            if engine == "nixtla"
+            else make_detector(engine, threshold=ANOMALY_THRESHOLD)
+        )
+        return SeriesState(detector=detector)
+
+    coordinator = coordinator or detection_coordinator
+    calls_nixtla = engine == "nixtla" or nixtla_every > 0
+    registry = registry or DerivedMetrics()
+    families = registry.families
+    series: dict[str, SeriesState] = {}
+    stats = ReplayStats()
+    timings = stats.timings
+    clock = time.perf_counter
+    started = last = clock()
+    for recording in recordings:
+        now = clock()
+        timings["read"] += now - last
+        last = now
+
+        metrics = parse_prometheus_metrics(recording.payload, families)
+        now = clock()
+        timings["parse"] += now - last
+        last = now
+
+        samples = registry.evaluate(recording.target, recording.ts, metrics)
+        now = clock()
+        timings["derive"] += now - last
+        last = now
+
+        verdicts = [
+            detect_sample(
+                series,
+                unique_id,
+                ts,
+                value,
+                store,
+                rollups,
+                nixtla_every,
+                new_state,
+                coordinator,
+            )
+            for unique_id, ts, value, _ in samples
+        ]
+        if calls_nixtla:
+            # One TimeGPT call for the scrape, recalibrations applied before the next
+            coordinator.flush(wait=True)
+        for (unique_id, ts, value, unit), verdict in zip(
+            samples, verdicts, strict=True
+        ):
+            if isinstance(verdict, Future):
+                verdict = verdict.result()
+            if verdict:
+                stats.anomalies.append(
+                    Alert(unique_id, ts, value, f"{value:.2f}{unit}")
+                )
+        stats.samples += len(samples)
+        stats.events += 1
+        now = clock()
+        timings["detect"] += now - last
+        last = now
+    stats.elapsed = clock() - started
+    if rollups is not None:
+        rollups.flush()
+    return stats
+
+
+def _epoch(value: str) -> float:
+    return pd.Timestamp(value).timestamp()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "source", nargs="?", default=RECORD_DIR, help="recording directory"
+    )
+    parser.add_argument("--engine", default=DETECTOR_ENGINE)
+    parser.add_argument("--nixtla-every", type=int, default=0)
+    parser.add_argument("--store", help="metrics store directory to backfill")
+    parser.add_argument("--start", type=_epoch, help="e.g. 2025-01-01T00:00")
+    parser.add_argument("--end", type=_epoch)
+    args = parser.parse_args()
+    if not args.source:
+        parser.error("no recording directory (nor SUPABASE_RECORD_DIR)")
+
+    stats = replay(
+        args.source,
+        engine=args.engine,
+        nixtla_every=args.nixtla_every,
+        store=MetricStore(args.store) if args.store else None,
+        start=args.start,
+        end=args.end,
+    )
+    for alert in stats.anomalies:
+        ts = pd.Timestamp(alert.ts, unit="s").isoformat()
+        print(f"[{ts}] 🚨 {alert.series} Anomaly: {alert.message}")
+    print(stats.report())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+"""
+Multi-resolution rollups (min / max / mean / count / last) of metric series.
+"""
+
+import os
+import threading
+from dataclasses import dataclass
+
+import numpy as np
+
+from open_telemetry_test.supabase.store import STORE_DIR, MetricStore
+
+ROLLUP_DTYPE = np.dtype(
+    [
+        ("ts", "<i8"),
+        ("min", "<f8"),
+        ("max", "<f8"),
+        ("sum", "<f8"),
+        ("count", "<i8"),
+        ("last", "<f8"),
+    ]
+)
+
+ROLLUP_DIR = os.path.join(STORE_DIR, "rollups")
+
+
+@dataclass(frozen=True)
+class Tier:
+    """A rollup resolution: buckets of `width` seconds kept for `retention` seconds."""
+
+    name: str
+    width: int
+    retention: int
+
+    @property
+    def capacity(self) -> int:
+        return self.retention // self.width
+
+
+DEFAULT_TIERS = (
+    Tier("1m", 60, 2 * 24 * 3600),
+    Tier("5m", 300, 14 * 24 * 3600),
+    Tier("1h", 3600, 365 * 24 * 3600),
+)
+
+
+def select_tier(
+    tiers: tuple[Tier, ...], start: int, end: int, max_points: int, now: int
+) -> Tier:
+    """Pick the tier to read the range `[start, end)` from.
+
+    This is the finest tier that still covers `start` within its retention and
+    returns at most `max_points` buckets for the range, i.e. the coarsest data
+    needed to draw (or score) the range. Falls back to the coarsest tier.
+    """
+    for tier in sorted(tiers, key=lambda tier: tier.width):
+        if now - start <= tier.retention and (end - start) / tier.width <= max_points:
+            return tier
+    return max(tiers, key=lambda tier: tier.width)
+
+
+def mean(records: np.ndarray) -> np.ndarray:
+    """Mean value of every bucket."""
+    return records["sum"] / np.maximum(records["count"], 1)
+
+
+class _Ring:
+    """Buffer of the last `capacity` rollup records.
+
+    Memory is allocated as records arrive (doubling, up to `capacity`), so that
+    series with little history, or tiers with a long retention, stay small.
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._records = np.zeros(min(capacity, 16), dtype=ROLLUP_DTYPE)
+        self._start = 0
+        self._size = 0
+
+    @property
+    def records(self) -> np.ndarray:
+        end = self._start + self._size
+        if end <= len(self._records):
+            return self._records[self._start : end]
+        return np.concatenate(
+            [self._records[self._start :], self._records[: end - len(self._records)]]
+        )
+
+    def push(self, record) -> None:
+        if self._size < self.capacity:
+            if self._size == len(self._records):
+                # Not full yet, so not wrapped around either
+                grown = np.zeros(min(2 * self._size, self.capacity), ROLLUP_DTYPE)
+                grown[: self._size] = self._records
+                self._records = grown
+            self._records[(self._start + self._size) % len(self._records)] = record
+            self._size += 1
+        else:
+            self._records[self._start] = record
+            self._start = (self._start + 1) % self.capacity
+
+    def pop(self):
+        self._size -= 1
+        return self._records[(self._start + self._size) % len(self._records)].copy()
+
+
+class RollupEngine:
+    """Maintain every tier of rollups for many series as samples arrive.
+
+    Each (series, tier) has one open bucket that samples are folded into in O(1).
+    When a sample falls into a later bucket, the open bucket is closed: it is kept
+    in an in-memory ring (of at most the tier's retention, allocated as buckets
+    close) and appended to
+    the tier's `MetricStore` under `root`, which other processes (the dashboard)
+    can read. Files are trimmed to the retention as they grow.
+
+    Parameters
+    ----------
+    root : str | None, optional
+        Directory of the per-tier stores, by default ROLLUP_DIR. None keeps the
+        rollups in memory only.
+    tiers : tuple[Tier, ...], optional
+        Resolutions to maintain, by default DEFAULT_TIERS
+    """
+
+    def __init__(self, root: str | None = ROLLUP_DIR, tiers=DEFAULT_TIERS):
+        self.tiers = tuple(tiers)
+        self.stores = (
+            {
+                tier.name: MetricStore(os.path.join(root, tier.name), ROLLUP_DTYPE)
+                for tier in self.tiers
+            }
+            if root is not None
+            else {}
+        )
+        self._rings: dict[tuple[str, str], _Ring] = {}
+        self._open: dict[tuple[str, str], np.ndarray] = {}
+        self._trimmed: dict[tuple[str, str], int] = {}
+        self._lock = threading.Lock()
+
+    def _ring(self, series: str, tier: Tier) -> _Ring:
+        key = (series, tier.name)
+        ring = self._rings.get(key)
+        if ring is None:
+            ring = self._rings[key] = _Ring(tier.capacity)
+            # Resume from the persisted history
+            if tier.name in self.stores:
+                for record in self.stores[tier.name].read(series)[-tier.capacity :]:
+                    ring.push(record)
+        return ring
+
+    def _close(self, series: str, tier: Tier, bucket: np.ndarray) -> None:
+        self._ring(series, tier).push(bucket[0])
+        store = self.stores.get(tier.name)
+        if store is None:
+            return
+        store.append(series, bucket)
+        key = (series, tier.name)
+        bucket_ts = int(bucket["ts"][0])
+        # Trim the file once it holds 10% more than the retention
+        trimmed = self._trimmed.setdefault(key, bucket_ts)
+        if bucket_ts - trimmed >= tier.retention * 1.1:
+            store.truncate_before(series, bucket_ts - tier.retention)
+            self._trimmed[key] = bucket_ts - tier.retention
+
+    def update(self, series: str, ts: float, value: float) -> None:
+        """Fold a sample (epoch seconds, value) into every tier of `series`.
+
+        Samples older than the open bucket of a tier are ignored for that tier.
+        """
+        with self._lock:
+            for tier in self.tiers:
+                self._update_tier(series, tier, ts, value)
+
+    def _update_tier(self, series: str, tier: Tier, ts: float, value: float) -> None:
+        key = (series, tier.name)
+        bucket_ts = int(ts) // tier.width * tier.width
+        bucket = self._open.get(key)
+        if bucket is None:
+            ring = self._ring(series, tier)
+            # Re-open the last persisted bucket after a restart
+            if ring.records.size and ring.records["ts"][-1] == bucket_ts:
+                bucket = ring.pop().reshape(1)
+        elif bucket_ts > bucket["ts"][0]:
+            self._close(series, tier, bucket)
+            bucket = None
+        elif bucket_ts < bucket["ts"][0]:
+            return
+
+        if bucket is None:
+            bucket = np.array(
+                [(bucket_ts, value, value, value, 1, value)], dtype=ROLLUP_DTYPE
+            )
+        else:
+            record = bucket[0]
+            record["min"] = min(record["min"], value)
+            record["max"] = max(record["max"], value)
+            record["sum"] += value
+            record["count"] += 1
+            record["last"] = value
+        self._open[key] = bucket
+
+    def flush(self) -> None:
+        """Close every open bucket, e.g. before exiting.
+
+        A later sample in the same bucket (after a restart) re-opens it, and the
+        store keeps the last record of a bucket.
+        """
+        with self._lock:
+            for (series, name), bucket in self._open.items():
+                tier = next(tier for tier in self.tiers if tier.name == name)
+                self._close(series, tier, bucket)
+            self._open.clear()
+
+    def query(
+        self,
+        series: str,
+        start: int,
+        end: int,
+        max_points: int = 1000,
+        now: int | None = None,
+    ) -> tuple[Tier, np.ndarray]:
+        """Rollups of `series` in `[start, end)` from the tier picked by `select_tier`.
+
+        Includes the (still open) latest bucket.
+
+        Returns
+        -------
+        tuple[Tier, np.ndarray]
+            The tier used and its records (ROLLUP_DTYPE)
+        """
+        now = end if now is None else now
+        tier = select_tier(self.tiers, start, end, max_points, now)
+        with self._lock:
+            records = self._ring(series, tier).records
+            open_bucket = self._open.get((series, tier.name))
+            records = np.concatenate(
+                [records] if open_bucket is None else [records, open_bucket]
+            )
+        ts = records["ts"]
+        lo, hi = np.searchsorted(ts, [start, end], side="left")
+        return tier, records[lo:hi]
@@ -0,0 +1,211 @@
+"""
+Asynchronous scraper for the metrics endpoints of many Supabase projects.
+
+Ref: https://supabase.com/docs/guides/telemetry/metrics
+"""
+
+import asyncio
+import os
+import random
+import time
+from collections.abc import Callable, Iterable
+from dataclasses import dataclass
+from datetime import datetime
+
+import httpx
+
+from open_telemetry_test.supabase.exposition import ExpositionParser, Sample
+
+
+@dataclass(frozen=True)
+class Target:
+    """A metrics endpoint to scrape."""
+
+    name: str
+    url: str
+    username: str = "service_role"
+    password: str = ""
+
+
+# Called with (target, scrape time in epoch seconds, parsed metrics)
+MetricsCallback = Callable[[Target, float, dict[str, list[Sample]]], None]
+# Called with (target name, scrape time in epoch seconds, raw exposition text)
+PayloadCallback = Callable[[str, float, str], None]
+
+
+def supabase_target(project: str, jwt: str) -> Target:
+    """Target for the privileged metrics endpoint of a Supabase project."""
+    return Target(
+        name=project,
+        url=f"https://{project}.supabase.co/customer/v1/privileged/metrics",
+        password=jwt,
+    )
+
+
+def load_targets(
+    projects: str | None = None, default_jwt: str | None = None
+) -> list[Target]:
+    """Build the scrape targets from the environment.
+
+    Parameters
+    ----------
+    projects : str | None, optional
+        Comma separated project refs, each optionally followed by `:<jwt>` to use
+        a project specific service role key. Defaults to `SUPABASE_PROJECTS`, then
+        to the single `SUPABASE_PROJECT`.
+    default_jwt : str | None, optional
+        Service role key used for projects without their own, by default
+        `SUPABASE_JWT`
+
+    Returns
+    -------
+    list[Target]
+        The targets to scrape
+
+    Raises
+    ------
+    ValueError
+        If no project is configured or a project has no service role key
+    """
+    if projects is None:
+        projects = os.getenv("SUPABASE_PROJECTS") or os.getenv("SUPABASE_PROJECT")
+    if default_jwt is None:
+        default_jwt = os.getenv("SUPABASE_JWT")
+
+    targets = []
+    for entry in (projects or "").split(","):
+        project, _, jwt = entry.strip().partition(":")
+        if not project:
+            continue
+        jwt = jwt or default_jwt or ""
+        if not jwt:
+            raise ValueError(f"No service role key (SUPABASE_JWT) for {project}.")
+        targets.append(supabase_target(project, jwt))
+    if not targets:
+        raise ValueError(
+            "Please set SUPABASE_PROJECT (or SUPABASE_PROJECTS) and SUPABASE_JWT "
+            "environment variables."
+        )
+    return targets
+
+
+class AsyncScraper:
+    """Scrape many targets concurrently over a shared, keep-alive connection pool.
+
+    Each target is scraped every `interval` seconds. Targets start at a random
+    offset within `jitter` seconds so their requests are spread over the interval
+    instead of bursting together, and every scrape (connect, response and parse)
+    must finish within `timeout` seconds.
+
+    Parameters
+    ----------
+    targets : Iterable[Target]
+        Endpoints to scrape
+    on_metrics : MetricsCallback
+        Called in the event loop with the parsed metrics of every successful
+        scrape, so it should hand work off rather than block
+    interval : float, optional
+        Seconds between two scrapes of the same target, by default 60
+    timeout : float, optional
+        Per-target deadline for a scrape in seconds, by default 10
+    jitter : float | None, optional
+        Start offsets are drawn from [0, jitter), by default half the interval
+    families : Iterable[str] | None, optional
+        Metric family allowlist passed to the parser, by default None
+    max_connections : int, optional
+        Size of the connection pool, by default 20
+    on_payload : PayloadCallback | None, optional
+        Also called with the raw text of every successful scrape (e.g.
+        `Recorder.record`), by default None
+    """
+
+    def __init__(
+        self,
+        targets: Iterable[Target],
+        on_metrics: MetricsCallback,
+        interval: float = 60,
+        timeout: float = 10,
+        jitter: float | None = None,
+        families: Iterable[str] | None = None,
+        max_connections: int = 20,
+        on_payload: PayloadCallback | None = None,
+    ):
+        self.targets = list(targets)
+        self.on_metrics = on_metrics
+        self.interval = interval
+        self.timeout = timeout
+        self.jitter = interval / 2 if jitter is None else jitter
+        self.families = tuple(families) if families is not None else None
+        self.on_payload = on_payload
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_connections,
+        )
+
+    async def scrape(
+        self,
+        client: httpx.AsyncClient,
+        target: Target,
+        lines: list[str] | None = None,
+    ):
+        """Scrape and parse one target, returning None on error or timeout.
+
+        The raw lines are also appended to `lines` when given.
+        """
+        parser = ExpositionParser(self.families)
+
+        async def _read():
+            async with client.stream(
+                "GET", target.url, auth=(target.username, target.password)
+            ) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    line = line.rstrip("\r\n")
+                    parser.feed(line)
+                    if lines is not None:
+                        lines.append(line)
+
+        try:
+            await asyncio.wait_for(_read(), timeout=self.timeout)
+            return parser.metrics
+        except Exception as e:
+            reason = "timed out" if isinstance(e, asyncio.TimeoutError) else e
+            print(
+                f"[{datetime.utcnow().isoformat()}] ⚠️ Error fetching metrics "
+                f"for {target.name}: {reason}"
+            )
+            return None
+
+    async def _run_target(
+        self, client: httpx.AsyncClient, target: Target, rounds: int | None
+    ):
+        await asyncio.sleep(random.uniform(0, self.jitter))
+        next_run = time.monotonic()
+        completed = 0
+        while True:
+            ts = time.time()
+            lines: list[str] | None = [] if self.on_payload is not None else None
+            metrics = await self.scrape(client, target, lines)
+            if metrics:
+                try:
+                    if self.on_payload is not None and lines is not None:
+                        self.on_payload(target.name, ts, "\n".join(lines) + "\n")
+                    self.on_metrics(target, ts, metrics)
+                except Exception as e:
+                    # A failing sink must not stop the scrapes of the other targets
+                    print(
+                        f"[{datetime.utcnow().isoformat()}] ⚠️ Error handling metrics "
+                        f"of {target.name}: {e}"
+                    )
+            completed += 1
+            if rounds is not None and completed >= rounds:
+                return
+            next_run += self.interval
+            await asyncio.sleep(max(0, next_run - time.monotonic()))
+
+    async def run(self, rounds: int | None = None) -> None:
+        """Scrape all targets until cancelled (or for `rounds` scrapes each)."""
+        async with httpx.AsyncClient(limits=self.limits) as client:
+            await asyncio.gather(
+                *(self._run_target(client, target, rounds) for target in self.targets)
+            )
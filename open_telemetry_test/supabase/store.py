@@ -0,0 +1,197 @@
+"""
+Append-only, memory-mapped store for metric series shared between processes.
+"""
+
+import contextlib
+import glob
+import os
+from urllib.parse import quote, unquote
+
+import numpy as np
+
+# One fixed-size record per (bin) timestamp: epoch seconds and value
+RECORD_DTYPE = np.dtype([("ts", "<i8"), ("y", "<f8")])
+
+_SUFFIX = ".bin"
+# Updates of points older than the last one of a series
+_LATE_SUFFIX = ".late"
+
+# The late records of a series are merged into its file once there are this many
+LATE_COMPACT_RECORDS = int(os.getenv("SUPABASE_STORE_LATE_RECORDS", "4096"))
+
+# Shared by the detector (writer) and the dashboard (reader)
+STORE_DIR = os.getenv(
+    "SUPABASE_METRICS_STORE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "metrics_store"),
+)
+
+
+class MetricStore:
+    """Binary log of fixed-size records per series, one file per series.
+
+    The (single) writer only ever appends whole records, so readers can memory-map
+    a file at any time and see a consistent prefix of it: a partially written
+    trailing record is ignored until it is complete. Appending a record with the
+    `ts` of an earlier one updates that point (the last record wins when reading).
+
+    The file of a series stays sorted by `ts`, so that a time range is read as a
+    slice of the mapped file. Records older than the last one of the file (late
+    updates) are appended to a small side log instead, merged into what is read,
+    and into the file itself once it holds `LATE_COMPACT_RECORDS` records (or on
+    `truncate_before`).
+
+    Parameters
+    ----------
+    root : str
+        Directory holding the series files
+    dtype : np.dtype, optional
+        Record layout, must contain an int64 `ts` field, by default RECORD_DTYPE
+    """
+
+    def __init__(self, root: str, dtype: np.dtype = RECORD_DTYPE):
+        self.root = root
+        self.dtype = np.dtype(dtype)
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, series: str) -> str:
+        return os.path.join(self.root, quote(series, safe="") + _SUFFIX)
+
+    def late_path(self, series: str) -> str:
+        return os.path.join(self.root, quote(series, safe="") + _LATE_SUFFIX)
+
+    def series(self) -> list[str]:
+        """Names of all series in the store."""
+        files = glob.glob(os.path.join(self.root, "*" + _SUFFIX))
+        return sorted(unquote(os.path.basename(f)[: -len(_SUFFIX)]) for f in files)
+
+    def append(self, series: str, records: np.ndarray) -> None:
+        """Append `records` (an array of `dtype`, in `ts` order) to `series`.
+
+        O(len(records)), except when the late records are compacted.
+        """
+        records = np.ascontiguousarray(records, dtype=self.dtype)
+        last = self._last_ts(series)
+        late = records["ts"] < last if last is not None else None
+        if late is None or not late.any():
+            with open(self.path(series), "ab") as f:
+                f.write(records.tobytes())
+            return
+
+        with open(self.late_path(series), "ab") as f:
+            f.write(records[late].tobytes())
+            late_count = f.tell() // self.dtype.itemsize
+        if not late.all():
+            with open(self.path(series), "ab") as f:
+                f.write(records[~late].tobytes())
+        if late_count >= LATE_COMPACT_RECORDS:
+            self._rewrite(series, self.read(series))
+
+    def _last_ts(self, series: str) -> int | None:
+        """`ts` of the last complete record of the file of `series`."""
+        try:
+            with open(self.path(series), "rb") as f:
+                count = f.seek(0, os.SEEK_END) // self.dtype.itemsize
+                if count == 0:
+                    return None
+                f.seek((count - 1) * self.dtype.itemsize)
+                last = np.frombuffer(f.read(self.dtype.itemsize), dtype=self.dtype)
+        except FileNotFoundError:
+            return None
+        return int(last["ts"][0])
+
+    def _read_late(self, series: str) -> np.ndarray:
+        try:
+            with open(self.late_path(series), "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return np.empty(0, dtype=self.dtype)
+        count = len(data) // self.dtype.itemsize
+        return np.frombuffer(data, dtype=self.dtype, count=count)
+
+    def _rewrite(self, series: str, records: np.ndarray) -> None:
+        """Replace the file of `series` by `records`, and drop its late records.
+
+        The new file atomically replaces the old one, so readers that already
+        mapped the old file are not affected.
+        """
+        path = self.path(series)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(np.ascontiguousarray(records).tobytes())
+        os.replace(tmp_path, path)
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self.late_path(series))
+
+    def version(self, series: str | None = None) -> int:
+        """Token that changes whenever `series` (or any series) is written to.
+
+        Can be used as a cache key for data read from the store.
+        """
+        names = [series] if series is not None else self.series()
+        total = 0
+        for name in names:
+            for path in (self.path(name), self.late_path(name)):
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                total += stat.st_size + stat.st_mtime_ns
+        return total
+
+    def truncate_before(self, series: str, ts: int) -> None:
+        """Drop the records of `series` older than `ts` (used for retention).
+
+        The late records are merged into the kept ones.
+        """
+        self._rewrite(series, self.read(series, start=ts))
+
+    def read(
+        self, series: str, start: int | None = None, end: int | None = None
+    ) -> np.ndarray:
+        """Read the records of `series` with `start <= ts < end` (epoch seconds).
+
+        The result is a read-only view on the memory-mapped file, unless points
+        were updated in the range, in which case only their last record is kept
+        (in a copy).
+        """
+        try:
+            size = os.path.getsize(self.path(series))
+        except FileNotFoundError:
+            size = 0
+        count = size // self.dtype.itemsize
+        records: np.ndarray = (
+            np.memmap(self.path(series), dtype=self.dtype, mode="r", shape=(count,))
+            if count
+            else np.empty(0, dtype=self.dtype)
+        )
+        ts = records["ts"]
+        lo = 0 if start is None else int(np.searchsorted(ts, start, side="left"))
+        hi = count if end is None else int(np.searchsorted(ts, end, side="left"))
+        records = records[lo:hi]
+
+        late = self._read_late(series)
+        if len(late):
+            in_range = np.ones(len(late), dtype=bool)
+            if start is not None:
+                in_range &= late["ts"] >= start
+            if end is not None:
+                in_range &= late["ts"] < end
+            if in_range.any():
+                # Late records were written after the records of the file with the
+                # same ts: the stable sort keeps them after those
+                merged = np.concatenate([records, late[in_range]])
+                records = merged[np.argsort(merged["ts"], kind="stable")]
+
+        ts = records["ts"]
+        updated = ts[1:] == ts[:-1]
+        if updated.any():
+            # Keep the last record of every timestamp
+            records = records[np.append(~updated, True)]
+        return records
+
+    def clear(self) -> None:
+        """Delete all series."""
+        for series in self.series():
+            os.remove(self.path(series))
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(self.late_path(series))
@@ -0,0 +1,155 @@
+"""
+Fixed-capacity sliding window of a time series on a regular time grid.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+class TimeSeriesWindow:
+    """Array-backed ring buffer that bins samples onto a regular grid as they arrive.
+
+    Samples are averaged into `freq`-second bins and missing bins are filled by
+    linear interpolation, which matches `resample(freq).mean().interpolate()` over
+    the window without rebuilding it on every sample. Samples arriving late for a
+    bin still inside the window are folded into that bin and only the interpolated
+    bins next to it are recomputed.
+
+    Every slot is stored twice (at `i` and `i + capacity`) so the window is always
+    a contiguous slice and `timestamps` / `values` are zero-copy views.
+
+    Parameters
+    ----------
+    capacity : int
+        Maximum number of bins kept in the window
+    freq : int, optional
+        Bin width in seconds, by default 60
+    """
+
+    def __init__(self, capacity: int, freq: int = 60):
+        self.capacity = capacity
+        self.freq = freq
+        self._ts = np.zeros(2 * capacity, dtype=np.int64)
+        self._values = np.zeros(2 * capacity, dtype=np.float64)
+        # Number of samples in each bin (0 for interpolated bins)
+        self._counts = np.zeros(2 * capacity, dtype=np.int64)
+        self._start = 0
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def timestamps(self) -> np.ndarray:
+        """Bin start times (epoch seconds), oldest first."""
+        return self._ts[self._start : self._start + self._size]
+
+    @property
+    def values(self) -> np.ndarray:
+        """Bin values, oldest first."""
+        return self._values[self._start : self._start + self._size]
+
+    @property
+    def counts(self) -> np.ndarray:
+        """Number of samples in each bin (0 for interpolated bins)."""
+        return self._counts[self._start : self._start + self._size]
+
+    def _write(self, position: int, ts: int, value: float, count: int) -> None:
+        slot = (self._start + position) % self.capacity
+        for index in (slot, slot + self.capacity):
+            self._ts[index] = ts
+            self._values[index] = value
+            self._counts[index] = count
+
+    def _push(self, ts: int, value: float, count: int) -> None:
+        if self._size < self.capacity:
+            self._size += 1
+        else:
+            self._start = (self._start + 1) % self.capacity
+        self._write(self._size - 1, ts, value, count)
+
+    def _interpolate_before(self, position: int) -> int:
+        """Re-interpolate the run of empty bins right before `position`.
+
+        Returns the position of the first bin rewritten (`position` if none was).
+        """
+        counts = self.counts
+        previous = position - 1
+        while previous >= 0 and counts[previous] == 0:
+            previous -= 1
+        if previous < 0 or previous == position - 1:
+            return position
+        ts, values = self.timestamps, self.values
+        fractions = (ts[previous + 1 : position] - ts[previous]) / (
+            ts[position] - ts[previous]
+        )
+        filled = values[previous] + (values[position] - values[previous]) * fractions
+        for offset, value in enumerate(filled, start=previous + 1):
+            self._write(offset, int(ts[offset]), float(value), 0)
+        return previous + 1
+
+    def _merge(self, position: int, value: float) -> int:
+        index = self._start + position
+        count = self._counts[index] + 1
+        mean = self._values[index] + (value - self._values[index]) / count
+        self._write(position, int(self._ts[index]), mean, int(count))
+        # Keep the interpolated bins on either side consistent with the new value
+        first = self._interpolate_before(position)
+        counts = self.counts
+        following = position + 1
+        while following < self._size and counts[following] == 0:
+            following += 1
+        if following < self._size:
+            self._interpolate_before(following)
+        return first
+
+    def append(self, ts: float, value: float) -> int:
+        """Add a sample.
+
+        Parameters
+        ----------
+        ts : float
+            Sample time in epoch seconds
+        value : float
+            Sample value
+
+        Returns
+        -------
+        int
+            Position of the first bin added or updated by the sample: the bins from
+            there to the end of the window changed (`len(self)` when none did, for a
+            sample older than the window)
+        """
+        bin_ts = int(ts) // self.freq * self.freq
+        if self._size == 0:
+            self._push(bin_ts, value, 1)
+            return 0
+
+        last_ts = int(self._ts[self._start + self._size - 1])
+        if bin_ts > last_ts:
+            steps = (bin_ts - last_ts) // self.freq
+            last_value = float(self._values[self._start + self._size - 1])
+            # Bins that would be evicted straight away are not interpolated
+            for step in range(max(1, steps - self.capacity + 1), steps):
+                fraction = step / steps
+                self._push(
+                    last_ts + step * self.freq,
+                    last_value + (value - last_value) * fraction,
+                    0,
+                )
+            self._push(bin_ts, value, 1)
+            return max(self._size - steps, 0)
+
+        offset = (last_ts - bin_ts) // self.freq
+        if offset < self._size:
+            return self._merge(self._size - 1 - offset, value)
+        return self._size
+
+    def to_frame(self) -> pd.DataFrame:
+        """Return the window as a DataFrame with `ds` (datetime) and `y` columns."""
+        return pd.DataFrame(
+            {
+                "ds": pd.to_datetime(self.timestamps, unit="s"),
+                "y": self.values.copy(),
+            }
+        )
@@ -0,0 +1,535 @@
+"""
+Shared OTEL bootstrap of the entry points.
+
+`setup_telemetry` configures the global tracer and meter providers from a
+`TelemetryConfig` (by default read from the standard `OTEL_*` environment variables).
+Providers already configured, e.g. by `opentelemetry-instrument`, are left as is.
+
+Spans are exported through a `BoundedSpanProcessor`: its queue is bounded, spans that
+do not fit are dropped (and counted), and the queue depth and drop counts are exported
+as metrics, so memory stays bounded when the collector falls behind.
+"""
+
+import collections
+import copy
+import os
+import threading
+from collections.abc import Callable, Mapping, Sequence
+from dataclasses import dataclass, replace
+from typing import TYPE_CHECKING
+
+from opentelemetry import metrics, trace
+from opentelemetry.sdk.metrics import (
+    Counter,
+    Histogram,
+    MeterProvider,
+    ObservableCounter,
+)
+from opentelemetry.sdk.metrics.export import (
+    AggregationTemporality,
+    MetricExporter,
+    MetricReader,
+    PeriodicExportingMetricReader,
+)
+from opentelemetry.sdk.resources import Resource
+from opentelemetry.sdk.trace import ReadableSpan, TracerProvider
+from opentelemetry.sdk.trace.export import (
+    BatchSpanProcessor,
+    SpanExporter,
+    SpanExportResult,
+)
+from opentelemetry.trace import SpanContext, TraceFlags
+
+if TYPE_CHECKING:
+    from open_telemetry_test.prometheus.exposition_server import (
+        CachedExpositionServer,
+    )
+
+PROTOCOLS = ("grpc", "http/protobuf")
+EXPORTERS = ("otlp", "prometheus", "console", "none")
+TEMPORALITIES = ("cumulative", "delta", "lowmemory")
+COMPRESSIONS = ("none", "gzip", "deflate")
+
+
+@dataclass(frozen=True)
+class TelemetryConfig:
+    """Settings of the export pipelines (names follow the `OTEL_*` variables)."""
+
+    service_name: str = "open-telemetry-test"
+    # No providers at all: the API stays no-op
+    sdk_disabled: bool = False
+    # "otlp", "prometheus" (metrics only), "console" or "none"
+    traces_exporter: str = "otlp"
+    # "adaptive_rate" (see open_telemetry_test.sampling, with the budget in spans/s
+    # as argument); other samplers are left to the SDK, which reads the variables
+    traces_sampler: str = ""
+    traces_sampler_arg: str = ""
+    metrics_exporter: str = "otlp"
+    # Defaults to localhost:4317 (grpc) or http://localhost:4318 (http/protobuf)
+    endpoint: str | None = None
+    protocol: str = "grpc"
+    compression: str = "none"
+    insecure: bool = True
+    # Spans
+    max_queue_size: int = 2048
+    max_export_batch_size: int = 512
+    schedule_delay_ms: int = 5000
+    # Metrics
+    export_interval_ms: int = 60000
+    export_timeout_ms: int = 30000
+    temporality: str = "cumulative"
+    prometheus_port: int = 8000
+    # Scrapes within this many ms of an encoding share its payload
+    prometheus_max_age_ms: int = 1000
+
+    def __post_init__(self):
+        for name, value, allowed in (
+            ("traces_exporter", self.traces_exporter, EXPORTERS),
+            ("metrics_exporter", self.metrics_exporter, EXPORTERS),
+            ("protocol", self.protocol, PROTOCOLS),
+            ("compression", self.compression, COMPRESSIONS),
+            ("temporality", self.temporality, TEMPORALITIES),
+        ):
+            if value not in allowed:
+                raise ValueError(f"Invalid {name} {value!r}, expected one of {allowed}")
+        if self.max_export_batch_size > self.max_queue_size:
+            raise ValueError("max_export_batch_size can not exceed max_queue_size")
+
+    @classmethod
+    def from_env(
+        cls, env: Mapping[str, str] | None = None, **defaults
+    ) -> "TelemetryConfig":
+        """Config from the `OTEL_*` variables of `env` (by default os.environ).
+
+        Keyword arguments are the defaults of the entry point; variables that are
+        set take precedence over them.
+        """
+        env = os.environ if env is None else env
+        config = replace(cls(), **defaults)
+        values: dict = {}
+        for name, variable in ENV_VARIABLES.items():
+            raw = env.get(variable)
+            if raw is None or raw == "":
+                continue
+            kind = type(getattr(config, name))
+            if kind is bool:
+                values[name] = raw.strip().lower() in ("1", "true", "yes")
+            elif kind is int:
+                values[name] = int(raw)
+            else:
+                values[name] = raw.strip().lower() if name != "endpoint" else raw
+        return replace(config, **values)
+
+
+ENV_VARIABLES = {
+    "service_name": "OTEL_SERVICE_NAME",
+    "sdk_disabled": "OTEL_SDK_DISABLED",
+    "traces_exporter": "OTEL_TRACES_EXPORTER",
+    "traces_sampler": "OTEL_TRACES_SAMPLER",
+    "traces_sampler_arg": "OTEL_TRACES_SAMPLER_ARG",
+    "metrics_exporter": "OTEL_METRICS_EXPORTER",
+    "endpoint": "OTEL_EXPORTER_OTLP_ENDPOINT",
+    "protocol": "OTEL_EXPORTER_OTLP_PROTOCOL",
+    "compression": "OTEL_EXPORTER_OTLP_COMPRESSION",
+    "insecure": "OTEL_EXPORTER_OTLP_INSECURE",
+    "max_queue_size": "OTEL_BSP_MAX_QUEUE_SIZE",
+    "max_export_batch_size": "OTEL_BSP_MAX_EXPORT_BATCH_SIZE",
+    "schedule_delay_ms": "OTEL_BSP_SCHEDULE_DELAY",
+    "export_interval_ms": "OTEL_METRIC_EXPORT_INTERVAL",
+    "export_timeout_ms": "OTEL_METRIC_EXPORT_TIMEOUT",
+    "temporality": "OTEL_EXPORTER_OTLP_METRICS_TEMPORALITY_PREFERENCE",
+    "prometheus_port": "OTEL_EXPORTER_PROMETHEUS_PORT",
+    "prometheus_max_age_ms": "PROMETHEUS_MAX_AGE_MS",
+}
+
+
+class _CountingExporter(SpanExporter):
+    """Exporter that counts the spans it is handed, by result."""
+
+    def __init__(self, exporter: SpanExporter):
+        self.exporter = exporter
+        self.handed = 0
+        self.exported = 0
+        self.failed = 0
+        self._lock = threading.Lock()
+
+    def export(self, spans: Sequence[ReadableSpan]) -> SpanExportResult:
+        with self._lock:
+            self.handed += len(spans)
+        try:
+            result = self.exporter.export(spans)
+        except Exception:
+            result = SpanExportResult.FAILURE
+        with self._lock:
+            if result == SpanExportResult.SUCCESS:
+                self.exported += len(spans)
+            else:
+                self.failed += len(spans)
+        return result
+
+    def shutdown(self) -> None:
+        self.exporter.shutdown()
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return self.exporter.force_flush(timeout_millis)
+
+
+def _marked_sampled(span: ReadableSpan) -> ReadableSpan:
+    """Copy of a kept, unsampled span that the SDK's processor exports."""
+    context = span.context
+    kept = copy.copy(span)
+    kept._context = SpanContext(
+        context.trace_id,
+        context.span_id,
+        context.is_remote,
+        TraceFlags(context.trace_flags | TraceFlags.SAMPLED),
+        context.trace_state,
+    )
+    return kept
+
+
+class BoundedSpanProcessor(BatchSpanProcessor):
+    """Export ended spans in batches from a bounded queue.
+
+    The SDK's BatchSpanProcessor (shutdown and force_flush included), but spans
+    that do not fit in the queue are dropped instead of evicting queued ones, and
+    the queue depth and the number of dropped (queue full), exported and failed
+    spans are available for monitoring.
+
+    Parameters
+    ----------
+    exporter : SpanExporter
+        Exporter of the batches
+    max_queue_size : int, optional
+        Spans kept while waiting for export; later spans are dropped, by default 2048
+    max_export_batch_size : int, optional
+        Spans per export, by default 512
+    schedule_delay_ms : int, optional
+        Maximum delay before queued spans are exported, by default 5000
+    keep : Callable[[ReadableSpan], bool] | None, optional
+        Called with the spans that were recorded but not sampled. When it returns
+        True, the whole trace is exported anyway (marked sampled): the unsampled
+        spans of a trace are held until its local root ends (at most
+        `max_queue_size` of them), by default None
+    """
+
+    def __init__(
+        self,
+        exporter: SpanExporter,
+        max_queue_size: int = 2048,
+        max_export_batch_size: int = 512,
+        schedule_delay_ms: int = 5000,
+        keep: Callable[[ReadableSpan], bool] | None = None,
+    ):
+        self.exporter = exporter
+        self.keep = keep
+        self.max_queue_size = max_queue_size
+        self.dropped = 0
+        self._counting = _CountingExporter(exporter)
+        # Spans handed to the SDK's queue; those not yet exported are its depth
+        self._emitted = 0
+        self._shutdown = False
+        self._emit_lock = threading.Lock()
+        # Unsampled spans of the open traces, and the open traces that are kept
+        self._held: collections.OrderedDict[int, list[ReadableSpan]] = (
+            collections.OrderedDict()
+        )
+        self._held_spans = 0
+        self._kept: collections.OrderedDict[int, None] = collections.OrderedDict()
+        self._held_lock = threading.Lock()
+        super().__init__(
+            self._counting,
+            max_queue_size=max_queue_size,
+            schedule_delay_millis=schedule_delay_ms,
+            max_export_batch_size=max_export_batch_size,
+        )
+
+    @property
+    def queue_depth(self) -> int:
+        return max(self._emitted - self._counting.handed, 0)
+
+    @property
+    def exported(self) -> int:
+        return self._counting.exported
+
+    @property
+    def failed(self) -> int:
+        return self._counting.failed
+
+    def on_end(self, span: ReadableSpan) -> None:
+        if self._shutdown:
+            return
+        if span.context.trace_flags.sampled:
+            self._enqueue([span])
+        elif self.keep is not None:
+            self._enqueue(
+                [_marked_sampled(held) for held in self._hold(span, self.keep(span))]
+            )
+
+    def _hold(self, span: ReadableSpan, keep: bool) -> list[ReadableSpan]:
+        """Hold an unsampled span until its trace is known to be kept or not.
+
+        Returns the spans of the trace to export now.
+        """
+        trace_id = span.context.trace_id
+        local_root = span.parent is None or span.parent.is_remote
+        with self._held_lock:
+            if keep or trace_id in self._kept:
+                spans = [*self._held.pop(trace_id, ()), span]
+                self._held_spans -= len(spans) - 1
+                if local_root:
+                    self._kept.pop(trace_id, None)
+                else:
+                    self._kept[trace_id] = None
+                    if len(self._kept) > self.max_queue_size:
+                        self._kept.popitem(last=False)
+                return spans
+
+            if local_root:
+                # The trace is complete, and not kept
+                self._held_spans -= len(self._held.pop(trace_id, ()))
+                return []
+            self._held.setdefault(trace_id, []).append(span)
+            self._held_spans += 1
+            while self._held_spans > self.max_queue_size:
+                _, oldest = self._held.popitem(last=False)
+                self._held_spans -= len(oldest)
+            return []
+
+    def _enqueue(self, spans: Sequence[ReadableSpan]) -> None:
+        if not spans:
+            return
+        with self._emit_lock:
+            room = max(self.max_queue_size - self.queue_depth, 0)
+            self.dropped += max(len(spans) - room, 0)
+            accepted = spans[:room]
+            self._emitted += len(accepted)
+        for span in accepted:
+            super().on_end(span)
+
+    def shutdown(self) -> None:
+        self._shutdown = True
+        super().shutdown()
+
+
+def _temporality(preference: str) -> dict[type, AggregationTemporality]:
+    delta, cumulative = AggregationTemporality.DELTA, AggregationTemporality.CUMULATIVE
+    if preference == "delta":
+        return {Counter: delta, ObservableCounter: delta, Histogram: delta}
+    if preference == "lowmemory":
+        return {Counter: delta, ObservableCounter: cumulative, Histogram: delta}
+    return {}
+
+
+def _otlp_exporters(config: TelemetryConfig) -> tuple[SpanExporter, MetricExporter]:
+    temporality = _temporality(config.temporality)
+    if config.protocol == "grpc":
+        import grpc
+        from opentelemetry.exporter.otlp.proto.grpc.metric_exporter import (
+            OTLPMetricExporter as GrpcMetricExporter,
+        )
+        from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import (
+            OTLPSpanExporter as GrpcSpanExporter,
+        )
+
+        endpoint = config.endpoint or "localhost:4317"
+        compression = {
+            "none": grpc.Compression.NoCompression,
+            "gzip": grpc.Compression.Gzip,
+            "deflate": grpc.Compression.Deflate,
+        }[config.compression]
+        return (
+            GrpcSpanExporter(
+                endpoint=endpoint, insecure=config.insecure, compression=compression
+            ),
+            GrpcMetricExporter(
+                endpoint=endpoint,
+                insecure=config.insecure,
+                compression=compression,
+                preferred_temporality=temporality,
+            ),
+        )
+
+    from opentelemetry.exporter.otlp.proto.http import Compression
+    from opentelemetry.exporter.otlp.proto.http.metric_exporter import (
+        OTLPMetricExporter as HttpMetricExporter,
+    )
+    from opentelemetry.exporter.otlp.proto.http.trace_exporter import (
+        OTLPSpanExporter as HttpSpanExporter,
+    )
+
+    endpoint = (config.endpoint or "http://localhost:4318").rstrip("/")
+    http_compression = {
+        "none": Compression.NoCompression,
+        "gzip": Compression.Gzip,
+        "deflate": Compression.Deflate,
+    }[config.compression]
+    return (
+        HttpSpanExporter(
+            endpoint=f"{endpoint}/v1/traces", compression=http_compression
+        ),
+        HttpMetricExporter(
+            endpoint=f"{endpoint}/v1/metrics",
+            compression=http_compression,
+            preferred_temporality=temporality,
+        ),
+    )
+
+
+@dataclass
+class Telemetry:
+    """Providers created by `setup_telemetry` (None when left to someone else)."""
+
+    config: TelemetryConfig
+    tracer_provider: TracerProvider | None = None
+    meter_provider: MeterProvider | None = None
+    span_processor: BoundedSpanProcessor | None = None
+    prometheus_server: "CachedExpositionServer | None" = None
+
+    def register_pipeline_metrics(self, meter: metrics.Meter) -> None:
+        """Export the queue depth and the span counts of `span_processor`."""
+        processor = self.span_processor
+        if processor is None:
+            return
+        meter.create_observable_gauge(
+            "otel.span_processor.queue_depth",
+            callbacks=[lambda options: [metrics.Observation(processor.queue_depth)]],
+            description="Spans waiting for export",
+        )
+        meter.create_observable_counter(
+            "otel.span_processor.spans",
+            callbacks=[
+                lambda options: [
+                    metrics.Observation(processor.dropped, {"outcome": "dropped"}),
+                    metrics.Observation(processor.exported, {"outcome": "exported"}),
+                    metrics.Observation(processor.failed, {"outcome": "failed"}),
+                ]
+            ],
+            description="Spans that ended, by outcome",
+        )
+
+    def shutdown(self) -> None:
+        if self.tracer_provider is not None:
+            self.tracer_provider.shutdown()
+        if self.meter_provider is not None:
+            self.meter_provider.shutdown()
+        if self.prometheus_server is not None:
+            self.prometheus_server.stop()
+
+
+def build_telemetry(config: TelemetryConfig) -> Telemetry:
+    """Providers of `config`, without registering them globally."""
+    resource = Resource.create({"service.name": config.service_name})
+    telemetry = Telemetry(config)
+    if config.sdk_disabled:
+        return telemetry
+    otlp = None
+    if "otlp" in (config.traces_exporter, config.metrics_exporter):
+        otlp = _otlp_exporters(config)
+
+    span_exporter: SpanExporter | None = None
+    if config.traces_exporter == "otlp" and otlp is not None:
+        span_exporter = otlp[0]
+    elif config.traces_exporter == "console":
+        from opentelemetry.sdk.trace.export import ConsoleSpanExporter
+
+        span_exporter = ConsoleSpanExporter()
+    if span_exporter is not None:
+        sampler = keep = None
+        if config.traces_sampler == "adaptive_rate":
+            from open_telemetry_test.sampling import (
+                KeepErrorsAndRareValues,
+                adaptive_rate_sampler,
+            )
+
+            sampler = adaptive_rate_sampler(
+                config.traces_sampler_arg, record_unsampled=True
+            )
+            keep = KeepErrorsAndRareValues()
+        telemetry.span_processor = BoundedSpanProcessor(
+            span_exporter,
+            max_queue_size=config.max_queue_size,
+            max_export_batch_size=config.max_export_batch_size,
+            schedule_delay_ms=config.schedule_delay_ms,
+            keep=keep,
+        )
+        telemetry.tracer_provider = TracerProvider(resource=resource, sampler=sampler)
+        telemetry.tracer_provider.add_span_processor(telemetry.span_processor)
+
+    reader: MetricReader | None = None
+    if config.metrics_exporter == "otlp" and otlp is not None:
+        reader = PeriodicExportingMetricReader(
+            otlp[1],
+            export_interval_millis=config.export_interval_ms,
+            export_timeout_millis=config.export_timeout_ms,
+        )
+    elif config.metrics_exporter == "console":
+        from opentelemetry.sdk.metrics.export import ConsoleMetricExporter
+
+        reader = PeriodicExportingMetricReader(
+            ConsoleMetricExporter(
+                preferred_temporality=_temporality(config.temporality)
+            ),
+            export_interval_millis=config.export_interval_ms,
+        )
+    elif config.metrics_exporter == "prometheus":
+        from opentelemetry.exporter.prometheus import PrometheusMetricReader
+
+        from open_telemetry_test.prometheus.exposition_server import (
+            start_cached_http_server,
+        )
+
+        # Serves the default registry at :<prometheus_port>/metrics. The reader
+        # only observes values when scraped, so the cache expires by age
+        telemetry.prometheus_server = start_cached_http_server(
+            port=config.prometheus_port,
+            max_age=config.prometheus_max_age_ms / 1000,
+        )
+        reader = PrometheusMetricReader()
+    if reader is not None:
+        telemetry.meter_provider = MeterProvider(
+            resource=resource, metric_readers=[reader]
+        )
+    return telemetry
+
+
+_telemetry: Telemetry | None = None
+_lock = threading.Lock()
+
+
+def setup_telemetry(config: TelemetryConfig | None = None) -> Telemetry:
+    """Configure the global tracer and meter providers (once per process).
+
+    Providers that are already SDK providers (e.g. set up by
+    `opentelemetry-instrument`) are kept; only the missing ones are configured.
+
+    Parameters
+    ----------
+    config : TelemetryConfig | None, optional
+        By default `TelemetryConfig.from_env()`
+
+    Returns
+    -------
+    Telemetry
+        The providers that were configured
+    """
+    global _telemetry
+    with _lock:
+        if _telemetry is not None:
+            return _telemetry
+        config = TelemetryConfig.from_env() if config is None else config
+        if isinstance(trace.get_tracer_provider(), TracerProvider):
+            config = replace(config, traces_exporter="none")
+        if isinstance(metrics.get_meter_provider(), MeterProvider):
+            config = replace(config, metrics_exporter="none")
+
+        telemetry = build_telemetry(config)
+        if telemetry.tracer_provider is not None:
+            trace.set_tracer_provider(telemetry.tracer_provider)
+        if telemetry.meter_provider is not None:
+            metrics.set_meter_provider(telemetry.meter_provider)
+        telemetry.register_pipeline_metrics(
+            metrics.get_meter("open_telemetry_test.telemetry")
+        )
+        _telemetry = telemetry
+        return telemetry
@@ -0,0 +1,276 @@
+"""
+Shared TimeGPT client.
+
+The anomaly detection jobs (`supabase.performance`, `sentry`,
+`online_anomaly_detection`) call TimeGPT through `get_client()`, one
+`TimeGPTClient` per process, which:
+
+- reuses keep-alive connections across calls, instead of opening one per call
+- answers a call whose input (frame and arguments) matches a recent call with that
+  call's result, without a request
+- makes at most `TIMEGPT_RATE_LIMIT` requests per second (bursts of `TIMEGPT_BURST`)
+  over every thread
+- retries transient failures (connection errors, timeouts, 408, 409, 429 and 5xx
+  responses) with exponential backoff, or after the server's Retry-After
+- records the latency of every call and the size of every request
+
+nixtla (about a second to import) is only imported when the first client is created.
+"""
+
+import functools
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any
+
+import httpx
+import pandas as pd
+from opentelemetry import metrics
+
+TIMEOUT = float(os.getenv("TIMEGPT_TIMEOUT", "60"))  # seconds, per request
+RATE_LIMIT = float(os.getenv("TIMEGPT_RATE_LIMIT", "5"))  # requests/s, 0 to disable
+BURST = int(os.getenv("TIMEGPT_BURST", "5"))
+MAX_ATTEMPTS = int(os.getenv("TIMEGPT_MAX_ATTEMPTS", "4"))
+RETRY_BACKOFF = 1.0  # seconds before the first retry, doubled for each following one
+DEDUP_SIZE = 16  # results of the latest distinct calls kept
+
+RETRIABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+meter = metrics.get_meter("timegpt.meter")
+
+call_duration = meter.create_histogram(
+    "timegpt.call.duration",
+    unit="s",
+    description="Duration of TimeGPT calls, retries and rate limiting included",
+)
+request_size = meter.create_histogram(
+    "timegpt.request.size",
+    unit="By",
+    description="Size of the (possibly compressed) TimeGPT request bodies",
+)
+
+
+class RateLimiter:
+    """Token bucket: `rate` acquisitions per second, in bursts of up to `burst`."""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Wait for a token (none when `rate` is 0) and return the time waited."""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+            # Taken in advance, so that waiting threads are served in order
+            self._tokens -= 1
+            wait = max(-self._tokens / self.rate, 0.0)
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+class _KeepAliveClient(httpx.Client):
+    """HTTP client that stays open when used as a context manager."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+@functools.cache
+def _pooled_nixtla_client() -> type:
+    """`NixtlaClient` subclass making every request with one shared HTTP client.
+
+    `NixtlaClient` opens (and closes) a client, i.e. new connections, per call
+    through `_make_client`.
+    """
+    from nixtla import NixtlaClient
+
+    class PooledNixtlaClient(NixtlaClient):
+        def __init__(self, event_hooks: dict | None = None, **kwargs):
+            super().__init__(**kwargs)
+            self._event_hooks = event_hooks or {}
+            self._http: httpx.Client | None = None
+            self._http_lock = threading.Lock()
+
+        def _make_client(self, **kwargs: Any) -> httpx.Client:
+            with self._http_lock:
+                if self._http is None:
+                    self._http = _KeepAliveClient(
+                        event_hooks=self._event_hooks, **kwargs
+                    )
+                return self._http
+
+        def close(self) -> None:
+            with self._http_lock:
+                if self._http is not None:
+                    self._http.close()
+                    self._http = None
+
+    return PooledNixtlaClient
+
+
+def fingerprint(method: str, df: pd.DataFrame, kwargs: dict) -> str:
+    """Hash of a call: method, arguments, columns and values of `df`."""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr((method, list(df.columns), sorted(kwargs.items()))).encode())
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def is_transient(error: Exception) -> bool:
+    return isinstance(error, httpx.TransportError) or (
+        getattr(error, "status_code", None) in RETRIABLE_STATUS
+    )
+
+
+class TimeGPTClient:
+    """Deduplicating, rate limited and retrying TimeGPT client (thread safe).
+
+    Parameters
+    ----------
+    api_key : str, optional
+        Defaults to NIXTLA_API_KEY
+    base_url : str, optional
+        Defaults to NIXTLA_BASE_URL, else the Nixtla API
+    timeout : float, optional
+        Per request, by default `TIMEGPT_TIMEOUT`
+    rate_limit : float, optional
+        Requests per second, by default `TIMEGPT_RATE_LIMIT` (0 to disable)
+    burst : int, optional
+        Requests let through at once, by default `TIMEGPT_BURST`
+    max_attempts : int, optional
+        Tries per call, by default `TIMEGPT_MAX_ATTEMPTS`
+    retry_backoff_secs : float, optional
+        Wait before the first retry, doubled for each following one, by default 1
+    dedup_size : int, optional
+        Results of the latest distinct calls kept to answer repeated calls, by
+        default 16 (0 to disable)
+    """
+
+    def __init__(
+        self,
+        api_key: str | None = None,
+        base_url: str | None = None,
+        timeout: float = TIMEOUT,
+        rate_limit: float = RATE_LIMIT,
+        burst: int = BURST,
+        max_attempts: int = MAX_ATTEMPTS,
+        retry_backoff_secs: float = RETRY_BACKOFF,
+        dedup_size: int = DEDUP_SIZE,
+    ):
+        # Retries are made here, with backoff, and rate limited
+        self._nixtla = _pooled_nixtla_client()(
+            api_key=api_key,
+            base_url=base_url,
+            timeout=timeout,
+            max_retries=1,
+            event_hooks={"request": [self._on_request]},
+        )
+        self.rate_limiter = RateLimiter(rate_limit, burst)
+        self.max_attempts = max(max_attempts, 1)
+        self.retry_backoff_secs = retry_backoff_secs
+        self.dedup_size = dedup_size
+        self.calls = 0
+        self.deduplicated = 0
+        self.retries = 0
+        self.bytes_sent = 0
+        self._results: OrderedDict[str, Any] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def detect_anomalies_online(self, df: pd.DataFrame, **kwargs) -> pd.DataFrame:
+        return self._call("detect_anomalies_online", df, **kwargs)
+
+    def detect_anomalies(self, df: pd.DataFrame, **kwargs) -> pd.DataFrame:
+        return self._call("detect_anomalies", df, **kwargs)
+
+    def forecast(self, df: pd.DataFrame, **kwargs) -> pd.DataFrame:
+        return self._call("forecast", df, **kwargs)
+
+    def close(self) -> None:
+        """Close the connections."""
+        self._nixtla.close()
+
+    def _on_request(self, request: httpx.Request) -> None:
+        size = int(request.headers.get("content-length", 0))
+        with self._lock:
+            self.bytes_sent += size
+        request_size.record(size, {"endpoint": request.url.path})
+
+    def _call(self, method: str, df: pd.DataFrame, **kwargs) -> pd.DataFrame:
+        started = time.perf_counter()
+        key = fingerprint(method, df, kwargs)
+        with self._lock:
+            self.calls += 1
+            result = self._results.get(key)
+            if result is not None:
+                self._results.move_to_end(key)
+                self.deduplicated += 1
+        if result is not None:
+            self._record(method, "deduplicated", started)
+            return result.copy()
+
+        try:
+            result = self._with_retries(getattr(self._nixtla, method), df, **kwargs)
+        except Exception:
+            self._record(method, "error", started)
+            raise
+        self._record(method, "ok", started)
+        if self.dedup_size > 0:
+            with self._lock:
+                self._results[key] = result
+                while len(self._results) > self.dedup_size:
+                    self._results.popitem(last=False)
+        return result.copy()
+
+    def _with_retries(self, call, df: pd.DataFrame, **kwargs) -> pd.DataFrame:
+        attempt = 1
+        while True:
+            self.rate_limiter.acquire()
+            try:
+                return call(df, **kwargs)
+            except Exception as e:
+                if attempt >= self.max_attempts or not is_transient(e):
+                    raise
+                delay = getattr(e, "retry_after", None) or (
+                    self.retry_backoff_secs * 2 ** (attempt - 1)
+                )
+                print(
+                    f"⚠️ TimeGPT call failed ({attempt}/{self.max_attempts}), "
+                    f"retrying in {delay:.1f}s: {e}"
+                )
+                with self._lock:
+                    self.retries += 1
+                time.sleep(delay)
+                attempt += 1
+
+    def _record(self, method: str, outcome: str, started: float) -> None:
+        call_duration.record(
+            time.perf_counter() - started, {"method": method, "outcome": outcome}
+        )
+
+
+_client: TimeGPTClient | None = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> TimeGPTClient:
+    """The client shared by the whole process (created on first use)."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = TimeGPTClient()
+        return _client
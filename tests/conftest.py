@@ -0,0 +1,5 @@
+import os
+
+# Entry points set up telemetry when imported; keep them from exporting in tests
+os.environ.setdefault("OTEL_TRACES_EXPORTER", "none")
+os.environ.setdefault("OTEL_METRICS_EXPORTER", "none")
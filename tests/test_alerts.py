@@ -0,0 +1,142 @@
+import threading
+import time
+
+from open_telemetry_test.alerts import Alert, AlertDispatcher
+
+
+class StubTransport:
+    """Records the digests; can be slow, or fail the first `failures` sends."""
+
+    def __init__(self, delay: float = 0, failures: int = 0):
+        self.delay = delay
+        self.failures = failures
+        self.digests: list[tuple[float, str, list]] = []
+        self.sent = threading.Event()
+
+    def send(self, subject, alerts):
+        time.sleep(self.delay)
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("notification service unavailable")
+        self.digests.append((time.monotonic(), subject, list(alerts)))
+        self.sent.set()
+
+
+def test_submit_does_not_wait_for_a_slow_transport():
+    transport = StubTransport(delay=0.5)
+    dispatcher = AlertDispatcher(transport, window_secs=0, min_interval_secs=0)
+
+    started = time.perf_counter()
+    for i in range(1000):
+        assert dispatcher.submit(Alert(f"series-{i % 10}", i, float(i)))
+    assert time.perf_counter() - started < 0.2
+
+    dispatcher.stop()
+    alerts = [alert for _, _, digest in transport.digests for alert in digest]
+    assert sum(alert.count for alert in alerts) == 1000
+
+
+def test_alerts_are_coalesced_per_series_within_the_window():
+    transport = StubTransport()
+    dispatcher = AlertDispatcher(
+        transport, window_secs=0.2, min_interval_secs=0, subject="CPU"
+    )
+    for ts, value in enumerate([5.0, 9.0, 7.0]):
+        dispatcher.submit(Alert("a/CPU", ts, value, f"{value}%"))
+    dispatcher.submit(Alert("b/CPU", 1, 3.0))
+    assert transport.sent.wait(2)
+
+    [(_, subject, alerts)] = transport.digests
+    assert subject == "CPU | 2 series"
+    a, b = alerts
+    assert (a.series, a.count, a.first_ts, a.last_ts) == ("a/CPU", 3, 0, 2)
+    assert (a.last_value, a.max_value, a.message) == (7.0, 9.0, "7.0%")
+    assert (b.series, b.count) == ("b/CPU", 1)
+    dispatcher.stop()
+
+
+def test_sends_are_rate_limited_and_retried():
+    transport = StubTransport(failures=1)
+    dispatcher = AlertDispatcher(
+        transport, window_secs=0, min_interval_secs=5, retry_backoff_secs=0.01
+    )
+    for i in range(3):
+        dispatcher.submit(Alert("a", i, 1.0))
+        time.sleep(0.1)
+    dispatcher.submit(Alert("b", 3, 1.0))
+    dispatcher.stop()
+
+    # The first digest is sent on its second attempt, the others are held back by
+    # the rate limit until `stop` flushes them
+    assert dispatcher.sent == 2
+    assert dispatcher.failed == 0
+    first, second = transport.digests
+    assert [alert.series for alert in first[2]] == ["a"]
+    assert [(alert.series, alert.count) for alert in second[2]] == [
+        ("a", 2),
+        ("b", 1),
+    ]
+
+
+def test_a_full_queue_drops_alerts():
+    release = threading.Event()
+
+    class BlockedTransport:
+        def send(self, subject, alerts):
+            release.wait()
+
+    dispatcher = AlertDispatcher(
+        BlockedTransport(), window_secs=0, min_interval_secs=0, max_queue_size=5
+    )
+    dispatcher.submit(Alert("a", 0, 1.0))
+    time.sleep(0.1)  # the sender is now blocked in send
+    accepted = [dispatcher.submit(Alert("a", i, 1.0)) for i in range(10)]
+    assert accepted == [True] * 5 + [False] * 5
+    assert dispatcher.dropped == 5
+    release.set()
+    dispatcher.stop()
+
+
+def test_flush_and_stop_do_not_hang_on_a_full_queue():
+    release = threading.Event()
+
+    class BlockedTransport:
+        def send(self, subject, alerts):
+            release.wait()
+
+    dispatcher = AlertDispatcher(
+        BlockedTransport(), window_secs=0, min_interval_secs=0, max_queue_size=5
+    )
+    dispatcher.submit(Alert("a", 0, 1.0))
+    time.sleep(0.1)  # the sender is now blocked in send
+    for i in range(5):
+        dispatcher.submit(Alert("a", i, 1.0))
+
+    started = time.perf_counter()
+    assert not dispatcher.flush(timeout=0.1)
+    dispatcher.stop(timeout=0.1)
+    assert time.perf_counter() - started < 1
+    assert dispatcher._worker.is_alive()
+
+    # The sender drains the queue, then stops
+    release.set()
+    dispatcher._worker.join(5)
+    assert not dispatcher._worker.is_alive()
+
+
+def test_counters_of_concurrent_submitters():
+    dispatcher = AlertDispatcher(
+        StubTransport(), window_secs=60, min_interval_secs=60, max_queue_size=100
+    )
+    threads = [
+        threading.Thread(
+            target=lambda: [dispatcher.submit(Alert("a", i, 1.0)) for i in range(500)]
+        )
+        for _ in range(8)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert dispatcher.submitted + dispatcher.dropped == 8 * 500
+    dispatcher.stop()
@@ -0,0 +1,72 @@
+import asyncio
+import logging
+import queue
+
+import httpx
+from fastapi.testclient import TestClient
+from opentelemetry import trace
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import (
+    InMemorySpanExporter,
+)
+
+from open_telemetry_test import app_asgi
+from open_telemetry_test.benchmarks.dice_load import run_load
+
+
+class SpanIdHandler(logging.Handler):
+    """Record the message and the span that was current when it was handled."""
+
+    def __init__(self):
+        super().__init__()
+        self.records: list[tuple[str, int]] = []
+
+    def emit(self, record):
+        span_id = trace.get_current_span().get_span_context().span_id
+        self.records.append((record.getMessage(), span_id))
+
+
+def test_roll_dice_logs_through_the_queue(monkeypatch):
+    exporter = InMemorySpanExporter()
+    provider = TracerProvider()
+    provider.add_span_processor(SimpleSpanProcessor(exporter))
+    monkeypatch.setattr(app_asgi, "tracer", provider.get_tracer("test"))
+    handler = SpanIdHandler()
+    monkeypatch.setattr(logging.getLogger(), "handlers", [handler])
+
+    with TestClient(app_asgi.app) as client:
+        response = client.get("/rolldice", params={"player": "ada"})
+    assert response.status_code == 200
+    assert response.text in {"1", "2", "3", "4", "5", "6"}
+    # The listener is stopped (and drained) with the app, and handles the record
+    # in the context of the request's span
+    [span] = exporter.get_finished_spans()
+    assert handler.records == [
+        (f"ada is rolling the dice: {response.text}", span.context.span_id)
+    ]
+
+
+def test_full_log_queue_drops_records():
+    log_queue: queue.Queue = queue.Queue(2)
+    handler = app_asgi.ContextQueueHandler(log_queue)
+    logger = logging.getLogger("test_full_log_queue")
+    logger.propagate = False
+    logger.addHandler(handler)
+    for i in range(5):
+        logger.warning("record %d", i)
+    assert log_queue.qsize() == 2
+    assert handler.dropped == 3
+
+
+def test_load_generator_reports_latency_percentiles():
+    # No lifespan, so no listener: nothing is queued
+    transport = httpx.ASGITransport(app=app_asgi.app)
+    result = asyncio.run(
+        run_load("http://test/rolldice", 4, seconds=0.2, transport=transport)
+    )
+    assert app_asgi.log_queue.empty()
+    assert result["requests"] > 0
+    assert result["errors"] == 0
+    assert 0 < result["p50 ms"] <= result["p99 ms"]
+    assert result["rps"] == result["requests"] / 0.2
@@ -0,0 +1,14 @@
+import pytest
+
+from open_telemetry_test.benchmarks.exporters import run_case
+
+
+@pytest.mark.parametrize("path", ["prometheus_client", "otlp_grpc", "otlp_http"])
+def test_every_path_reaches_its_stand_in(path):
+    result = run_case(path, series=20, rate=20, seconds=0.6, interval=0.2)
+    assert result["samples/s"] > 0
+    assert result["points/s"] > 0
+    assert result["p50 ms"] is not None
+    if path == "prometheus_client":
+        # Served by the cached endpoint: encoded at most once per scrape
+        assert 0 < result["renders"] <= 4
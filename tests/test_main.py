@@ -0,0 +1,91 @@
+import importlib
+import subprocess
+import sys
+import threading
+
+import pytest
+
+from open_telemetry_test import __main__ as cli
+
+# Cumulative import times (best of a few runs, with a margin for slow CI) of the
+# dispatcher, about 5 ms, and of the jobs, about 0.5 s (mostly pandas) instead of
+# 1.2 s when they imported nixtla
+IMPORT_BUDGET_SECS = 0.05
+JOB_IMPORT_BUDGET_SECS = 0.8
+HEAVY = ("pandas", "numpy", "nixtla", "plotly", "fastapi", "uvicorn")
+# Jobs only import nixtla when they call TimeGPT, and never the dashboard's modules
+JOB_HEAVY = ("nixtla", "plotly", "fastapi", "uvicorn")
+JOBS = (
+    "open_telemetry_test.supabase.performance",
+    "open_telemetry_test.sentry",
+    "open_telemetry_test.online_anomaly_detection",
+)
+
+
+def import_times(module: str) -> dict[str, float]:
+    """Cumulative import time (seconds) of every module imported by `module`."""
+    child = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in child.stderr.splitlines():
+        if line.startswith("import time:") and "|" in line:
+            _, cumulative, name = line.split("|")
+            if cumulative.strip().isdigit():
+                times[name.strip()] = int(cumulative) / 1e6
+    return times
+
+
+def best_import_time(module: str, runs: int = 3) -> tuple[float, set[str]]:
+    """Lowest cumulative import time of `module` and the modules it imports."""
+    all_times = [import_times(module) for _ in range(runs)]
+    return min(times[module] for times in all_times), set(all_times[0])
+
+
+def test_dispatcher_imports_within_budget():
+    seconds, modules = best_import_time("open_telemetry_test.__main__")
+    assert seconds < IMPORT_BUDGET_SECS
+    assert not modules & set(HEAVY)
+
+
+@pytest.mark.parametrize("job", JOBS)
+def test_jobs_import_within_budget(job):
+    seconds, modules = best_import_time(job)
+    assert not modules & set(JOB_HEAVY)
+    assert seconds < JOB_IMPORT_BUDGET_SECS
+
+
+def test_dispatch_to_the_selected_command(monkeypatch):
+    calls = []
+    monkeypatch.setitem(cli.COMMANDS, "hello", ("open_telemetry_test.hello:main", ""))
+    monkeypatch.setattr(
+        "open_telemetry_test.hello.main", lambda: calls.append(sys.argv)
+    )
+    monkeypatch.setattr(sys, "argv", sys.argv)
+
+    cli.main(["hello", "--flag", "value"])
+    assert calls == [["open_telemetry_test hello", "--flag", "value"]]
+
+    with pytest.raises(SystemExit):
+        cli.main(["unknown"])
+
+
+def test_scripts_run_through_the_dispatcher(monkeypatch):
+    commands: list[list[str]] = []
+    monkeypatch.setattr(cli, "main", commands.append)
+    monkeypatch.setattr(sys, "argv", ["sentry.py", "--flag"])
+
+    cli.run("sentry")
+    assert commands == [["sentry", "--flag"]]
+
+
+def test_command_modules_have_no_import_side_effects():
+    threads = set(threading.enumerate())
+    for target, _ in cli.COMMANDS.values():
+        module, function = target.split(":")
+        assert callable(getattr(importlib.import_module(module), function))
+    # (Threads of earlier tests may end meanwhile)
+    assert not set(threading.enumerate()) - threads
@@ -0,0 +1,89 @@
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from open_telemetry_test import online_anomaly_detection as oad
+
+
+class FakeClient:
+    """Flags values above 3 as anomalies, tracking the calls in flight."""
+
+    def __init__(self):
+        self.calls: list[set] = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def detect_anomalies_online(self, df, **kwargs):
+        assert kwargs["detection_size"] == 475
+        with self._lock:
+            self.calls.append(set(df["unique_id"]))
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(0.02)
+        with self._lock:
+            self.in_flight -= 1
+        return df.assign(anomaly=df["y"] > 3)
+
+
+@pytest.fixture
+def df():
+    rng = np.random.default_rng(0)
+    frames = []
+    for i in range(10):
+        y = rng.uniform(0, 3, 48)
+        y[:i] = 10  # series i has i anomalies
+        frames.append(
+            pd.DataFrame(
+                {
+                    "unique_id": f"machine-{i}",
+                    "ts": pd.date_range("2025-01-01", periods=48, freq="h"),
+                    "y": y,
+                }
+            )
+        )
+    return pd.concat(frames, ignore_index=True)
+
+
+def test_detect_shards_with_bounded_concurrency(df, monkeypatch):
+    added = []
+    monkeypatch.setattr(
+        oad.anomaly_counter_per_id,
+        "add",
+        lambda value, attributes: added.append((attributes["unique_id"], value)),
+    )
+    client = FakeClient()
+    counts = oad.detect(client, df, shard_size=3, max_workers=2)
+
+    assert sorted(len(call) for call in client.calls) == [1, 3, 3, 3]
+    assert set().union(*client.calls) == set(df["unique_id"])
+    assert client.max_in_flight == 2
+    expected = {f"machine-{i}": i for i in range(1, 10)}
+    assert counts.to_dict() == expected
+    assert dict(added) == expected
+
+
+@pytest.mark.parametrize("parquet", [True, False])
+def test_load_dataset_caches_the_download(df, tmp_path, monkeypatch, parquet):
+    if parquet and not oad._parquet_available():
+        pytest.skip("pyarrow is not installed")
+    monkeypatch.setattr(oad, "_parquet_available", lambda: parquet)
+    source = tmp_path / "SMD_test.csv"
+    df.to_csv(source, index=False)
+    cache_dir = tmp_path / "cache"
+
+    first = oad.load_dataset(None, str(source), cache_dir)
+    source.unlink()
+    # Served from the cache, without the source
+    second = oad.load_dataset(None, str(source), cache_dir)
+    pd.testing.assert_frame_equal(first, second)
+    assert second["ts"].dtype.kind == "M"
+    [cached] = cache_dir.iterdir()
+    assert cached.suffix == (".parquet" if parquet else ".csv")
+
+    local = tmp_path / "local.csv"
+    df.to_csv(local, index=False)
+    assert len(oad.load_dataset(local)) == len(df)
@@ -0,0 +1,99 @@
+import itertools
+
+import numpy as np
+from opentelemetry.sdk.metrics import MeterProvider
+from opentelemetry.sdk.metrics.export import InMemoryMetricReader
+
+from open_telemetry_test.otel_common import sampler as sampler_module
+from open_telemetry_test.otel_common.sampler import MachineSampler
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self):
+        return self.now
+
+
+def _points(reader):
+    data = reader.get_metrics_data()
+    points = {}
+    for metric in data.resource_metrics[0].scope_metrics[0].metrics:
+        for point in metric.data.data_points:
+            key = tuple(sorted(point.attributes.items()))
+            points[(metric.name, key)] = point.value
+    return points
+
+
+def test_exports_interval_aggregates_per_machine(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(sampler_module, "time", clock)
+    values = {"m1": iter([1.0, 3.0, 2.0]), "m2": iter([10.0, 20.0, 30.0])}
+
+    def read(machine_id):
+        value = next(values[machine_id])
+        if machine_id == "m2" and value == 20.0:
+            raise OSError("sensor unavailable")
+        return value
+
+    sampler = MachineSampler(["m1", "m2"], read, interval_secs=10)
+    reader, other = InMemoryMetricReader(), InMemoryMetricReader()
+    provider = MeterProvider(metric_readers=[reader, other])
+    sampler.register(provider.get_meter("t"), "vib")
+    for _ in range(3):
+        clock.now += 3
+        sampler.sample()
+
+    # The interval is not complete yet
+    assert not any(name == "vib_interval" for name, _ in _points(reader))
+    clock.now = 10
+
+    def interval_stats(reader):
+        return {
+            (dict(key)["machine_id"], dict(key)["stat"]): value
+            for (name, key), value in _points(reader).items()
+            if name == "vib_interval"
+        }
+
+    stats = interval_stats(reader)
+    points = _points(reader)
+    assert stats[("m1", "min")] == 1.0
+    assert stats[("m1", "max")] == 3.0
+    assert stats[("m1", "mean")] == 2.0
+    assert stats[("m1", "count")] == 3
+    assert stats[("m2", "mean")] == 20.0
+    assert stats[("m2", "count")] == 2
+    assert points[("vib", (("machine_id", "m1"),))] == 2.0
+    assert points[("vib", (("machine_id", "m2"),))] == 30.0
+
+    # Collections do not reset the interval: every reader sees all of it
+    assert interval_stats(reader) == stats
+    assert interval_stats(other) == stats
+
+    # An interval without samples has no aggregates; the counter and last value
+    # are kept
+    clock.now = 20
+    points = _points(reader)
+    assert not any(name == "vib_interval" for name, _ in points)
+    assert points[("vib_samples", (("machine_id", "m2"),))] == 2
+    assert points[("vib", (("machine_id", "m1"),))] == 2.0
+    sampler.stop()
+
+
+def test_run_samples_all_machines_at_rate():
+    counter = itertools.count()
+    ticks = []
+    machines = [f"m{i}" for i in range(50)]
+    sampler = MachineSampler(
+        machines,
+        lambda machine_id: next(counter),
+        rate_hz=50,
+        on_sample=lambda ids, values: ticks.append(values),
+    )
+    sampler.run(duration=0.5)
+    sampler.stop()
+
+    assert 15 <= len(ticks) <= 26
+    assert all(len(values) == 50 and not np.isnan(values).any() for values in ticks)
+    assert sampler.total.tolist() == [len(ticks)] * 50
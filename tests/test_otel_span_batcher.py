@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import (
+    InMemorySpanExporter,
+)
+
+from open_telemetry_test.otel_common.span_batcher import make_span_hook
+
+SECOND = 1_000_000_000
+
+
+@pytest.fixture
+def tracing():
+    exporter = InMemorySpanExporter()
+    provider = TracerProvider()
+    provider.add_span_processor(SimpleSpanProcessor(exporter))
+    return provider.get_tracer("test"), exporter
+
+
+def test_window_mode_emits_one_summary_span_per_machine(tracing):
+    tracer, exporter = tracing
+    hook = make_span_hook("window", tracer, "vib", window_secs=1)
+    machines = ["m1", "m2"]
+    rng = np.random.default_rng(0)
+    # Two windows of 10 ticks; m1 spikes in the second window, m2 misses a read
+    for tick in range(20):
+        values = rng.normal(1.0, 0.1, 2)
+        if tick == 15:
+            values[0] = 10.0
+        if tick == 3:
+            values[1] = np.nan
+        hook(machines, values, now_ns=tick * SECOND // 10)
+    hook.flush(now_ns=2 * SECOND)
+
+    spans = exporter.get_finished_spans()
+    assert len(spans) == 4
+    first = {span.attributes["machine_id"]: span for span in spans[:2]}
+    assert first["m1"].attributes["vib.count"] == 10
+    assert first["m2"].attributes["vib.count"] == 9
+    assert first["m1"].start_time == 0
+    assert first["m1"].end_time == SECOND
+    second = {span.attributes["machine_id"]: span for span in spans[2:]}
+    assert second["m1"].attributes["vib.max"] == 10.0
+    (event,) = second["m1"].events
+    assert event.name == "outlier"
+    assert event.attributes["vib"] == 10.0
+    assert event.timestamp == 15 * SECOND // 10
+    assert not second["m2"].events
+
+
+def test_sample_mode_emits_a_span_per_sample(tracing):
+    tracer, exporter = tracing
+    hook = make_span_hook("sample", tracer, "vib")
+    hook(["m1", "m2"], np.array([1.0, 2.0]))
+    spans = exporter.get_finished_spans()
+    assert [span.attributes["vib"] for span in spans] == [1.0, 2.0]
+    # Failed reads give no span
+    hook(["m1", "m2"], np.array([np.nan, 3.0]))
+    spans = exporter.get_finished_spans()
+    assert [span.attributes["machine_id"] for span in spans[2:]] == ["m2"]
+
+    with pytest.raises(ValueError):
+        make_span_hook("every", tracer, "vib")
@@ -0,0 +1,87 @@
+import gzip
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import requests
+from prometheus_client import CollectorRegistry, Gauge
+
+from open_telemetry_test.prometheus.exposition_server import start_cached_http_server
+
+
+@pytest.fixture
+def registry():
+    return CollectorRegistry()
+
+
+@pytest.fixture
+def gauge(registry):
+    gauge = Gauge("vibration", "Vibration", ["machine_id"], registry=registry)
+    gauge.labels(machine_id="machine_1").set(1.5)
+    return gauge
+
+
+def _get(server, **headers):
+    port = server.server_address[1]
+    headers.setdefault("Accept-Encoding", "identity")
+    # Keep the body as sent (requests would decode gzip)
+    response = requests.get(
+        f"http://127.0.0.1:{port}/metrics", headers=headers, stream=True, timeout=5
+    )
+    return response, response.raw.read()
+
+
+def test_payload_is_encoded_once_per_change(registry, gauge):
+    server = start_cached_http_server(0, "127.0.0.1", registry)
+    try:
+        with ThreadPoolExecutor(8) as pool:
+            bodies = list(pool.map(lambda _: _get(server)[1], range(32)))
+        assert server.renders == 1
+        assert all(b'vibration{machine_id="machine_1"} 1.5' in b for b in bodies)
+
+        gauge.labels(machine_id="machine_1").set(2)
+        assert b"} 1.5" in _get(server)[1]
+        server.invalidate()
+        assert b"} 2.0" in _get(server)[1]
+        assert server.renders == 2
+    finally:
+        server.stop()
+
+
+def test_negotiates_openmetrics_and_gzip(registry, gauge):
+    server = start_cached_http_server(0, "127.0.0.1", registry)
+    try:
+        response, body = _get(
+            server,
+            **{
+                "Accept": "application/openmetrics-text; version=1.0.0; charset=utf-8",
+                "Accept-Encoding": "gzip",
+            },
+        )
+        assert response.headers["Content-Type"].startswith(
+            "application/openmetrics-text"
+        )
+        assert response.headers["Content-Encoding"] == "gzip"
+        text = gzip.decompress(body)
+        assert text.endswith(b"# EOF\n")
+
+        response, body = _get(server, Accept="text/plain")
+        assert response.headers["Content-Type"].startswith("text/plain")
+        assert b"# EOF" not in body
+        # One encoding per format, gzip reuses it
+        assert server.renders == 2
+    finally:
+        server.stop()
+
+
+def test_max_age_expires_the_payload(registry, gauge):
+    server = start_cached_http_server(0, "127.0.0.1", registry, max_age=0.05)
+    try:
+        _get(server)
+        _get(server)
+        assert server.renders == 1
+        time.sleep(0.1)
+        _get(server)
+        assert server.renders == 2
+    finally:
+        server.stop()
@@ -0,0 +1,79 @@
+from collections.abc import Callable
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from open_telemetry_test.prometheus.range_functions import evaluate, over_time, sweep
+
+REDUCERS: dict[str, Callable] = {
+    "avg_over_time": np.mean,
+    "min_over_time": np.min,
+    "max_over_time": np.max,
+    "sum_over_time": np.sum,
+    "count_over_time": len,
+    "quantile_over_time": lambda v: np.quantile(v, 0.9),
+}
+
+
+@pytest.fixture(params=[500, 0], ids=["samples", "empty"])
+def samples(request):
+    rng = np.random.default_rng(0)
+    ts = np.cumsum(rng.uniform(1, 20, request.param))
+    return ts, rng.normal(size=request.param)
+
+
+@pytest.mark.parametrize("func", REDUCERS)
+@pytest.mark.parametrize("window", [5, 30, 300])
+def test_matches_a_naive_window_loop(samples, func, window):
+    ts, values = samples
+    t = np.arange(0, (ts[-1] if len(ts) else 0) + 60, 7.0)
+    out = evaluate(func, ts, values, t, window, q=0.9)
+
+    # The same through the frame API (nothing to sweep without samples)
+    df = pd.DataFrame(
+        {"unique_id": "s", "ds": pd.to_datetime(ts, unit="s"), "y": values}
+    )
+    swept = sweep(df, func, [window], 7, q=0.9, start=0, end=t[-1])
+    if len(ts):
+        np.testing.assert_array_equal(swept["y"], out)
+    else:
+        assert swept.empty
+        assert list(swept.columns) == ["unique_id", "window", "ds", "y"]
+
+    for i, at in enumerate(t):
+        inside = values[(ts > at - window) & (ts <= at)]
+        if len(inside):
+            assert out[i] == pytest.approx(REDUCERS[func](inside))
+        else:
+            assert np.isnan(out[i])
+
+
+def test_rate_of_a_counter_with_reset():
+    ts = np.arange(0, 600, 15.0)
+    values = 2.0 * ts
+    values[20:] -= values[20]  # restarted at t=300
+    rate = evaluate("rate", ts, values, np.array([240.0, 420.0, 590.0]), 120)
+    np.testing.assert_allclose(rate, 2.0)
+    assert np.isnan(evaluate("rate", ts, values, np.array([5.0]), 10)[0])
+
+
+def test_sweep_evaluates_every_window_per_series():
+    ds = pd.to_datetime(np.arange(0, 3600, 10), unit="s")
+    df = pd.DataFrame(
+        {
+            "unique_id": np.repeat(["a", "b"], len(ds)),
+            "ds": np.tile(ds, 2),
+            "y": np.concatenate([np.ones(len(ds)), np.arange(len(ds))]),
+        }
+    )
+    swept = sweep(df, "count_over_time", ["30s", "1m", "5m"], "60s")
+    assert set(swept["window"]) == {"30s", "1m", "5m"}
+    assert len(swept) == 2 * 3 * 60
+    counts = swept.groupby("window")["y"].max()
+    assert counts.to_dict() == {"1m": 6, "30s": 3, "5m": 30}
+
+    avg = over_time(df, "avg_over_time", "1m", "1m", start=600, end=900)
+    assert list(avg.columns) == ["unique_id", "ds", "y"]
+    b = avg[avg["unique_id"] == "b"]["y"]
+    np.testing.assert_array_equal(b, [57.5, 63.5, 69.5, 75.5, 81.5, 87.5])
@@ -0,0 +1,162 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pytest
+import requests
+
+from open_telemetry_test.prometheus import prometheus_read_metrics
+from open_telemetry_test.prometheus.prometheus_read_metrics import (
+    ChunkCache,
+    RangeFetcher,
+    parse_duration,
+)
+
+STEP = 60
+
+
+class FakePrometheusHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        params = {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+        self.server.requests.append(params)  # type: ignore[attr-defined]
+        failure = self.server.failure  # type: ignore[attr-defined]
+        if failure is not None:
+            code, body = failure
+            self.send_response(code)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        if "time" in params:
+            # Raw samples every 15s of `selector[<n>ms]`, bounds included
+            step = 15.0
+            end = float(params["time"])
+            start = end - float(params["query"].split("[")[1].rstrip("ms]")) / 1000
+        else:
+            start, end, step = (float(params[k]) for k in ("start", "end", "step"))
+        ts = np.arange(np.ceil(start / step) * step, end + step / 2, step)
+        result = [
+            {
+                "metric": {"__name__": "up", "job": job},
+                "values": [[t, str(t / step + offset)] for t in ts.tolist()],
+            }
+            for job, offset in (("a", 0), ("b", 0.5))
+        ]
+        body = json.dumps(
+            {"status": "success", "data": {"resultType": "matrix", "result": result}}
+        ).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class FakePrometheus(ThreadingHTTPServer):
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), FakePrometheusHandler)
+        self.requests: list = []
+        self.failure: tuple[int, bytes] | None = None  # status code and body
+
+
+@pytest.fixture
+def server():
+    httpd = FakePrometheus()
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_parse_duration():
+    assert parse_duration("1m30s") == 90
+    assert parse_duration("500ms") == 0.5
+    assert parse_duration(15) == 15
+    with pytest.raises(ValueError):
+        parse_duration("1 minute")
+
+
+def test_fetch_concatenates_step_aligned_chunks(server):
+    fetcher = RangeFetcher(f"http://127.0.0.1:{server.server_port}", chunk_points=100)
+    # 1000 points starting from a start that is not aligned to the step
+    df = fetcher.fetch("up", 30, 30 + 1000 * STEP, "1m")
+    fetcher.close()
+
+    # Chunks are aligned to their length, the last one only holds the end
+    assert len(server.requests) == 11
+    assert all(float(r["start"]) % (100 * STEP) == 0 for r in server.requests)
+    assert sorted(df["unique_id"].unique()) == ['up{job="a"}', 'up{job="b"}']
+    a = df[df["unique_id"] == 'up{job="a"}']
+    assert len(a) == 1000
+    assert a["ds"].is_monotonic_increasing
+    np.testing.assert_array_equal(a["y"], np.arange(1, 1001))
+
+
+def test_past_chunks_are_cached_and_evicted(server, tmp_path, monkeypatch):
+    monkeypatch.setattr(prometheus_read_metrics, "SETTLE_SECS", 0)
+    url = f"http://127.0.0.1:{server.server_port}"
+    cache = ChunkCache(str(tmp_path), max_bytes=10**9)
+    fetcher = RangeFetcher(url, chunk_points=100, cache=cache)
+    end = time.time() + STEP
+    chunks = len(fetcher.chunks(end - 300 * STEP, end, STEP))
+    # The last chunk, that ends in the future, is not cached
+    first = fetcher.fetch("up", end - 300 * STEP, end, STEP)
+    assert len(server.requests) == chunks
+    second = fetcher.fetch("up", end - 300 * STEP, end, STEP)
+    assert len(server.requests) == chunks + 1
+    assert first.equals(second)
+
+    cache.max_bytes = cache.size() // 2
+    cache.evict()
+    assert 0 < cache.size() <= cache.max_bytes
+    fetcher.close()
+
+
+def test_shifted_ranges_reuse_the_cached_chunks(server, tmp_path):
+    url = f"http://127.0.0.1:{server.server_port}"
+    fetcher = RangeFetcher(url, chunk_points=100, cache=ChunkCache(str(tmp_path)))
+    # Rolling windows of 300 points, moved by one step then by a chunk
+    first = fetcher.fetch("up", 1000 * STEP, 1299 * STEP, STEP)
+    assert len(server.requests) == 3
+    second = fetcher.fetch("up", 1001 * STEP, 1300 * STEP, STEP)
+    assert len(server.requests) == 4
+    third = fetcher.fetch("up", 1101 * STEP, 1400 * STEP, STEP)
+    assert len(server.requests) == 5
+    fetcher.close()
+
+    for df, start in ((first, 1000), (second, 1001), (third, 1101)):
+        a = df[df["unique_id"] == 'up{job="a"}']
+        np.testing.assert_array_equal(a["y"], np.arange(start, start + 300))
+
+
+def test_failed_queries_raise(server):
+    fetcher = RangeFetcher(f"http://127.0.0.1:{server.server_port}", chunk_points=100)
+    server.failure = (502, b"<html>Bad Gateway</html>")
+    with pytest.raises(requests.HTTPError, match="502"):
+        fetcher.fetch("up", 0, 10 * STEP, STEP)
+
+    server.failure = (200, json.dumps({"status": "error", "error": "bad"}).encode())
+    with pytest.raises(RuntimeError, match="bad"):
+        fetcher.fetch("up", 0, 10 * STEP, STEP)
+    fetcher.close()
+
+
+def test_fetch_raw_samples_in_chunks(server):
+    fetcher = RangeFetcher(f"http://127.0.0.1:{server.server_port}")
+    df = fetcher.fetch_raw("up", 1000, 10_000, chunk="1h")
+    fetcher.close()
+
+    assert [r["query"] for r in server.requests] == ["up[3600000ms]"] * 3
+    a = df[df["unique_id"] == 'up{job="a"}']
+    ts = a["ds"].to_numpy("datetime64[s]").astype(int)
+    # Samples on chunk boundaries are only kept once
+    np.testing.assert_array_equal(ts, np.arange(1005, 10_000, 15))
@@ -0,0 +1,150 @@
+import numpy as np
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SpanExporter, SpanExportResult
+from opentelemetry.trace import StatusCode
+
+from open_telemetry_test import sampling
+from open_telemetry_test.sampling import (
+    AdaptiveRateSampler,
+    KeepErrorsAndRareValues,
+    adaptive_rate_sampler,
+)
+from open_telemetry_test.telemetry import BoundedSpanProcessor
+
+
+class ListExporter(SpanExporter):
+    def __init__(self):
+        self.spans: list = []
+
+    def export(self, spans):
+        self.spans.extend(spans)
+        return SpanExportResult.SUCCESS
+
+    def shutdown(self):
+        pass
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self):
+        return self.now
+
+
+def test_probability_follows_the_span_rate(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(sampling, "time", clock)
+    sampler = AdaptiveRateSampler(target_sps=256, smoothing=1.0)
+    provider = TracerProvider(sampler=sampler)
+    tracer = provider.get_tracer("test")
+
+    def second(traces_per_second):
+        sampled = 0
+        for _ in range(traces_per_second):
+            clock.now += 1 / traces_per_second
+            with tracer.start_as_current_span("root") as root:
+                # Children follow the root, unsampled spans are not even recorded
+                is_sampled = root.get_span_context().trace_flags.sampled
+                with tracer.start_as_current_span("child") as child:
+                    assert child.get_span_context().trace_flags.sampled == is_sampled
+                    assert child.is_recording() == is_sampled
+                sampled += is_sampled
+        return sampled
+
+    # (Rates with exact binary periods, so that windows end on a span)
+    assert second(64) == 64
+    assert sampler.probability == 1.0
+    # A spike is sampled down to the budget, in spans (2 per trace), from the next
+    # window on
+    second(2048)
+    assert sampler.probability == 256 / 4096
+    assert 80 < second(2048) < 180
+
+    assert adaptive_rate_sampler("25").target_sps == 25
+    assert adaptive_rate_sampler(None).target_sps == sampling.DEFAULT_TARGET_SPS
+
+
+def unsampled_tracer(processor):
+    # The rate is measured at every span: samples none, records all
+    sampler = AdaptiveRateSampler(target_sps=1e-9, window_secs=0, record_unsampled=True)
+    provider = TracerProvider(sampler=sampler)
+    provider.add_span_processor(processor)
+    return provider, provider.get_tracer("test")
+
+
+def test_unsampled_errors_and_rare_values_are_exported():
+    exporter = ListExporter()
+    processor = BoundedSpanProcessor(
+        exporter, schedule_delay_ms=10, keep=KeepErrorsAndRareValues()
+    )
+    provider, tracer = unsampled_tracer(processor)
+
+    for i in range(1000):
+        with tracer.start_as_current_span("roll") as span:
+            span.set_attribute("roll.value", str(i % 6 + 1))
+    with tracer.start_as_current_span("roll") as span:
+        span.set_attribute("roll.value", "7")
+    with tracer.start_as_current_span("roll") as span:
+        span.set_status(StatusCode.ERROR)
+    try:
+        with tracer.start_as_current_span("roll"):
+            raise RuntimeError("boom")
+    except RuntimeError:
+        pass
+
+    processor.force_flush()
+    exported = [
+        (span.attributes.get("roll.value"), span.status.status_code)
+        for span in exporter.spans
+    ]
+    # The rare value and the two errors
+    assert exported == [
+        ("7", StatusCode.UNSET),
+        (None, StatusCode.ERROR),
+        (None, StatusCode.ERROR),
+    ]
+    provider.shutdown()
+
+
+def test_rare_values_are_relative_to_the_average_value():
+    keep = KeepErrorsAndRareValues(keys=["roll.value"])
+    rng = np.random.default_rng(0)
+    # A fair die: no face is rare
+    fair = [keep._rare("roll.value", int(face)) for face in rng.integers(1, 7, 3000)]
+    assert not any(fair[100:])
+
+    # A loaded die, that rarely shows a 6
+    loaded = KeepErrorsAndRareValues(keys=["roll.value"])
+    faces = rng.choice(np.arange(1, 7), 3000, p=[0.198] * 5 + [0.01])
+    rare = {int(f) for f in faces[100:] if loaded._rare("roll.value", int(f))}
+    assert rare == {6}
+
+
+def test_kept_spans_are_exported_with_their_trace():
+    exporter = ListExporter()
+    processor = BoundedSpanProcessor(
+        exporter, schedule_delay_ms=10, keep=KeepErrorsAndRareValues(keys=[])
+    )
+    provider, tracer = unsampled_tracer(processor)
+
+    # Not kept: nothing is exported, nor held once the trace ends
+    with tracer.start_as_current_span("ok"), tracer.start_as_current_span("child"):
+        pass
+    # An error in a child keeps the spans of its trace, before and after it
+    with tracer.start_as_current_span("request"):
+        with tracer.start_as_current_span("parse"):
+            pass
+        with tracer.start_as_current_span("roll") as span:
+            span.set_status(StatusCode.ERROR)
+        with tracer.start_as_current_span("respond"):
+            pass
+
+    processor.force_flush()
+    spans = exporter.spans
+    assert [span.name for span in spans] == ["parse", "roll", "respond", "request"]
+    assert len({span.context.trace_id for span in spans}) == 1
+    assert all(span.context.trace_flags.sampled for span in spans)
+    assert not processor._held
+    assert not processor._kept
+    provider.shutdown()
@@ -0,0 +1,148 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+import pandas as pd
+import pytest
+from utilsforecast.preprocessing import fill_gaps
+
+from open_telemetry_test import sentry
+
+BUCKET = 300
+
+
+class FakeSentryHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        params = {k: v[0] for k, v in parse_qs(urlparse(self.path).query).items()}
+        self.server.requests.append(params)  # type: ignore[attr-defined]
+        if params["query"] == "project:broken":
+            self.send_error(500)
+            return
+        start, end = (
+            int(pd.Timestamp(params[key]).timestamp()) for key in ("start", "end")
+        )
+        # A bucket's value grows with the number of requests, as the current
+        # bucket does while it is filling up
+        run = len(self.server.requests)  # type: ignore[attr-defined]
+        data = [
+            [bucket, [{"count": bucket / BUCKET % 100 + run}]]
+            for bucket in range(start - start % BUCKET, end + 1, BUCKET)
+        ]
+        body = json.dumps({"data": data}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeSentry(ThreadingHTTPServer):
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), FakeSentryHandler)
+        self.requests: list[dict] = []
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+
+@pytest.fixture
+def fake_sentry(monkeypatch):
+    server = FakeSentry()
+    monkeypatch.setattr(
+        sentry, "SENTRY_API_URL", f"http://127.0.0.1:{server.server_port}/api/0"
+    )
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_runs_only_fetch_from_the_watermark(fake_sentry, tmp_path):
+    store = sentry.SeriesStore(str(tmp_path))
+    now = pd.Timestamp("2025-01-02 00:02")
+
+    first = sentry.get_sentry_events_data("api", store, now)
+    assert fake_sentry.requests[0]["start"] == "2025-01-01T00:00:00"
+    assert fake_sentry.requests[0]["query"] == "project:api"
+    assert len(first) == 24 * 12 + 1
+    assert (first[sentry.ID_COL] == "api").all()
+
+    later = now + pd.Timedelta("15min")
+    second = sentry.get_sentry_events_data("api", store, later)
+    # From the last (then incomplete) bucket on
+    assert fake_sentry.requests[1]["start"] == "2025-01-02T00:00:00"
+    assert second[sentry.TIME_COL].is_monotonic_increasing
+    assert second[sentry.TIME_COL].iloc[0] == (later - sentry.HORIZON).floor("5min")
+    assert second[sentry.TIME_COL].iloc[-1] == pd.Timestamp("2025-01-02 00:15")
+    assert second[sentry.TIME_COL].diff().iloc[1:].eq(pd.Timedelta("5min")).all()
+    # Refetched buckets take the latest values, older ones are kept as stored
+    runs = second[sentry.TARGET_COL] - (
+        second[sentry.TIME_COL].astype("int64") // 10**9 / BUCKET % 100
+    )
+    refetched = second[sentry.TIME_COL] >= pd.Timestamp("2025-01-02 00:00")
+    assert (runs[refetched] == 2).all()
+    assert (runs[~refetched] == 1).all()
+
+    # State is persisted
+    reloaded = sentry.SeriesStore(str(tmp_path)).load("api")
+    pd.testing.assert_frame_equal(
+        reloaded, second[[sentry.TIME_COL, sentry.TARGET_COL]]
+    )
+
+
+def test_projects_are_fetched_into_one_long_frame(fake_sentry, tmp_path):
+    store = sentry.SeriesStore(str(tmp_path))
+    now = pd.Timestamp("2025-01-02 00:02")
+    projects = ["api", "web", "broken", "worker"]
+
+    events = sentry.get_projects_data(projects, store, now, max_workers=4)
+    assert sorted(r["query"] for r in fake_sentry.requests) == sorted(
+        f"project:{p}" for p in projects
+    )
+    assert list(events.columns) == [sentry.ID_COL, sentry.TIME_COL, sentry.TARGET_COL]
+    sizes = events.groupby(sentry.ID_COL).size()
+    assert sizes.to_dict() == {"api": 289, "web": 289, "worker": 289}
+    assert events[sentry.TIME_COL].max() == pd.Timestamp("2025-01-02 00:00")
+
+
+# The reference groupby-resample is deprecated in pandas
+@pytest.mark.filterwarnings("ignore::FutureWarning")
+def test_extract_error_data_matches_resample_and_fill_gaps(monkeypatch):
+    monkeypatch.setattr(sentry, "current_time", "2025-01-01 06:00")
+    rng = np.random.default_rng(0)
+    n = 500
+    events = pd.DataFrame(
+        {
+            sentry.ID_COL: rng.choice(["api", "web", "worker"], n),
+            sentry.TIME_COL: pd.Timestamp("2025-01-01")
+            + pd.to_timedelta(rng.uniform(0, 5 * 3600, n), unit="s"),
+            "event.type": rng.choice(["error", "transaction"], n),
+        }
+    )
+
+    # The groupby-resample + fill_gaps implementation it replaces
+    errors = events.query("`event.type` == 'error'")
+    expected = (
+        errors.groupby(sentry.ID_COL)
+        .resample(sentry.FREQ, on=sentry.TIME_COL)
+        .size()
+        .reset_index()
+        .rename(columns={0: sentry.TARGET_COL})
+    )
+    expected = fill_gaps(
+        expected,
+        freq=sentry.FREQ,
+        time_col=sentry.TIME_COL,
+        id_col=sentry.ID_COL,
+        start="global",
+        end=sentry.current_time,
+    )
+    expected[sentry.TARGET_COL] = expected[sentry.TARGET_COL].fillna(0)
+
+    pd.testing.assert_frame_equal(
+        sentry.extract_error_data(events), expected, check_dtype=False
+    )
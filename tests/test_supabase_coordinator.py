@@ -0,0 +1,78 @@
+import threading
+
+import pandas as pd
+import pytest
+
+from open_telemetry_test.supabase.coordinator import ID_COL, DetectionCoordinator
+
+
+def _frame(value):
+    return pd.DataFrame({"ds": pd.date_range("2025-01-01", periods=3), "y": value})
+
+
+class RecordingDetector:
+    def __init__(self):
+        self.batches = []
+
+    def __call__(self, df):
+        self.batches.append(sorted(df[ID_COL].unique()))
+        return df.groupby(ID_COL)["y"].last().gt(1).to_dict()
+
+
+def test_series_are_batched_and_fanned_out():
+    detect = RecordingDetector()
+    coordinator = DetectionCoordinator(detect, max_batch_size=3, flush_deadline=60)
+    results = {}
+
+    def worker(name, value):
+        results[name] = coordinator.detect(name, _frame(value), timeout=10)
+
+    threads = [
+        threading.Thread(target=worker, args=(name, value))
+        for name, value in [("CPU", 0.5), ("MEM", 5.0), ("DISK", 1.0)]
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert detect.batches == [["CPU", "DISK", "MEM"]]
+    assert results == {"CPU": False, "MEM": True, "DISK": False}
+    coordinator.close()
+
+
+def test_flush_deadline_and_missing_series():
+    coordinator = DetectionCoordinator(
+        lambda df: {}, max_batch_size=10, flush_deadline=0.05
+    )
+    assert coordinator.detect("CPU", _frame(1.0), timeout=5) is None
+    coordinator.close()
+
+
+def test_detect_errors_propagate():
+    def fail(df):
+        raise RuntimeError("boom")
+
+    coordinator = DetectionCoordinator(fail, max_batch_size=1)
+    with pytest.raises(RuntimeError, match="boom"):
+        coordinator.detect("CPU", _frame(1.0), timeout=5)
+    coordinator.close()
+    with pytest.raises(RuntimeError, match="closed"):
+        coordinator.submit("CPU", _frame(1.0))
+
+
+def test_batches_that_cannot_be_built_fail_their_futures():
+    coordinator = DetectionCoordinator(
+        lambda df: {"CPU": True}, max_batch_size=2, flush_deadline=0.2
+    )
+    duplicated = pd.DataFrame([[1.0, 2.0]], columns=["y", "y"])
+    futures = [
+        coordinator.submit("MEM", duplicated),
+        coordinator.submit("DISK", _frame(1.0)),
+    ]
+    for future in futures:
+        with pytest.raises(pd.errors.InvalidIndexError):
+            future.result(timeout=5)
+    # The coordinator keeps running
+    assert coordinator.detect("CPU", _frame(1.0), timeout=5) is True
+    coordinator.close()
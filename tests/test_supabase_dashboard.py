@@ -0,0 +1,107 @@
+import time
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+from open_telemetry_test.supabase import dashboard
+from open_telemetry_test.supabase.downsample import lttb, minmax
+from open_telemetry_test.supabase.rollup import ROLLUP_DTYPE
+from open_telemetry_test.supabase.store import RECORD_DTYPE, MetricStore
+
+
+@pytest.mark.parametrize("downsample", [lttb, minmax])
+def test_downsample_keeps_budget_and_spike(downsample):
+    x = np.arange(10_000)
+    y = np.sin(x / 100)
+    y[4321] = 50.0
+    keep = downsample(x, y, 200)
+    assert len(keep) <= 200
+    assert np.all(np.diff(keep) > 0)
+    assert 4321 in keep
+    np.testing.assert_array_equal(downsample(x[:50], y[:50], 200), np.arange(50))
+
+
+def test_lttb_keeps_endpoints():
+    keep = lttb(np.arange(1000), np.random.default_rng(0).random(1000), 100)
+    assert len(keep) == 100
+    assert keep[0] == 0
+    assert keep[-1] == 999
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(dashboard, "STORE_DIR", str(tmp_path))
+    dashboard.render_data.cache_clear()
+    records = np.empty(5000, dtype=RECORD_DTYPE)
+    records["ts"] = np.arange(5000) * 60
+    records["y"] = np.arange(5000) % 7
+    MetricStore(str(tmp_path)).append("proj/CPU", records)
+    return TestClient(dashboard.app)
+
+
+def test_data_endpoint_downsamples_and_caches(client, tmp_path):
+    response = client.get("/data", params={"width": 500})
+    assert response.status_code == 200
+    (trace,) = response.json()["traces"]
+    assert trace["name"] == "proj/CPU"
+    assert len(trace["x"]) == 500
+    assert trace["x"][0] == 0
+
+    etag = response.headers["ETag"]
+    cached = client.get("/data", params={"width": 500}, headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert dashboard.render_data.cache_info().misses == 1
+
+    # New data changes the version (and so the cache key)
+    MetricStore(str(tmp_path)).append("proj/CPU", np.zeros(1, dtype=RECORD_DTYPE))
+    fresh = client.get("/data", params={"width": 500}, headers={"If-None-Match": etag})
+    assert fresh.status_code == 200
+
+
+def test_each_unit_is_drawn_on_its_own_axis(client, tmp_path):
+    records = np.zeros(10, dtype=RECORD_DTYPE)
+    records["ts"] = np.arange(10) * 60
+    MetricStore(str(tmp_path)).append("proj/NET_RX{device=eth0}", records)
+    MetricStore(str(tmp_path)).append("proj/PG_XACT{datname=app}", records)
+
+    data = client.get("/data", params={"width": 500}).json()
+    axes = {trace["name"]: trace["yaxis"] for trace in data["traces"]}
+    assert axes == {
+        "proj/CPU": "y",
+        "proj/NET_RX{device=eth0}": "y2",
+        "proj/PG_XACT{datname=app}": "y3",
+    }
+    layout = data["layout"]
+    titles = [layout[axis]["title"]["text"] for axis in ("yaxis", "yaxis2", "yaxis3")]
+    assert titles == ["Percent", "Bytes/s", "Per second"]
+    assert layout["xaxis"]["anchor"] == "y3"
+
+
+def test_long_ranges_are_cached_on_the_rollup_version(client, tmp_path, monkeypatch):
+    rollups = tmp_path / "rollups"
+    monkeypatch.setattr(dashboard, "ROLLUP_DIR", str(rollups))
+    hourly = MetricStore(str(rollups / "1h"), ROLLUP_DTYPE)
+    records = np.zeros(24, dtype=ROLLUP_DTYPE)
+    records["ts"] = (time.time() // 3600 - np.arange(24)[::-1]) * 3600
+    records["count"] = 1
+    hourly.append("proj/CPU", records)
+
+    # A month: read from the hourly rollups
+    params = {"width": 500, "hours": 24 * 30}
+    response = client.get("/data", params=params)
+    (trace,) = response.json()["traces"]
+    assert len(trace["x"]) == 24
+    etag = response.headers["ETag"]
+
+    # A closed hourly bucket changes the version of the data drawn
+    hourly.append("proj/CPU", records[-1:])
+    fresh = client.get("/data", params=params, headers={"If-None-Match": etag})
+    assert fresh.status_code == 200
+
+
+def test_page_and_plotly_js_are_static(client):
+    page = client.get("/")
+    assert dashboard.PLOTLY_JS_PATH in page.text
+    js = client.get(dashboard.PLOTLY_JS_PATH)
+    assert "immutable" in js.headers["Cache-Control"]
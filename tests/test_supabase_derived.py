@@ -0,0 +1,211 @@
+import threading
+import time
+import zlib
+
+import pytest
+
+from open_telemetry_test.supabase.coordinator import ID_COL, DetectionCoordinator
+from open_telemetry_test.supabase.derived import (
+    DerivedMetric,
+    DerivedMetrics,
+    DerivedSample,
+    Expr,
+    Rate,
+    Sum,
+)
+from open_telemetry_test.supabase.exposition import parse_prometheus_metrics
+from open_telemetry_test.supabase.performance import DetectionPool, SeriesState
+from open_telemetry_test.supabase.store import MetricStore
+
+
+def scrape(minute: int, reset: bool = False) -> dict:
+    """Two cores, busy 25% and 75% of the time; two disks and a loopback."""
+    t = 60 * minute
+    io = 0 if reset else t
+    return parse_prometheus_metrics(f"""\
+node_cpu_seconds_total{{cpu="0",mode="idle"}} {0.70 * t}
+node_cpu_seconds_total{{cpu="0",mode="iowait"}} {0.05 * t}
+node_cpu_seconds_total{{cpu="0",mode="user"}} {0.25 * t}
+node_cpu_seconds_total{{cpu="1",mode="idle"}} {0.25 * t}
+node_cpu_seconds_total{{cpu="1",mode="system"}} {0.75 * t}
+node_memory_MemTotal_bytes 1000
+node_memory_MemAvailable_bytes 400
+node_disk_io_time_seconds_total{{device="sda"}} {0.5 * io}
+node_disk_io_time_seconds_total{{device="sdb"}} {0.1 * t}
+node_network_receive_bytes_total{{device="eth0"}} {1000 * t}
+node_network_receive_bytes_total{{device="lo"}} {5000 * t}
+pg_stat_database_num_backends{{datname="postgres"}} 7
+pg_stat_database_num_backends{{datname="app"}} 3
+""")
+
+
+def test_default_metrics_for_every_label_combination():
+    registry = DerivedMetrics()
+    assert "node_cpu_seconds_total" in registry.families
+
+    first = registry.evaluate("proj", 0, scrape(0))
+    # Rates need a previous scrape
+    assert {s.series for s in first} == {
+        "proj/MEM",
+        "proj/PG_CONNECTIONS{datname=app}",
+        "proj/PG_CONNECTIONS{datname=postgres}",
+    }
+
+    values = {s.series: s.value for s in registry.evaluate("proj", 60, scrape(1))}
+    assert values == pytest.approx(
+        {
+            "proj/CPU": 50.0,
+            "proj/CPU_CORE{cpu=0}": 25.0,
+            "proj/CPU_CORE{cpu=1}": 75.0,
+            "proj/MEM": 60.0,
+            "proj/DISK_BUSY{device=sda}": 50.0,
+            "proj/DISK_BUSY{device=sdb}": 10.0,
+            "proj/NET_RX{device=eth0}": 1000.0,
+            "proj/PG_CONNECTIONS{datname=app}": 3.0,
+            "proj/PG_CONNECTIONS{datname=postgres}": 7.0,
+        }
+    )
+    # A counter reset gives no rate for that series only
+    after_reset = {s.series for s in registry.evaluate("proj", 120, scrape(2, True))}
+    assert "proj/DISK_BUSY{device=sda}" not in after_reset
+    assert "proj/DISK_BUSY{device=sdb}" in after_reset
+    # Targets are independent
+    assert not any("CPU" in s.series for s in registry.evaluate("other", 0, scrape(5)))
+
+
+def test_registering_metrics():
+    registry = DerivedMetrics([])
+    busy = Rate("node_cpu_seconds_total", by=("cpu",), where={"mode": "system"})
+    registry.register(DerivedMetric("SYSTEM", busy * 100, unit="%"))
+    registry.register(
+        DerivedMetric(
+            "PG_SHARE", Sum("pg_stat_database_num_backends", where={"datname": "app"})
+        )
+    )
+    with pytest.raises(ValueError, match="SYSTEM"):
+        registry.register(DerivedMetric("SYSTEM", busy))
+    assert registry.families == (
+        "node_cpu_seconds_total",
+        "pg_stat_database_num_backends",
+    )
+
+    registry.evaluate("proj", 0, scrape(0))
+    system, share = registry.evaluate("proj", 60, scrape(1))
+    assert (system.series, system.ts, system.unit) == ("proj/SYSTEM{cpu=1}", 60, "%")
+    assert system.value == pytest.approx(75.0)
+    assert share == DerivedSample("proj/PG_SHARE", 60, 3.0, "")
+
+
+def test_incomplete_expressions_can_not_be_created():
+    class Constant(Expr):
+        def compute(self, scrape):
+            return 1.0
+
+    with pytest.raises(TypeError, match="families"):
+        Constant()  # type: ignore[abstract]
+
+
+def test_detection_pool_spreads_series_over_fixed_workers(tmp_path):
+    store = MetricStore(str(tmp_path))
+    threads = threading.active_count()
+    pool = DetectionPool(workers=3, store=store, nixtla_every=0)
+    assert threading.active_count() == threads + 3
+
+    series = [f"proj-{i}/CPU" for i in range(300)]
+    for minute in range(5):
+        for name in series:
+            pool.submit(DerivedSample(name, 60 * minute, float(minute), "%"))
+    pool.join()
+
+    assert len(store.series()) == 300
+    # Each series was handled in order (by a single worker)
+    assert list(store.read(series[0])["y"]) == [0.0, 1.0, 2.0, 3.0, 4.0]
+    sizes = [0] * 3
+    for name in series:
+        sizes[zlib.crc32(name.encode()) % 3] += 1
+    assert min(sizes) > 50
+
+
+class FailingStore(MetricStore):
+    def append(self, series, records):
+        if series.startswith("bad/"):
+            raise OSError("disk full")
+        super().append(series, records)
+
+
+def test_detection_errors_do_not_stop_the_pool(tmp_path, capsys):
+    store = FailingStore(str(tmp_path))
+    pool = DetectionPool(workers=1, store=store, nixtla_every=0)
+    for minute in range(3):
+        for name in ("bad/CPU", "good/CPU"):
+            pool.submit(DerivedSample(name, 60 * minute, 1.0, "%"))
+    pool.join()
+
+    assert store.series() == ["good/CPU"]
+    assert len(store.read("good/CPU")) == 3
+    assert capsys.readouterr().out.count("Detection error: OSError('disk full')") == 3
+
+
+class FakeAlerts:
+    def __init__(self):
+        self.alerts = []
+
+    def submit(self, alert):
+        self.alerts.append(alert)
+
+
+def test_timegpt_calls_of_the_pool_are_batched_without_blocking():
+    batches = []
+
+    def detect(df):
+        batches.append(df[ID_COL].nunique())
+        return {name: {"anomaly": name.endswith("7/CPU")} for name in df[ID_COL]}
+
+    # As in live monitoring: flushed every 5s or every 64 series
+    coordinator = DetectionCoordinator(detect, max_batch_size=64, flush_deadline=5)
+    alerts = FakeAlerts()
+    pool = DetectionPool(
+        workers=2,
+        alerts=alerts,  # type: ignore[arg-type]
+        state_factory=lambda: SeriesState(detector=None),
+        coordinator=coordinator,
+    )
+    started = time.monotonic()
+    for name in [f"proj-{i}/CPU" for i in range(300)]:
+        pool.submit(DerivedSample(name, 0, 1.0, "%"))
+    pool.join()
+
+    # A few full batches instead of one call per series (or per worker)
+    assert sum(batches) == 300
+    assert len(batches) <= 10
+    assert time.monotonic() - started < 2.5
+    assert sorted(alert.series for alert in alerts.alerts) == sorted(
+        f"proj-{i}/CPU" for i in range(300) if i % 10 == 7
+    )
+    coordinator.close()
+
+
+def test_samples_trickling_in_wait_for_the_batch_deadline():
+    batches = []
+
+    def detect(df):
+        batches.append(df[ID_COL].nunique())
+        return {}
+
+    coordinator = DetectionCoordinator(detect, max_batch_size=64, flush_deadline=0.5)
+    pool = DetectionPool(
+        workers=2,
+        state_factory=lambda: SeriesState(detector=None),
+        coordinator=coordinator,
+    )
+    # The pool is idle between the samples of a scrape
+    for i in range(10):
+        pool.submit(DerivedSample(f"proj-{i}/CPU", 0, 1.0, "%"))
+        time.sleep(0.01)
+    deadline = time.monotonic() + 5
+    while not batches and time.monotonic() < deadline:
+        time.sleep(0.01)
+    pool.join()
+
+    assert batches == [10]
+    coordinator.close()
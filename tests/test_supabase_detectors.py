@@ -0,0 +1,78 @@
+import random
+
+import numpy as np
+import pytest
+
+from open_telemetry_test.supabase.detectors import (
+    DETECTORS,
+    MAD_TO_STD,
+    Detector,
+    MADDetector,
+    RollingZScoreDetector,
+    make_detector,
+)
+
+
+@pytest.mark.parametrize("name", sorted(DETECTORS))
+def test_detector_flags_spike_only(name):
+    rng = random.Random(0)
+    detector = make_detector(name, threshold=4.0)
+    flags = [detector.update(50 + rng.gauss(0, 1)) for _ in range(100)]
+    assert not any(flags)
+    assert detector.update(80.0)
+
+
+def test_rolling_zscore_matches_window_statistics():
+    detector = RollingZScoreDetector(window=3, warmup=0)
+    for value in [1.0, 2.0, 3.0, 10.0]:
+        detector.update(value)
+    assert detector.expected() == pytest.approx(5.0)
+    assert detector.scale() == pytest.approx(4.358898943540674)
+
+
+def test_rolling_zscore_is_stable_on_large_offsets():
+    # A running sum of squares loses every digit of the variance at this offset
+    rng = np.random.default_rng(0)
+    values = 1e9 + rng.normal(0, 1, 5000)
+    detector = RollingZScoreDetector(window=60)
+    for value in values:
+        detector.update(value)
+    assert detector.expected() == pytest.approx(values[-60:].mean(), rel=1e-12)
+    assert detector.scale() == pytest.approx(values[-60:].std(ddof=1), rel=1e-6)
+
+
+@pytest.mark.parametrize("window", [1, 2, 7, 60])
+def test_mad_matches_window_statistics(window):
+    rng = np.random.default_rng(window)
+    # Ties included
+    values = np.round(rng.normal(0, 3, 300))
+    detector = MADDetector(window=window)
+    for i, value in enumerate(values):
+        detector.update(value)
+        current = values[max(0, i + 1 - window) : i + 1]
+        median = np.median(current)
+        assert detector.expected() == median
+        mad = np.median(np.abs(current - median))
+        assert detector.scale() == pytest.approx(MAD_TO_STD * mad)
+
+
+def test_warmup_suppresses_flags():
+    detector = make_detector("ewma", warmup=5)
+    assert not any(detector.update(v) for v in [0.0, 0.0, 1000.0])
+
+
+def test_incomplete_detectors_can_not_be_created():
+    class NoScale(Detector):
+        def expected(self):
+            return 0.0
+
+        def _observe(self, value):
+            pass
+
+    with pytest.raises(TypeError, match="scale"):
+        NoScale()  # type: ignore[abstract]
+
+
+def test_unknown_detector():
+    with pytest.raises(ValueError, match="Unknown detector"):
+        make_detector("prophet")
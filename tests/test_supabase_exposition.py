@@ -0,0 +1,51 @@
+from open_telemetry_test.supabase.exposition import (
+    family_name,
+    parse_prometheus_metrics,
+)
+
+PAYLOAD = """\
+# HELP node_cpu_seconds_total Seconds the CPUs spent in each mode.
+# TYPE node_cpu_seconds_total counter
+node_cpu_seconds_total{cpu="0",mode="idle"} 1000.5
+node_cpu_seconds_total{cpu="0",mode="user"} 200
+node_memory_MemTotal_bytes 8.0e+09
+http_request_duration_seconds_bucket{le="0.5"} 3 1700000000000
+pg_stat{query="select \\"a\\", b",db="x y"} 7
+broken_line{mode="idle" not-a-number
+"""
+
+
+def test_parse_labels_and_values():
+    metrics = parse_prometheus_metrics(PAYLOAD)
+    cpu = metrics["node_cpu_seconds_total"]
+    assert [s.labels["mode"] for s in cpu] == ["idle", "user"]
+    assert [s.value for s in cpu] == [1000.5, 200.0]
+    assert metrics["node_memory_MemTotal_bytes"][0] == ({}, 8.0e9)
+    # Trailing timestamp is not mistaken for the value
+    assert metrics["http_request_duration_seconds_bucket"][0].value == 3.0
+    assert metrics["pg_stat"][0].labels == {"query": 'select "a", b', "db": "x y"}
+    assert "broken_line" not in metrics
+
+
+def test_parse_streamed_lines_with_allowlist():
+    lines = (line.encode() for line in PAYLOAD.splitlines())
+    metrics = parse_prometheus_metrics(
+        lines, families=["node_cpu_seconds_total", "http_request_duration_seconds"]
+    )
+    assert set(metrics) == {
+        "node_cpu_seconds_total",
+        "http_request_duration_seconds_bucket",
+    }
+
+
+def test_text_with_allowlist_matches_streamed_lines():
+    families = ["node_cpu_seconds_total", "node_cpu", "http_request_duration_seconds"]
+    text = PAYLOAD.replace("\n", "\r\n")
+    expected = parse_prometheus_metrics(iter(PAYLOAD.splitlines()), families)
+    assert parse_prometheus_metrics(text, families) == expected
+    assert len(expected["node_cpu_seconds_total"]) == 2
+
+
+def test_family_name():
+    assert family_name("foo_bucket") == "foo"
+    assert family_name("node_cpu_seconds_total") == "node_cpu_seconds_total"
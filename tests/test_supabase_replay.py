@@ -0,0 +1,139 @@
+import time
+
+import numpy as np
+import pytest
+
+from open_telemetry_test.supabase.coordinator import DetectionCoordinator
+from open_telemetry_test.supabase.performance import ID_COL
+from open_telemetry_test.supabase.recorder import (
+    Recorder,
+    read_recordings,
+    segments,
+)
+from open_telemetry_test.supabase.replay import STAGES, replay
+from open_telemetry_test.supabase.store import MetricStore
+
+START = 1_735_689_600  # 2025-01-01, a segment boundary
+MINUTES = 180
+SPIKE = 150
+
+
+def payload(idle: float, user: float, available: float) -> str:
+    return f"""\
+# TYPE node_cpu_seconds_total counter
+node_cpu_seconds_total{{cpu="0",mode="idle"}} {idle}
+node_cpu_seconds_total{{cpu="0",mode="user"}} {user}
+node_memory_MemTotal_bytes 1000
+node_memory_MemAvailable_bytes {available}
+go_goroutines 12
+"""
+
+
+@pytest.fixture
+def recordings(tmp_path):
+    """Three hours of scrapes of two projects; project a spikes at minute 150."""
+    rng = np.random.default_rng(0)
+    recorder = Recorder(str(tmp_path), segment_secs=3600)
+    counters = {"a": [0.0, 0.0], "b": [0.0, 0.0]}
+    for minute in range(MINUTES):
+        for target, (idle, user) in counters.items():
+            busy = 59 if target == "a" and minute == SPIKE else rng.uniform(5, 7)
+            idle, user = idle + 60 - busy, user + busy
+            counters[target] = [idle, user]
+            ts = START + 60 * minute + rng.uniform(0, 5)
+            recorder.record(target, ts, payload(idle, user, rng.uniform(490, 510)))
+    recorder.close()
+    return tmp_path
+
+
+def test_recordings_are_compact_time_stamped_segments(recordings):
+    paths = segments(str(recordings))
+    assert len(paths) == 3
+    raw = len(payload(1e6, 1e6, 500)) * 2 * MINUTES
+    assert sum(p.stat().st_size for p in recordings.iterdir()) < raw / 2
+
+    # Only the segments covering the range are read
+    assert segments(str(recordings), START + 3700, START + 7200) == paths[1:2]
+    second_hour = list(read_recordings(str(recordings), START + 3600, START + 7200))
+    assert len(second_hour) == 2 * 60
+    assert all(START + 3600 <= r.ts < START + 7200 for r in second_hour)
+
+    # Segments are readable while they are written, a crash loses the last scrape
+    recorder = Recorder(str(recordings), segment_secs=3600)
+    end = START + 3600 * 3
+    for i in range(3):
+        recorder.record("a", end + i, payload(i, i, 500))
+    assert [r.ts for r in read_recordings(str(recordings), end)] == [
+        end,
+        end + 1,
+        end + 2,
+    ]
+    [path] = segments(str(recordings), end)
+    with open(path, "r+b") as f:
+        f.truncate(f.seek(0, 2) - 10)
+    assert len(list(read_recordings(str(recordings), end))) == 2
+
+
+def test_late_scrapes_go_to_the_open_file_of_their_segment(tmp_path):
+    recorder = Recorder(str(tmp_path), segment_secs=3600)
+    boundary = START + 3600
+    # Concurrent scrapes around the boundary, written out of order
+    for i in range(10):
+        recorder.record("a", boundary - 5 + i, payload(i, i, 500))
+        recorder.record("b", boundary - 10 + i, payload(i, i, 500))
+    recorder.close()
+
+    assert len(segments(str(tmp_path))) == 2
+    assert sorted(r.ts for r in read_recordings(str(tmp_path))) == sorted(
+        [boundary - 5 + i for i in range(10)] + [boundary - 10 + i for i in range(10)]
+    )
+
+
+def test_replay_runs_the_detection_pipeline(recordings, tmp_path):
+    store = MetricStore(str(tmp_path / "store"))
+    stats = replay(str(recordings), engine="zscore", store=store)
+
+    assert stats.events == 2 * MINUTES
+    # No CPU usage (overall and of the single core) before the second scrape
+    assert stats.samples == 2 * (2 * (MINUTES - 1) + MINUTES)
+    assert [(a.series, int(a.ts - START) // 60) for a in stats.anomalies] == [
+        ("a/CPU", SPIKE),
+        ("a/CPU_CORE{cpu=0}", SPIKE),
+    ]
+    assert stats.anomalies[0].value == pytest.approx(59 / 60 * 100)
+    assert set(stats.timings) == set(STAGES)
+    assert 0 < sum(stats.timings.values()) <= stats.elapsed
+    assert stats.events_per_sec > 0
+    assert "scrapes/s" in stats.report()
+
+    # Backfilled, one point per minute
+    assert [s for s in store.series() if s.startswith("a/")] == [
+        "a/CPU",
+        "a/CPU_CORE{cpu=0}",
+        "a/MEM",
+    ]
+    assert len(store.read("a/MEM")) == MINUTES
+
+
+def test_timegpt_calls_are_batched_per_scrape(recordings):
+    batches = []
+
+    def detect_fn(frame):
+        batches.append(frame[ID_COL].nunique())
+        latest = frame.groupby(ID_COL).tail(1)
+        return {row[ID_COL]: {"anomaly": row["y"] > 90} for _, row in latest.iterrows()}
+
+    coordinator = DetectionCoordinator(detect_fn, flush_deadline=5)
+    started = time.perf_counter()
+    stats = replay(
+        read_recordings(str(recordings), START, START + 3 * 60),
+        engine="nixtla",
+        coordinator=coordinator,
+    )
+    coordinator.close()
+
+    # One call per scrape (MEM, then CPU and the core from the second scrape of a
+    # target), without waiting for the flush deadline
+    assert stats.events == 6
+    assert batches == [1, 1, 3, 3, 3, 3]
+    assert time.perf_counter() - started < 2.5
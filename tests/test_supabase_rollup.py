@@ -0,0 +1,83 @@
+import numpy as np
+
+from open_telemetry_test.supabase.rollup import (
+    DEFAULT_TIERS,
+    ROLLUP_DTYPE,
+    RollupEngine,
+    Tier,
+    _Ring,
+    mean,
+    select_tier,
+)
+
+HOUR = 3600
+
+
+def test_buckets_aggregate_every_tier():
+    engine = RollupEngine(root=None)
+    for minute in range(12):
+        engine.update("s", minute * 60 + 5, float(minute))
+
+    tier, records = engine.query("s", 0, 12 * 60, max_points=100)
+    assert tier.name == "1m"
+    np.testing.assert_array_equal(records["ts"], np.arange(12) * 60)
+
+    tier, records = engine.query("s", 0, 12 * 60, max_points=5)
+    assert tier.name == "5m"
+    np.testing.assert_array_equal(records["ts"], [0, 300, 600])
+    np.testing.assert_array_equal(records["min"], [0, 5, 10])
+    np.testing.assert_array_equal(records["max"], [4, 9, 11])
+    np.testing.assert_array_equal(records["count"], [5, 5, 2])
+    np.testing.assert_array_equal(records["last"], [4, 9, 11])
+    np.testing.assert_allclose(mean(records), [2.0, 7.0, 10.5])
+
+
+def test_rings_are_sized_to_their_data():
+    engine = RollupEngine(root=None)
+    for minute in range(60):
+        engine.update("s", minute * 60, float(minute))
+    # An hour of data, not the retention of every tier
+    assert sum(ring._records.nbytes for ring in engine._rings.values()) < 10_000
+
+    ring = _Ring(100)
+    expected: list[int] = []
+    for ts in range(250):
+        ring.push(np.array((ts, 0, 0, 0, 1, 0), dtype=ROLLUP_DTYPE))
+        expected = [*expected, ts][-100:]
+        if ts % 7 == 0:
+            assert ring.pop()["ts"] == expected.pop()
+        np.testing.assert_array_equal(ring.records["ts"], expected)
+    assert len(ring._records) == 100
+
+
+def test_select_tier_by_points_and_retention():
+    now = 400 * 24 * HOUR
+    assert select_tier(DEFAULT_TIERS, now - HOUR, now, 1000, now).name == "1m"
+    assert select_tier(DEFAULT_TIERS, now - 24 * HOUR, now, 1000, now).name == "5m"
+    # Short range, but older than the retention of the finer tiers
+    start = now - 30 * 24 * HOUR
+    assert select_tier(DEFAULT_TIERS, start, start + HOUR, 1000, now).name == "1h"
+
+
+def test_persisted_rollups_resume_and_trim(tmp_path):
+    tiers = (Tier("1m", 60, 10 * 60),)
+    engine = RollupEngine(root=str(tmp_path), tiers=tiers)
+    for minute in range(5):
+        engine.update("s", minute * 60, 1.0)
+    engine.update("s", 4 * 60 + 30, 3.0)
+    engine.flush()
+
+    # A new process re-opens the last persisted bucket instead of duplicating it
+    engine = RollupEngine(root=str(tmp_path), tiers=tiers)
+    engine.update("s", 4 * 60 + 45, 5.0)
+    engine.update("s", 5 * 60, 1.0)
+    _, records = engine.query("s", 0, 6 * 60)
+    assert records["count"].tolist() == [1, 1, 1, 1, 3, 1]
+    persisted = engine.stores["1m"].read("s")
+    assert persisted["count"].tolist() == [1, 1, 1, 1, 3]
+
+    for minute in range(6, 30):
+        engine.update("s", minute * 60, 1.0)
+    persisted = engine.stores["1m"].read("s")
+    assert persisted["ts"][0] >= 29 * 60 - 11 * 60
+    assert len(engine.query("s", 0, 30 * 60)[1]) <= 11
@@ -0,0 +1,130 @@
+import asyncio
+import base64
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from open_telemetry_test.supabase.scraper import AsyncScraper, Target, load_targets
+
+PAYLOAD = b"""\
+# TYPE node_cpu_seconds_total counter
+node_cpu_seconds_total{cpu="0",mode="idle"} 100
+node_cpu_seconds_total{cpu="0",mode="user"} 50
+node_memory_MemTotal_bytes 1000
+go_goroutines 12
+"""
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+
+    def do_GET(self):
+        self.server.requests.append(  # type: ignore[attr-defined]
+            (self.path, self.headers["Authorization"])
+        )
+        if self.path == "/slow":
+            time.sleep(1)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(PAYLOAD)))
+        self.end_headers()
+        self.wfile.write(PAYLOAD)
+
+    def log_message(self, *args):
+        pass
+
+
+class StandInServer(ThreadingHTTPServer):
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), StandInHandler)
+        self.requests: list = []
+
+    def handle_error(self, request, client_address):
+        # The client gives up on /slow before it is answered
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = StandInServer()
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_scrapes_all_targets_with_auth_and_allowlist(server):
+    base = f"http://127.0.0.1:{server.server_port}"
+    targets = [
+        Target("a", f"{base}/a", password="jwt-a"),
+        Target("b", f"{base}/b", password="jwt-b"),
+        Target("slow", f"{base}/slow", password="jwt-c"),
+    ]
+    received = []
+    scraper = AsyncScraper(
+        targets,
+        lambda target, ts, metrics: received.append((target.name, metrics)),
+        interval=0.05,
+        timeout=0.5,
+        jitter=0,
+        families=["node_cpu_seconds_total"],
+    )
+    asyncio.run(scraper.run(rounds=2))
+
+    assert sorted(name for name, _ in received) == ["a", "a", "b", "b"]
+    assert all(set(metrics) == {"node_cpu_seconds_total"} for _, metrics in received)
+    token = base64.b64encode(b"service_role:jwt-a").decode()
+    assert ("/a", f"Basic {token}") in server.requests
+
+
+def test_raw_payloads_are_passed_on(server):
+    base = f"http://127.0.0.1:{server.server_port}"
+    payloads = []
+    scraper = AsyncScraper(
+        [Target("a", f"{base}/a")],
+        lambda target, ts, metrics: None,
+        jitter=0,
+        families=["node_cpu_seconds_total"],
+        on_payload=lambda name, ts, text: payloads.append((name, text)),
+    )
+    asyncio.run(scraper.run(rounds=1))
+
+    # Unfiltered
+    assert payloads == [("a", PAYLOAD.decode())]
+
+
+def test_failing_callbacks_do_not_stop_the_other_targets(server):
+    base = f"http://127.0.0.1:{server.server_port}"
+    received = []
+
+    def on_metrics(target, ts, metrics):
+        if target.name == "bad":
+            raise OSError("disk full")
+        received.append(target.name)
+
+    scraper = AsyncScraper(
+        [Target("bad", f"{base}/bad"), Target("a", f"{base}/a")],
+        on_metrics,
+        interval=0.05,
+        jitter=0,
+    )
+    asyncio.run(scraper.run(rounds=3))
+
+    assert received == ["a", "a", "a"]
+    assert sum(path == "/bad" for path, _ in server.requests) == 3
+
+
+def test_load_targets():
+    targets = load_targets("proj1, proj2:other-jwt", default_jwt="shared")
+    assert [(t.name, t.password) for t in targets] == [
+        ("proj1", "shared"),
+        ("proj2", "other-jwt"),
+    ]
+    assert targets[0].url.startswith("https://proj1.supabase.co/")
+    with pytest.raises(ValueError):
+        load_targets("", default_jwt="shared")
+    with pytest.raises(ValueError, match="proj1"):
+        load_targets("proj1", default_jwt="")
@@ -0,0 +1,99 @@
+import numpy as np
+import pandas as pd
+
+from open_telemetry_test.supabase import store as store_module
+from open_telemetry_test.supabase.performance import persist_window
+from open_telemetry_test.supabase.store import RECORD_DTYPE, MetricStore
+from open_telemetry_test.supabase.window import TimeSeriesWindow
+
+
+def _records(ts, y):
+    records = np.empty(len(ts), dtype=RECORD_DTYPE)
+    records["ts"], records["y"] = ts, y
+    return records
+
+
+def test_append_and_read_range(tmp_path):
+    store = MetricStore(str(tmp_path))
+    store.append("proj/CPU", _records([0, 60, 120], [1.0, 2.0, 3.0]))
+    store.append("proj/CPU", _records([180], [4.0]))
+
+    assert store.series() == ["proj/CPU"]
+    records = store.read("proj/CPU", start=60, end=180)
+    np.testing.assert_array_equal(records["ts"], [60, 120])
+    np.testing.assert_array_equal(records["y"], [2.0, 3.0])
+    # Zero-copy view on the mapped file
+    assert isinstance(records, np.memmap)
+
+
+def test_updated_points_keep_last_record(tmp_path):
+    store = MetricStore(str(tmp_path))
+    store.append("s", _records([0, 60, 60, 120, 120], [1.0, 2.0, 2.5, 3.0, 3.5]))
+    records = store.read("s")
+    np.testing.assert_array_equal(records["ts"], [0, 60, 120])
+    np.testing.assert_array_equal(records["y"], [1.0, 2.5, 3.5])
+
+
+def test_partial_record_and_version(tmp_path):
+    store = MetricStore(str(tmp_path))
+    assert store.read("missing").size == 0
+    store.append("s", _records([0], [1.0]))
+    version = store.version()
+    # A record the writer has not finished yet is not visible to readers
+    with open(store.path("s"), "ab") as f:
+        f.write(b"\x00" * 5)
+    assert len(store.read("s")) == 1
+    assert store.version("s") > version
+    store.clear()
+    assert store.series() == []
+
+
+def test_persisted_window_matches_after_late_samples(tmp_path):
+    store = MetricStore(str(tmp_path))
+    window = TimeSeriesWindow(capacity=5)
+    # Late samples merge into stored bins and re-interpolate their neighbours;
+    # the last one is older than the window
+    for ts, value in [(0, 0.0), (240, 4.0), (70, 7.0), (130, 1.0), (300, 5.0), (10, 9)]:
+        persist_window(store, "s", window, window.append(ts, value))
+
+    records = store.read("s", start=int(window.timestamps[0]))
+    stored = pd.DataFrame(
+        {"ds": pd.to_datetime(records["ts"], unit="s"), "y": records["y"]}
+    )
+    pd.testing.assert_frame_equal(stored, window.to_frame())
+    # Ranges of an updated series are still read in order
+    np.testing.assert_array_equal(store.read("s", 60, 180)["ts"], [60, 120])
+
+
+def test_late_records_are_merged_on_read_and_compacted(tmp_path, monkeypatch):
+    monkeypatch.setattr(store_module, "LATE_COMPACT_RECORDS", 3)
+    store = MetricStore(str(tmp_path))
+    store.append("s", _records([0, 60, 120, 180], [0.0, 1.0, 2.0, 3.0]))
+    version = store.version("s")
+    # Updates of past points (and a new one) in one append
+    store.append("s", _records([60, 120, 240], [1.5, 2.5, 4.0]))
+    assert store.version("s") > version
+
+    np.testing.assert_array_equal(store.read("s")["y"], [0.0, 1.5, 2.5, 3.0, 4.0])
+    np.testing.assert_array_equal(store.read("s", 60, 120)["y"], [1.5])
+    # The file stays sorted: ranges without late records are still views on it
+    on_disk = np.fromfile(store.path("s"), dtype=RECORD_DTYPE)
+    np.testing.assert_array_equal(on_disk["ts"], [0, 60, 120, 180, 240])
+    assert isinstance(store.read("s", 180), np.memmap)
+
+    # The third late record compacts them into the file
+    store.append("s", _records([0], [0.5]))
+    np.testing.assert_array_equal(
+        np.fromfile(store.path("s"), dtype=RECORD_DTYPE)["y"],
+        [0.5, 1.5, 2.5, 3.0, 4.0],
+    )
+    assert isinstance(store.read("s"), np.memmap)
+
+    # Retention merges the late records too
+    store.append("s", _records([180], [3.5]))
+    store.truncate_before("s", 120)
+    records = store.read("s")
+    assert isinstance(records, np.memmap)
+    np.testing.assert_array_equal(records["y"], [2.5, 3.5, 4.0])
+    store.clear()
+    assert list(tmp_path.iterdir()) == []
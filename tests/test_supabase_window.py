@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+
+from open_telemetry_test.supabase.window import TimeSeriesWindow
+
+
+def test_window_matches_pandas_resample_interpolate():
+    # Drifting scrape times, a two minute gap and two samples in the same minute
+    times = [0, 61, 125, 310, 330, 362, 425]
+    values = [1.0, 2.0, 3.0, 9.0, 11.0, 4.0, 5.0]
+    window = TimeSeriesWindow(capacity=20)
+    for ts, value in zip(times, values, strict=True):
+        window.append(ts, value)
+
+    expected = (
+        pd.DataFrame({"ds": pd.to_datetime(times, unit="s"), "y": values})
+        .set_index("ds")
+        .resample("1min")
+        .mean()
+        .interpolate()
+        .reset_index()
+    )
+    pd.testing.assert_frame_equal(window.to_frame(), expected, check_dtype=False)
+
+
+def test_window_evicts_oldest_and_returns_views():
+    window = TimeSeriesWindow(capacity=3)
+    for minute in range(5):
+        window.append(minute * 60, float(minute))
+    np.testing.assert_array_equal(window.timestamps, [120, 180, 240])
+    np.testing.assert_array_equal(window.values, [2.0, 3.0, 4.0])
+    assert np.shares_memory(window.values, window._values)
+
+
+def test_late_sample_fills_interpolated_bin():
+    window = TimeSeriesWindow(capacity=10)
+    # Position of the first bin changed
+    assert window.append(0, 0.0) == 0
+    assert window.append(180, 3.0) == 1
+    # Late sample for minute 1 replaces the interpolated value and re-interpolates
+    # the bin after it
+    assert window.append(70, 7.0) == 1
+    np.testing.assert_array_equal(window.values, [0.0, 7.0, 5.0, 3.0])
+    np.testing.assert_array_equal(window.counts, [1, 1, 0, 1])
+    # Older than the window: dropped
+    window = TimeSeriesWindow(capacity=2)
+    window.append(600, 1.0)
+    window.append(660, 2.0)
+    assert window.append(0, 5.0) == 2
+    np.testing.assert_array_equal(window.values, [1.0, 2.0])
+
+
+def test_gap_longer_than_capacity():
+    window = TimeSeriesWindow(capacity=3)
+    window.append(0, 0.0)
+    window.append(600, 10.0)
+    np.testing.assert_array_equal(window.timestamps, [480, 540, 600])
+    np.testing.assert_allclose(window.values, [8.0, 9.0, 10.0])
@@ -0,0 +1,130 @@
+import threading
+
+import pytest
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SpanExporter, SpanExportResult
+
+from open_telemetry_test import telemetry
+from open_telemetry_test.telemetry import (
+    BoundedSpanProcessor,
+    TelemetryConfig,
+    build_telemetry,
+)
+
+
+class BlockingExporter(SpanExporter):
+    """Collector that falls behind until `release` is set."""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.spans: list = []
+
+    def export(self, spans):
+        self.release.wait()
+        self.spans.extend(spans)
+        return SpanExportResult.SUCCESS
+
+    def shutdown(self):
+        pass
+
+
+def test_config_from_env_overrides_defaults():
+    env = {
+        "OTEL_EXPORTER_OTLP_PROTOCOL": "http/protobuf",
+        "OTEL_EXPORTER_OTLP_COMPRESSION": "GZIP",
+        "OTEL_BSP_MAX_QUEUE_SIZE": "4096",
+        "OTEL_EXPORTER_OTLP_METRICS_TEMPORALITY_PREFERENCE": "delta",
+        "OTEL_EXPORTER_OTLP_INSECURE": "false",
+    }
+    config = TelemetryConfig.from_env(env, export_interval_ms=5000, max_queue_size=1024)
+    assert config.protocol == "http/protobuf"
+    assert config.compression == "gzip"
+    assert config.max_queue_size == 4096
+    assert config.temporality == "delta"
+    assert config.insecure is False
+    assert config.export_interval_ms == 5000
+
+    with pytest.raises(ValueError):
+        TelemetryConfig.from_env({"OTEL_EXPORTER_OTLP_PROTOCOL": "thrift"})
+
+
+def test_processor_drops_and_counts_when_the_queue_is_full():
+    exporter = BlockingExporter()
+    processor = BoundedSpanProcessor(
+        exporter, max_queue_size=10, max_export_batch_size=5, schedule_delay_ms=10
+    )
+    provider = TracerProvider()
+    provider.add_span_processor(processor)
+    tracer = provider.get_tracer("test")
+
+    # The first batch is stuck in the exporter, then the queue fills up
+    for _ in range(5):
+        tracer.start_span("span").end()
+    while processor.queue_depth:
+        pass
+    for _ in range(20):
+        tracer.start_span("span").end()
+    assert processor.queue_depth == 10
+    assert processor.dropped == 10
+
+    exporter.release.set()
+    assert processor.force_flush()
+    assert processor.queue_depth == 0
+    assert processor.exported == len(exporter.spans) == 15
+    provider.shutdown()
+
+
+def test_processor_shutdown_exports_the_queued_spans():
+    exporter = BlockingExporter()
+    exporter.release.set()
+    processor = BoundedSpanProcessor(exporter, schedule_delay_ms=60000)
+    provider = TracerProvider()
+    provider.add_span_processor(processor)
+    tracer = provider.get_tracer("test")
+
+    for _ in range(3):
+        tracer.start_span("span").end()
+    assert processor.queue_depth == 3
+    provider.shutdown()
+    assert processor.exported == len(exporter.spans) == 3
+    assert processor.queue_depth == 0
+    # Spans ending after the shutdown are ignored, and shutting down again is a no-op
+    tracer.start_span("late").end()
+    processor.shutdown()
+    assert len(exporter.spans) == 3
+    assert processor.queue_depth == 0
+
+
+def test_setup_keeps_providers_configured_elsewhere(monkeypatch):
+    monkeypatch.setattr(telemetry, "_telemetry", None)
+    monkeypatch.setattr(
+        telemetry.trace, "get_tracer_provider", lambda: TracerProvider()
+    )
+    set_tracer_provider: list = []
+    monkeypatch.setattr(
+        telemetry.trace, "set_tracer_provider", set_tracer_provider.append
+    )
+    monkeypatch.setattr(telemetry.metrics, "set_meter_provider", lambda p: None)
+
+    config = TelemetryConfig(traces_exporter="console", metrics_exporter="console")
+    result = telemetry.setup_telemetry(config)
+    assert result.tracer_provider is None
+    assert result.meter_provider is not None
+    assert not set_tracer_provider
+    # Once per process
+    assert telemetry.setup_telemetry(config) is result
+    result.shutdown()
+
+
+def test_build_otlp_pipelines():
+    for protocol in ("grpc", "http/protobuf"):
+        built = build_telemetry(
+            TelemetryConfig(protocol=protocol, compression="gzip", temporality="delta")
+        )
+        assert built.span_processor is not None
+        assert built.meter_provider is not None
+        built.shutdown()
+
+    disabled = build_telemetry(TelemetryConfig(sdk_disabled=True))
+    assert disabled.tracer_provider is None
+    assert disabled.meter_provider is None
@@ -0,0 +1,143 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from open_telemetry_test import timegpt
+
+
+class FakeTimeGPTHandler(BaseHTTPRequestHandler):
+    """Online anomaly detection flagging values above 3."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        server = self.server
+        server.requests.append((self.path, self.client_address[1]))  # type: ignore[attr-defined]
+        if server.failures:  # type: ignore[attr-defined]
+            server.failures -= 1  # type: ignore[attr-defined]
+            self._reply(503, {"detail": "overloaded"})
+            return
+        payload = json.loads(body)
+        sizes, detection_size = payload["series"]["sizes"], payload["detection_size"]
+        ends = np.cumsum(sizes)
+        idxs = [int(i) for end in ends for i in range(end - detection_size, end)]
+        values = [payload["series"]["y"][i] for i in idxs]
+        self._reply(
+            200,
+            {
+                "idxs": idxs,
+                "sizes": [detection_size] * len(sizes),
+                "mean": values,
+                "anomaly": [value > 3 for value in values],
+                "anomaly_score": [0.0] * len(idxs),
+            },
+        )
+
+    def _reply(self, status, body):
+        content = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args):
+        pass
+
+
+class FakeTimeGPT(ThreadingHTTPServer):
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), FakeTimeGPTHandler)
+        self.requests: list[tuple[str, int]] = []
+        self.failures = 0
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+
+@pytest.fixture
+def fake_timegpt():
+    server = FakeTimeGPT()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def make_client(server, **kwargs):
+    return timegpt.TimeGPTClient(
+        api_key="test",
+        base_url=f"http://127.0.0.1:{server.server_port}",
+        **{"rate_limit": 0, **kwargs},
+    )
+
+
+def window(last=5.0):
+    y = np.ones(60)
+    y[29], y[59] = last, 1.0
+    return pd.DataFrame(
+        {
+            "unique_id": np.repeat(["a", "b"], 30),
+            "ds": np.tile(pd.date_range("2025-01-01", periods=30, freq="min"), 2),
+            "y": y,
+        }
+    )
+
+
+DETECT = dict(freq="min", h=1, level=99, detection_size=2)
+
+
+@pytest.mark.filterwarnings("ignore::FutureWarning")
+def test_repeated_windows_are_answered_without_a_request(fake_timegpt, monkeypatch):
+    recorded = []
+    monkeypatch.setattr(
+        timegpt.call_duration,
+        "record",
+        lambda value, attributes: recorded.append(attributes["outcome"]),
+    )
+    client = make_client(fake_timegpt)
+
+    first = client.detect_anomalies_online(window(), **DETECT)
+    assert first.loc[first["anomaly"], "unique_id"].tolist() == ["a"]
+    again = client.detect_anomalies_online(window(), **DETECT)
+    pd.testing.assert_frame_equal(first, again)
+    client.detect_anomalies_online(window(last=1.0), **DETECT)
+    client.detect_anomalies_online(window(), **{**DETECT, "level": 95})
+
+    assert len(fake_timegpt.requests) == 3
+    # Over one kept-alive connection
+    assert len({port for _, port in fake_timegpt.requests}) == 1
+    assert (client.calls, client.deduplicated) == (4, 1)
+    assert recorded == ["ok", "deduplicated", "ok", "ok"]
+    assert client.bytes_sent > 0
+    client.close()
+
+
+@pytest.mark.filterwarnings("ignore::FutureWarning")
+def test_transient_failures_are_retried_with_backoff(fake_timegpt):
+    fake_timegpt.failures = 2
+    client = make_client(fake_timegpt, retry_backoff_secs=0.05)
+
+    started = time.perf_counter()
+    result = client.detect_anomalies_online(window(), **DETECT)
+    assert time.perf_counter() - started >= 0.15
+    assert len(result) == 4
+    assert client.retries == 2
+
+    fake_timegpt.failures = 5
+    with pytest.raises(Exception, match="503"):
+        client.detect_anomalies_online(window(last=1.0), **DETECT)
+    assert client.retries == 2 + client.max_attempts - 1
+    client.close()
+
+
+def test_rate_limiter_spaces_out_requests_beyond_the_burst():
+    limiter = timegpt.RateLimiter(rate=20, burst=2)
+    started = time.perf_counter()
+    for _ in range(6):
+        limiter.acquire()
+    # 2 at once, then one every 50ms
+    assert 0.19 <= time.perf_counter() - started < 0.4